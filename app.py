@@ -6,6 +6,8 @@ Created on Sun Aug  5 07:34:45 2018
 @author: ilia
 """
 from ib_insync.ib import IB
+from optopus import setup_logging
+from optopus.ib_replay import RecordingIB, ReplayIB
 from optopus.ib_adapter import IBBrokerAdapter
 from optopus.optopus import Optopus
 from optopus.utils import to_df, notify
@@ -17,7 +19,10 @@ port = 7497  # TWS PAPER TRADING
 #port = 7496 # TWS LIVE TRADING
 client = 11
 
+setup_logging()
 ib = IB()
+# Record the session to replay it offline with ReplayIB('data/session.rec.gz', speed=None)
+#ib = RecordingIB(IB(), 'data/session.rec.gz')
 opt = Optopus(IBBrokerAdapter(ib, host, port, client))
 
 #notify('strategy_opened', 'FXI', 'cara', 'cola')
@@ -1,32 +1,14 @@
-import logging
-import sys
-from logging.handlers import TimedRotatingFileHandler
-from pathlib import Path
+"""Automated options trading system on Interactive Brokers.
 
-from optopus.settings import DATA_DIR
+Importing the package has no side effects and loads no heavy dependency,
+the applications configure the logging with setup_logging.
+"""
+from optopus.version import __version__
 
-LOG_FILE = 'optopus.log'
-file_name = Path.cwd() / DATA_DIR / LOG_FILE
-# Create the Logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-# Create the Handler for logging data to a file
-file_handler = TimedRotatingFileHandler(file_name, when='W4')
-file_handler.setLevel(logging.DEBUG)
-
-# Create the handler for logging data to console
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-
-# Create a Formatter for formatting the log messages
-file_formatter = logging.Formatter("%(asctime)s — %(name)s — %(levelname)s — %(message)s")
-console_formatter = logging.Formatter("%(asctime)s — %(name)s — %(levelname)s — %(message)s")
-# Add the Formatter to the Handlers
-file_handler.setFormatter(file_formatter)
-console_handler.setFormatter(console_formatter)
-
-# Add the Handlers to the Logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
-logger.info('Completed configuring the logger')
+def __getattr__(name):
+    # Loaded on first use, logging isn't needed by the data classes
+    if name == 'setup_logging':
+        from optopus.log import setup_logging
+        return setup_logging
+    raise AttributeError(f"module 'optopus' has no attribute '{name}'")
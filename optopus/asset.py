@@ -2,7 +2,7 @@ import datetime
 from dataclasses import dataclass
 from typing import Any, Tuple
 
-from optopus.common import AssetType, Currency
+from optopus.common import AssetType, Currency, cached_hash, uncached_state
 
 
 @dataclass(frozen=True)
@@ -12,6 +12,12 @@ class AssetId:
     currency: Currency
     contract: Any
 
+    def __hash__(self):
+        return cached_hash(self)
+
+    def __getstate__(self):
+        return uncached_state(self)
+
 
 @dataclass(frozen=True)
 class Current:
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Vectorized backtest of short put vertical spreads.
+
+Replays daily panels (dates in rows, assets in columns) of prices and
+implied volatilities, applies Taco's entry filters to the whole universe at
+once, prices the legs with Black-Scholes from the historical IV and resolves
+every trade (take profit at profit_factor of the credit, or settlement at
+expiration) with array operations.
+"""
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from optopus.bar_store import BarStore, PRICE_SERIES, IV_SERIES
+from optopus.computation import panel_percentile, put_price
+from optopus.settings import HISTORICAL_YEARS
+
+TAKE_PROFIT = 'take_profit'
+EXPIRATION = 'expiration'
+OPEN = 'open'
+
+
+class CreditSpreadParameters(NamedTuple):
+    minimum_iv: float = 0.2
+    minimum_iv_percentile: float = 0.8
+    minimum_underlying_decline: float = -0.1
+    minimum_underlying_volume: float = 1000
+    maximum_spread_risk: int = 5
+    minimum_reward: float = 0.5
+    minimum_ROI: float = 0.30
+    profit_factor: float = 0.5
+    DTE: int = 45
+    strike_step: float = 1.0
+    multiplier: int = 100
+
+
+class Panels(NamedTuple):
+    dates: np.ndarray
+    codes: List[str]
+    close: np.ndarray
+    volume: np.ndarray
+    iv: np.ndarray
+    iv_low: np.ndarray
+    # Precomputed IV percentile panel, it doesn't depend on the parameters
+    iv_percentile: np.ndarray = None
+
+
+class BacktestResult(NamedTuple):
+    trades: pd.DataFrame
+    pnl: pd.Series
+
+
+def load_panels(store: BarStore, codes: List[str]) -> Panels:
+    """Aligns the stored price and IV bars of the assets on a common date index
+    """
+    frames = [store.panel(codes, PRICE_SERIES, 'close'),
+              store.panel(codes, PRICE_SERIES, 'volume'),
+              store.panel(codes, IV_SERIES, 'close'),
+              store.panel(codes, IV_SERIES, 'low')]
+    index = frames[0].index
+    for f in frames[1:]:
+        index = index.union(f.index)
+    close, volume, iv, iv_low = (f.reindex(index=index, columns=codes).ffill().values for f in frames)
+    return Panels(index.values.astype('datetime64[D]'), list(codes), close, volume, iv, iv_low)
+
+
+def entry_signals(panels: Panels, params: CreditSpreadParameters) -> np.ndarray:
+    """Boolean panel of the dates and assets passing Taco's filters
+    """
+    iv_percentile = panels.iv_percentile
+    if iv_percentile is None:
+        iv_percentile = panel_percentile(panels.iv_low, panels.iv, HISTORICAL_YEARS * 252)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_pct = np.vstack([np.full((1, panels.close.shape[1]), np.nan),
+                               panels.close[1:] / panels.close[:-1] - 1])
+        return ((iv_percentile > params.minimum_iv_percentile)
+                & (panels.iv > params.minimum_iv)
+                & (price_pct < params.minimum_underlying_decline)
+                & (panels.volume > params.minimum_underlying_volume))
+
+
+def backtest_credit_spreads(panels: Panels,
+                            params: CreditSpreadParameters = CreditSpreadParameters()) -> BacktestResult:
+    signals = entry_signals(panels, params)
+    # The last date has no path to evaluate
+    signals[-1] = False
+    rows, cols = np.nonzero(signals)
+    n_dates = len(panels.dates)
+
+    # Strikes: nearest ATM short put and the long put maximizing ROI
+    underlying = panels.close[rows, cols]
+    iv = panels.iv[rows, cols]
+    t0 = params.DTE / 365
+    sell_strike = np.floor(underlying / params.strike_step) * params.strike_step
+    widths = params.strike_step * np.arange(1, params.maximum_spread_risk / params.strike_step + 1)
+    buy_strikes = sell_strike[:, np.newaxis] - widths
+    sell_price = put_price(underlying, sell_strike, t0, iv)
+    buy_prices = put_price(underlying[:, np.newaxis], buy_strikes, t0, iv[:, np.newaxis])
+    reward = sell_price[:, np.newaxis] - buy_prices
+    ROI = reward / widths
+    valid = (reward > params.minimum_reward) & (ROI > params.minimum_ROI) & (buy_strikes > 0)
+    ROI = np.where(valid, ROI, -np.inf)
+    best = np.argmax(ROI, axis=1)
+    keep = valid.any(axis=1)
+    rows, cols, sell_strike = rows[keep], cols[keep], sell_strike[keep]
+    best = best[keep]
+    buy_strike = buy_strikes[keep, best]
+    credit = reward[keep, best]
+    ROI = ROI[keep, best]
+
+    # Paths from the day after entry up to expiration
+    expiration = panels.dates[rows] + np.timedelta64(params.DTE, 'D')
+    expiration_row = np.searchsorted(panels.dates, expiration, side='right') - 1
+    horizon = max(int((expiration_row - rows).max()) if len(rows) else 0, 1)
+    path = rows[:, np.newaxis] + 1 + np.arange(horizon)
+    in_path = path <= np.minimum(expiration_row, n_dates - 1)[:, np.newaxis]
+    # Entries without any day left before expiration can't be evaluated
+    evaluable = in_path[:, 0]
+    in_path &= evaluable[:, np.newaxis]
+    path = np.minimum(path, n_dates - 1)
+    t = (expiration[:, np.newaxis] - panels.dates[path]).astype(float) / 365
+    path_underlying = panels.close[path, cols[:, np.newaxis]]
+    path_iv = panels.iv[path, cols[:, np.newaxis]]
+    value = (put_price(path_underlying, sell_strike[:, np.newaxis], t, path_iv)
+             - put_price(path_underlying, buy_strike[:, np.newaxis], t, path_iv))
+
+    # Take profit when closing costs profit_factor of the credit, else settle or stay open
+    take_profit_price = credit * params.profit_factor
+    hit = in_path & (value <= take_profit_price[:, np.newaxis])
+    has_take_profit = hit.any(axis=1)
+    last_step = np.maximum(in_path.sum(axis=1) - 1, 0)
+    exit_step = np.where(has_take_profit, np.argmax(hit, axis=1), last_step)
+    exit_row = rows + 1 + exit_step
+    exit_value = np.where(has_take_profit, take_profit_price, value[np.arange(len(rows)), exit_step])
+    expired = panels.dates[-1] >= expiration
+    reason = np.where(has_take_profit, TAKE_PROFIT, np.where(expired, EXPIRATION, OPEN))
+
+    # One spread per asset at a time, as Taco skips assets with strategies
+    selected = np.zeros(len(rows), dtype=bool)
+    busy_until = {}
+    for i in np.lexsort((rows, cols)):
+        if evaluable[i] and rows[i] > busy_until.get(cols[i], -1):
+            selected[i] = True
+            busy_until[cols[i]] = exit_row[i]
+
+    pnl = (credit - exit_value) * params.multiplier
+    trades = pd.DataFrame({
+        'code': np.array(panels.codes, dtype=object)[cols],
+        'entry_date': panels.dates[rows],
+        'expiration': expiration,
+        'sell_strike': sell_strike,
+        'buy_strike': buy_strike,
+        'credit': credit,
+        'ROI': ROI,
+        'exit_date': panels.dates[exit_row],
+        'exit_value': exit_value,
+        'pnl': pnl,
+        'exit_reason': reason,
+    })[selected].sort_values('entry_date', kind='stable').reset_index(drop=True)
+
+    # Daily marked-to-market P&L of the book
+    path_pnl = (credit[:, np.newaxis] - value) * params.multiplier
+    steps = np.arange(horizon)
+    alive = selected[:, np.newaxis] & (steps <= exit_step[:, np.newaxis])
+    path_pnl[np.arange(len(rows)), exit_step] = pnl
+    increments = np.diff(path_pnl, axis=1, prepend=0.0)
+    daily = np.zeros(n_dates)
+    np.add.at(daily, path[alive], increments[alive])
+    return BacktestResult(trades, pd.Series(daily.cumsum(), index=pd.DatetimeIndex(panels.dates)))
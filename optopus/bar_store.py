@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import datetime
+import functools
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay, USThanksgivingDay,
+                                    nearest_workday, sunday_to_monday)
+
+from optopus.asset import Bar
+from optopus.settings import DATA_DIR, BAR_STORE_DIR
+
+PRICE_SERIES = 'price'
+IV_SERIES = 'iv'
+
+# One fixed-size record per daily bar. The file is the raw array, so it can be
+# memory-mapped directly and appended to without rewriting previous bars.
+BAR_DTYPE = np.dtype([('time', 'datetime64[D]'),
+                      ('open', 'f8'),
+                      ('high', 'f8'),
+                      ('low', 'f8'),
+                      ('close', 'f8'),
+                      ('average', 'f8'),
+                      ('volume', 'f8'),
+                      ('count', 'i8')])
+
+
+class BarStore:
+    """Append-only columnar store of daily bars, one file per symbol and series
+    """
+
+    def __init__(self, path: Path = None) -> None:
+        self._path = Path(path) if path else Path(Path.cwd() / DATA_DIR / BAR_STORE_DIR)
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._log = logging.getLogger(__name__)
+
+    def _file_name(self, code: str, series: str) -> Path:
+        return self._path / f'{code}.{series}.bars'
+
+    def read(self, code: str, series: str) -> np.ndarray:
+        """Returns a read-only memory-mapped array with the stored bars
+        """
+        file_name = self._file_name(code, series)
+        try:
+            size = file_name.stat().st_size
+        except FileNotFoundError:
+            return np.empty(0, dtype=BAR_DTYPE)
+        # A partial trailing record is an interrupted append and is ignored
+        n = size // BAR_DTYPE.itemsize
+        if not n:
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.memmap(file_name, dtype=BAR_DTYPE, mode='r', shape=(n,))
+
+    def last_time(self, code: str, series: str) -> datetime.date:
+        bars = self.read(code, series)
+        return bars['time'][-1].astype(object) if len(bars) else None
+
+    def append(self, code: str, series: str, bars: Iterable[Bar]) -> int:
+        """Appends the bars newer than the last stored one.
+
+        Records are written with a single append and fsync, so a reader never
+        sees a bar that was only partially written.
+        """
+        file_name = self._file_name(code, series)
+        with self._lock:
+            last = self.last_time(code, series)
+            records = to_records([b for b in bars if last is None or b.time > last])
+            if not len(records):
+                return 0
+            fd = os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                size = os.fstat(fd).st_size
+                if size % BAR_DTYPE.itemsize:
+                    os.ftruncate(fd, size - size % BAR_DTYPE.itemsize)
+                os.write(fd, records.tobytes())
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._log.debug(f'Appended {len(records)} bars to {file_name.name}')
+        return len(records)
+
+    def history(self, code: str, series: str, start: datetime.date = None) -> Tuple[Bar]:
+        """Returns the stored bars (since start) as Bar objects
+        """
+        bars = self.read(code, series)
+        if start is not None:
+            bars = bars[bars['time'] >= np.datetime64(start, 'D')]
+        return to_bars(bars)
+
+    def panel(self, codes: List[str], series: str, field: str = 'close') -> pd.DataFrame:
+        """Loads a field of every symbol into a date-indexed DataFrame
+        """
+        columns = {}
+        for code in codes:
+            bars = self.read(code, series)
+            columns[code] = pd.Series(np.asarray(bars[field]),
+                                      index=pd.DatetimeIndex(np.asarray(bars['time'])))
+        return pd.DataFrame(columns)
+
+    def codes(self, series: str) -> List[str]:
+        suffix = f'.{series}.bars'
+        return sorted(f.name[:-len(suffix)] for f in self._path.glob(f'*{suffix}'))
+
+
+def to_records(bars: List[Bar]) -> np.ndarray:
+    records = np.empty(len(bars), dtype=BAR_DTYPE)
+    for i, b in enumerate(bars):
+        records[i] = (np.datetime64(b.time, 'D'), b.open, b.high, b.low,
+                      b.close, b.average, b.volume, b.count)
+    return records
+
+
+def to_bars(records: np.ndarray) -> Tuple[Bar]:
+    return tuple(Bar(count=int(r['count']),
+                     open=float(r['open']),
+                     high=float(r['high']),
+                     low=float(r['low']),
+                     close=float(r['close']),
+                     average=float(r['average']),
+                     volume=float(r['volume']),
+                     time=r['time'].astype(object))
+                 for r in records)
+
+
+class ExchangeHolidays(AbstractHolidayCalendar):
+    """Full-day holidays of the US equity and option exchanges.
+
+    The unscheduled closures, like national days of mourning, aren't known.
+    """
+    rules = [
+        # Not observed on the previous Friday when it falls on a Saturday
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date=datetime.datetime(2022, 1, 1),
+                observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def exchange_holidays(year: int) -> FrozenSet[datetime.date]:
+    return frozenset(d.date() for d in ExchangeHolidays().holidays(datetime.date(year, 1, 1),
+                                                                   datetime.date(year, 12, 31)))
+
+
+def last_session(today: datetime.date) -> datetime.date:
+    """Returns the last trading day before today, the last completed daily bar
+    """
+    day = today - datetime.timedelta(days=1)
+    while day.weekday() > 4 or day in exchange_holidays(day.year):
+        day -= datetime.timedelta(days=1)
+    return day
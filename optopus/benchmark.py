@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the computation and conversion hot paths on synthetic data.
+
+Every case is timed at several universe sizes and history lengths and
+reports its throughput and peak traced memory. A run can be stored as the
+baseline and later runs are compared with it:
+
+    python -m optopus.benchmark --symbols 10 100 --years 1 5 --save
+    python -m optopus.benchmark --symbols 10 100 --years 1 5
+
+The import time of the light modules is measured in fresh interpreters
+and checked against IMPORT_TIME_BUDGET with --imports.
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+from ib_insync.contract import Option as IBOption, Stock as IBStock
+from ib_insync.objects import OptionComputation
+from ib_insync.ticker import Ticker
+
+from optopus.asset import Asset, AssetId, Bar, Current, ETF, History, Measures, Stock
+from optopus.common import AssetType, Currency
+from optopus.computation import (assets_directional_assumption, assets_loop_computation,
+                                 assets_vector_computation)
+from optopus.ib_adapter import IBDataAdapter, IBTranslator
+from optopus.option import Option, OptionId, RightType
+from optopus.settings import BENCHMARK_DIR, DATA_DIR, IMPORT_TIME_BUDGET, MARKET_BENCHMARK
+from optopus.short_put_vertical_spread import ShortPutVerticalSpread
+from optopus.strategy_repository import StrategyRepository
+from optopus.utils import to_df
+
+SYMBOLS = (10, 100, 1000, 5000)
+YEARS = (1, 5, 10)
+OPTIONS_PER_SYMBOL = 40
+END_DATE = datetime.date(2019, 1, 2)
+EXPIRATION = datetime.date(2019, 2, 15)
+# Data classes and helpers for tools, tests and notebooks, they must import in milliseconds
+LIGHT_MODULES = ('optopus', 'optopus.common', 'optopus.settings', 'optopus.asset', 'optopus.option',
+                 'optopus.strategy', 'optopus.short_put_vertical_spread', 'optopus.data_objects',
+                 'optopus.order_book', 'optopus.option_chain', 'optopus.utils', 'optopus.strategy_repository')
+HEAVY_DEPENDENCIES = ('numpy', 'pandas', 'ib_insync', 'matplotlib', 'jsonpickle', 'urllib.request',
+                      'logging.handlers')
+_IMPORT_SCRIPT = ('import sys, time\n'
+                  'start = time.perf_counter()\n'
+                  'import {module}\n'
+                  'print(time.perf_counter() - start, *[m for m in {heavy!r} if m in sys.modules])')
+
+
+class Result(NamedTuple):
+    case: str
+    symbols: int
+    years: int
+    items: int
+    seconds: float
+    peak_memory: int
+
+    @property
+    def key(self) -> str:
+        return f'{self.case}/{self.symbols}/{self.years}'
+
+    @property
+    def throughput(self) -> float:
+        """Items per second
+        """
+        return self.items / self.seconds if self.seconds else float('inf')
+
+
+def synthetic_assets(symbols: int, years: int, seed: int = 0) -> Dict[str, Asset]:
+    """Assets with random walk price and IV histories of `years` of daily bars, the benchmark first
+    """
+    rnd = np.random.default_rng(seed)
+    n = years * 252
+    dates = np.busday_offset(END_DATE, np.arange(-n + 1, 1), roll='backward').astype(datetime.date).tolist()
+    assets = {}
+    for i in range(symbols):
+        code = MARKET_BENCHMARK if i == 0 else f'S{i:04d}'
+        asset_type = AssetType.ETF if i == 0 else AssetType.Stock
+        id = AssetId(code, asset_type, Currency.USDollar, IBStock(code, 'SMART', 'USD', conId=i + 1))
+        a = ETF(id) if i == 0 else Stock(id)
+        close = 50 * np.exp(np.cumsum(rnd.normal(0, 0.01, n)))
+        iv = 0.2 * np.exp(np.cumsum(rnd.normal(0, 0.02, n)))
+        volume = rnd.integers(10 ** 5, 10 ** 7, n)
+        a.price_history = History(_bars(close, volume, dates))
+        a.iv_history = History(_bars(iv, np.zeros(n), dates))
+        last = float(close[-1])
+        a.current = Current(high=last * 1.01, low=last * 0.99, close=last, bid=last - 0.01, bid_size=100,
+                            ask=last + 0.01, ask_size=100, last=last, last_size=100, volume=float(volume[-1]),
+                            time=None)
+        assets[code] = a
+    return assets
+
+
+def _bars(close: np.ndarray, volume: np.ndarray, dates: List[datetime.date]) -> tuple:
+    return tuple(Bar(count=0, open=c, high=c * 1.01, low=c * 0.99, close=c, average=c, volume=v, time=d)
+                 for c, v, d in zip(close.tolist(), volume.tolist(), dates))
+
+
+def synthetic_tickers(assets: Dict[str, Asset], per_symbol: int = OPTIONS_PER_SYMBOL) -> List[tuple]:
+    """(underlying id, option ticker) pairs with model greeks around the current price
+    """
+    tickers = []
+    for a in assets.values():
+        price = round(a.current.close)
+        for j in range(per_symbol):
+            right = 'P' if j % 2 else 'C'
+            strike = float(price - per_symbol // 4 + j // 2)
+            contract = IBOption(a.id.code, EXPIRATION.strftime('%Y%m%d'), strike, right, 'SMART',
+                                multiplier='100', conId=len(tickers) + 10 ** 6)
+            greeks = OptionComputation(0.2, 0.5, 1.0, 0.0, 0.05, 0.1, -0.02, a.current.close)
+            tickers.append((a.id, Ticker(contract=contract, bid=0.95, bidSize=10, ask=1.05, askSize=10,
+                                         last=1.0, lastSize=1, volume=100, modelGreeks=greeks)))
+    return tickers
+
+
+def synthetic_strategies(assets: Dict[str, Asset]) -> List[ShortPutVerticalSpread]:
+    """A short put vertical spread on every asset
+    """
+    strategies = []
+    for i, a in enumerate(assets.values()):
+        price = round(a.current.close)
+        legs = []
+        for strike in (price - 5.0, price):
+            contract = IBOption(a.id.code, EXPIRATION.strftime('%Y%m%d'), strike, 'P', 'SMART',
+                                conId=2 * i + len(legs) + 1)
+            opt_id = OptionId(a.id, AssetType.Option, EXPIRATION, strike, RightType.Put, 100, contract)
+            legs.append(Option(opt_id, high=None, low=None, close=None, bid=1.0 + len(legs), bid_size=10,
+                               ask=1.2 + len(legs), ask_size=10, last=None, last_size=None, option_price=1.1,
+                               volume=100, delta=-0.3, gamma=None, theta=None, vega=None, iv=0.25,
+                               underlying_price=a.current.close, underlying_dividends=None,
+                               time=datetime.datetime(2019, 1, 2, 10)))
+        s = ShortPutVerticalSpread(*legs, profit_factor=0.4)
+        s._created = datetime.datetime(2019, 1, 2, 10) + datetime.timedelta(seconds=i)
+        strategies.append(s)
+    return strategies
+
+
+def measure(case: str, symbols: int, years: int, items: int, func: Callable[[], None],
+            repeat: int = 1, memory: bool = True) -> Result:
+    """Best time of `repeat` runs, then the peak memory of a traced run
+    """
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+    peak = 0
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return Result(case, symbols, years, items, seconds, peak)
+
+
+def run(symbols: Iterable[int] = SYMBOLS, years: Iterable[int] = YEARS, repeat: int = 1,
+        memory: bool = True) -> List[Result]:
+    results = []
+    for n in symbols:
+        for y in years:
+            assets = synthetic_assets(n, y)
+            measures = {code: {} for code in assets}
+            results.append(measure('assets_loop_computation', n, y, n,
+                                   lambda: assets_loop_computation(assets, measures), repeat, memory))
+            results.append(measure('assets_vector_computation', n, y, n,
+                                   lambda: assets_vector_computation(assets, measures), repeat, memory))
+            for a in assets.values():
+                a.measures = Measures(**{f: measures[a.id.code].get(f) for f in Measures.__dataclass_fields__})
+            results.append(measure('assets_directional_assumption', n, y, n,
+                                   lambda: assets_directional_assumption(assets), repeat, memory))
+            results.append(measure('to_df', n, y, n, lambda: to_df(list(assets.values())), repeat, memory))
+        # Independent of the history length
+        assets = synthetic_assets(n, 1)
+        tickers = synthetic_tickers(assets)
+        results.append(measure('create_options', n, 0, len(tickers),
+                               lambda: _translate(tickers), repeat, memory))
+        with tempfile.TemporaryDirectory() as path:
+            repository = StrategyRepository(Path(path))
+            repository.save(synthetic_strategies(assets))
+            results.append(measure('strategy_repository.all_items', n, 0, n, repository.all_items, repeat, memory))
+            repository.close()
+    return results
+
+
+def import_time(module: str, repeat: int = 1) -> Tuple[float, List[str]]:
+    """Best import time of the module in fresh interpreters, with the heavy dependencies it loads
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (str(Path(__file__).parents[1]), env.get('PYTHONPATH'))))
+    script = _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_DEPENDENCIES)
+    seconds, heavy = float('inf'), []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                             stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+        seconds, heavy = min(seconds, float(out[0])), out[1:]
+    return seconds, heavy
+
+
+def run_imports(modules: Iterable[str] = LIGHT_MODULES, repeat: int = 3) -> Tuple[List[Result], List[str]]:
+    """Import times of the modules, and the modules over IMPORT_TIME_BUDGET or loading heavy dependencies
+    """
+    results, violations = [], []
+    for module in modules:
+        seconds, heavy = import_time(module, repeat)
+        results.append(Result(f'import {module}', 0, 0, 1, seconds, 0))
+        if seconds > IMPORT_TIME_BUDGET:
+            violations.append(f'{module} imports in {seconds * 1000:.0f} ms, '
+                              f'over the budget of {IMPORT_TIME_BUDGET * 1000:.0f} ms')
+        if heavy:
+            violations.append(f'{module} imports {", ".join(heavy)}')
+    return results, violations
+
+
+def _translate(tickers: List[tuple]) -> List[Option]:
+    # A new adapter each run, so the ids aren't served by the registry
+    adapter = IBDataAdapter(None, IBTranslator())
+    return [adapter._create_option(underlying_id, t) for underlying_id, t in tickers]
+
+
+def save_baseline(results: Sequence[Result], path: Path) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps([r._asdict() for r in results], indent=2))
+
+
+def load_baseline(path: Path) -> Dict[str, Result]:
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return {r.key: r for r in (Result(**d) for d in json.loads(path.read_text()))}
+
+
+def report(results: Sequence[Result], baseline: Dict[str, Result] = None) -> str:
+    """Table of the results, with the time relative to the baseline when there is one
+    """
+    baseline = baseline or {}
+    lines = [f'{"case":<32}{"symbols":>8}{"years":>6}{"seconds":>10}{"items/s":>12}{"peak MB":>9}{"vs base":>9}']
+    for r in results:
+        b = baseline.get(r.key)
+        ratio = f'{r.seconds / b.seconds:>8.2f}x' if b and b.seconds else f'{"":>9}'
+        lines.append(f'{r.case:<32}{r.symbols:>8}{r.years:>6}{r.seconds:>10.4f}{r.throughput:>12.0f}'
+                     f'{r.peak_memory / 2 ** 20:>9.1f}{ratio}')
+    return '\n'.join(lines)
+
+
+def main(argv: Sequence[str] = None) -> List[Result]:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--symbols', type=int, nargs='+', default=SYMBOLS)
+    parser.add_argument('--years', type=int, nargs='+', default=YEARS)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="don't trace the peak memory")
+    parser.add_argument('--baseline', type=Path, default=Path.cwd() / DATA_DIR / BENCHMARK_DIR / 'baseline.json')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--imports', action='store_true', help='measure the import time of the light modules')
+    args = parser.parse_args(argv)
+    violations = []
+    if args.imports:
+        results, violations = run_imports(repeat=max(args.repeat, 3))
+    else:
+        results = run(args.symbols, args.years, args.repeat, args.memory)
+    print(report(results, load_baseline(args.baseline)))
+    for v in violations:
+        print(v)
+    if args.save:
+        save_baseline(results, args.baseline)
+    return results
+
+
+if __name__ == '__main__':
+    main()
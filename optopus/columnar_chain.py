@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""Option chain stored as columns, for the vectorized scans of a whole chain.
+
+It is opt-in: LazyOptionChain.chain() builds one from the quoted options,
+the adapters and the algorithms still use the Option objects.
+"""
+import datetime
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from optopus.asset import AssetId
+from optopus.common import AssetType
+from optopus.option import Option, OptionId, RightType
+
+QUOTE_FIELDS = ('high', 'low', 'close', 'bid', 'bid_size', 'ask', 'ask_size', 'last', 'last_size',
+                'option_price', 'volume', 'delta', 'gamma', 'theta', 'vega', 'iv', 'underlying_price',
+                'underlying_dividends')
+
+
+class OptionChain:
+    """Option chain stored as parallel arrays.
+
+    Rows are sorted by expiration, right and strike and share the underlying
+    and multiplier of the chain. Missing quotes are NaN.
+    """
+
+    def __init__(self,
+                 underlying_id: AssetId,
+                 multiplier: Any,
+                 expiration: Iterable,
+                 strike: Iterable[float],
+                 right: Iterable[str],
+                 contracts: Iterable[Any] = None,
+                 time: datetime.datetime = None,
+                 **quotes: Iterable[float]) -> None:
+        expiration = np.asarray(expiration, dtype='datetime64[D]')
+        strike = np.asarray(strike, dtype=float)
+        right = np.asarray(right, dtype='<U1')
+        order = np.lexsort((strike, right, expiration))
+        self.underlying_id = underlying_id
+        self.multiplier = multiplier
+        self.time = time
+        self.expiration = expiration[order]
+        self.strike = strike[order]
+        self.right = right[order]
+        contracts = np.array([None] * len(order) if contracts is None else list(contracts), dtype=object)
+        self.contracts = contracts[order]
+        for f in QUOTE_FIELDS:
+            values = quotes.get(f)
+            values = np.full(len(order), np.nan) if values is None else np.array(values, dtype=float)
+            setattr(self, f, values[order])
+
+    @classmethod
+    def from_options(cls, options: Iterable[Option]) -> 'OptionChain':
+        options = list(options)
+        times = [o.time for o in options if o.time is not None]
+        return cls(underlying_id=options[0].id.underlying_id if options else None,
+                   multiplier=options[0].id.multiplier if options else None,
+                   expiration=[o.id.expiration for o in options],
+                   strike=[o.id.strike for o in options],
+                   right=[o.id.right.value for o in options],
+                   contracts=[o.id.contract for o in options],
+                   time=max(times) if times else None,
+                   **{f: [getattr(o, f) for o in options] for f in QUOTE_FIELDS})
+
+    def __len__(self) -> int:
+        return len(self.strike)
+
+    def __getitem__(self, index: int) -> 'OptionRow':
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return OptionRow(self, index % len(self))
+
+    def __iter__(self) -> Iterator['OptionRow']:
+        return (OptionRow(self, i) for i in range(len(self)))
+
+    @property
+    def midpoint(self) -> np.ndarray:
+        with np.errstate(invalid='ignore'):
+            quoted = (self.bid > 0) & (self.ask > 0)
+        return np.where(quoted, (self.bid + self.ask) / 2, np.nan)
+
+    def _range(self, expiration: datetime.date = None, right: RightType = None) -> slice:
+        """Rows of an expiration and right, found by binary search
+        """
+        lo, hi = 0, len(self)
+        if expiration is not None:
+            e = np.datetime64(expiration, 'D')
+            lo, hi = np.searchsorted(self.expiration, e), np.searchsorted(self.expiration, e, side='right')
+        if right is not None:
+            rights = self.right[lo:hi]
+            lo, hi = (lo + np.searchsorted(rights, right.value),
+                      lo + np.searchsorted(rights, right.value, side='right'))
+        return slice(int(lo), int(hi))
+
+    def find(self, expiration: datetime.date, strike: float, right: RightType) -> 'OptionRow':
+        r = self._range(expiration, right)
+        i = r.start + int(np.searchsorted(self.strike[r], strike))
+        if i >= r.stop or self.strike[i] != strike:
+            raise KeyError((expiration, strike, right))
+        return OptionRow(self, i)
+
+    def take(self, index: Iterable[int]) -> 'OptionChain':
+        """Chain with some rows, keeping their order
+        """
+        index = np.sort(np.asarray(index, dtype=int))
+        chain = object.__new__(OptionChain)
+        chain.underlying_id = self.underlying_id
+        chain.multiplier = self.multiplier
+        chain.time = self.time
+        for f in ('expiration', 'strike', 'right', 'contracts') + QUOTE_FIELDS:
+            setattr(chain, f, getattr(self, f)[index])
+        return chain
+
+    def select(self, right: RightType = None, min_strike: float = None, max_strike: float = None,
+               expiration: datetime.date = None) -> 'OptionChain':
+        """Rows of an expiration and right between two strikes
+        """
+        r = self._range(expiration, right)
+        strikes = self.strike[r]
+        mask = np.ones(len(strikes), dtype=bool)
+        if min_strike is not None:
+            mask &= strikes >= min_strike
+        if max_strike is not None:
+            mask &= strikes <= max_strike
+        return self.take(r.start + np.flatnonzero(mask))
+
+    def nearest_strike(self, price: float, right: RightType, expiration: datetime.date = None,
+                       count: int = 1) -> 'OptionChain':
+        """The `count` rows of a right with the strikes nearest to the price
+        """
+        r = self._range(expiration, right)
+        distance = np.abs(self.strike[r] - price)
+        return self.take(r.start + np.argsort(distance, kind='stable')[:count])
+
+    def nearest_delta(self, delta: float, right: RightType, expiration: datetime.date = None,
+                      count: int = 1) -> 'OptionChain':
+        """The `count` rows of a right with the deltas nearest to a delta, rows without delta are ignored
+        """
+        r = self._range(expiration, right)
+        distance = np.abs(self.delta[r] - delta)
+        valid = np.flatnonzero(~np.isnan(distance))
+        return self.take(r.start + valid[np.argsort(distance[valid], kind='stable')[:count]])
+
+    def to_df(self) -> pd.DataFrame:
+        df = pd.DataFrame({'expiration': self.expiration, 'strike': self.strike, 'right': self.right,
+                           **{f: getattr(self, f) for f in QUOTE_FIELDS}})
+        df['midpoint'] = self.midpoint
+        return df
+
+
+class OptionRow:
+    """View of a row of an OptionChain with the interface of Option
+    """
+
+    __slots__ = ('_chain', '_index')
+
+    def __init__(self, chain: OptionChain, index: int) -> None:
+        self._chain = chain
+        self._index = index
+
+    def __getattr__(self, name: str) -> Any:
+        if name in QUOTE_FIELDS:
+            value = getattr(self._chain, name)[self._index]
+            return None if np.isnan(value) else float(value)
+        raise AttributeError(name)
+
+    @property
+    def expiration(self) -> datetime.date:
+        return self._chain.expiration[self._index].astype(datetime.date)
+
+    @property
+    def strike(self) -> float:
+        return float(self._chain.strike[self._index])
+
+    @property
+    def right(self) -> RightType:
+        return RightType(self._chain.right[self._index])
+
+    @property
+    def contract(self) -> Any:
+        return self._chain.contracts[self._index]
+
+    @property
+    def id(self) -> OptionId:
+        return OptionId(underlying_id=self._chain.underlying_id,
+                        asset_type=AssetType.Option,
+                        expiration=self.expiration,
+                        strike=self.strike,
+                        right=self.right,
+                        multiplier=self._chain.multiplier,
+                        contract=self.contract)
+
+    @property
+    def midpoint(self) -> float:
+        bid, ask = self.bid, self.ask
+        if not ask or not bid:
+            return None
+        return (bid + ask) / 2
+
+    @property
+    def DTE(self) -> int:
+        return (self.expiration - datetime.date.today()).days
+
+    def to_option(self) -> Option:
+        return Option(id=self.id, time=self._chain.time, **{f: getattr(self, f) for f in QUOTE_FIELDS})
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.expiration}, {self.strike}, {self.right.value})"
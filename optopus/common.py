@@ -1,5 +1,6 @@
+from dataclasses import fields
 from enum import Enum
-from typing import NamedTuple
+from typing import Any, NamedTuple
 
 
 class AssetType(Enum):
@@ -38,3 +39,22 @@ class Direction(Enum):
     Bullish = "Bullish"
     Neutral = "Neutral"
     Bearish = "Bearish"
+
+
+def cached_hash(obj: Any) -> int:
+    """Hash of the fields of a frozen dataclass, computed once
+    """
+    try:
+        return obj.__dict__['_hash']
+    except KeyError:
+        h = hash(tuple(getattr(obj, f.name) for f in fields(obj)))
+        object.__setattr__(obj, '_hash', h)
+        return h
+
+
+def uncached_state(obj: Any) -> dict:
+    """State to pickle without the cached hash, that changes between processes
+    """
+    state = dict(obj.__dict__)
+    state.pop('_hash', None)
+    return state
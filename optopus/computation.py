@@ -228,3 +228,42 @@ def portfolio_bwd(strategies: Dict[str, Strategy], ads: Dict[str, Asset], benchm
                 leg.option.code].beta * leg.option.delta * strategy.quantity * leg.ratio * ownership
             total += BWDelta
     return total
+
+
+def panel_percentile(lows: np.ndarray, values: np.ndarray, window: int, chunk: int = 256) -> np.ndarray:
+    """Fraction of the `window` previous lows below the value, for every date (rows)
+    and asset (columns). Point-in-time version of _iv_percentile.
+    """
+    padded = np.vstack([np.full((window - 1, lows.shape[1]), np.inf), lows])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    result = np.empty(values.shape)
+    for start in range(0, len(values), chunk):
+        end = start + chunk
+        below = windows[start:end] < values[start:end, :, np.newaxis]
+        result[start:end] = below.sum(axis=2) / window
+    return result
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    """Standard normal CDF (Abramowitz and Stegun 7.1.26, error < 1.5e-7)
+    """
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-z * z)
+    return 0.5 * (1 + np.sign(x) * erf)
+
+
+def put_price(underlying: np.ndarray, strike: np.ndarray, t: np.ndarray, iv: np.ndarray) -> np.ndarray:
+    """Black-Scholes european put price, intrinsic value at expiration
+    """
+    underlying, strike, t, iv = np.broadcast_arrays(underlying, strike, t, iv)
+    intrinsic = np.maximum(strike - underlying, 0.0)
+    alive = (t > 0) & (iv > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sqrt_t = np.sqrt(np.where(alive, t, 1.0))
+        sigma = np.where(alive, iv, 1.0)
+        d1 = (np.log(underlying / strike) + sigma ** 2 / 2 * sqrt_t ** 2) / (sigma * sqrt_t)
+        d2 = d1 - sigma * sqrt_t
+        price = strike * norm_cdf(-d2) - underlying * norm_cdf(-d1)
+    return np.where(alive, price, intrinsic)
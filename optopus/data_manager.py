@@ -1,21 +1,75 @@
 # -*- coding: utf-8 -*-
+import dataclasses
 import datetime
 import logging
-from typing import Tuple
+import weakref
+from abc import ABC, abstractmethod
+from typing import Tuple, Callable, Dict, List, Set
 
-from optopus.asset import Measures, AssetType, Forecast
+from optopus.asset import Asset, Measures, AssetType, Forecast, History, Current
+from optopus.bar_store import BarStore, PRICE_SERIES, IV_SERIES, last_session
 from optopus.computation import (
     assets_loop_computation,
     assets_vector_computation,
     assets_directional_assumption,
 )
-from optopus.data_objects import Portfolio
+from optopus.common import AssetDefinition
+from optopus.data_objects import Portfolio, Account, PositionData
+from optopus.option import Option, option_key
+from optopus.option_chain import LazyOptionChain
+from optopus.reconciler import PositionReconciler
+from optopus.settings import HISTORICAL_YEARS
 from optopus.strategy import Strategy
 from optopus.strategy_repository import StrategyRepository
+from optopus.tracing import TRACER, traced
+from optopus.write_behind import WriteBehindRepository
 
 
-class DataAdapter:
-    pass
+class DataAdapter(ABC):
+    """Source of the market and account data used by DataManager
+    """
+
+    # True when the histories are already local and don't need the bar store
+    local_history = False
+
+    def now(self) -> datetime.datetime:
+        """Current time of the data source
+        """
+        return datetime.datetime.now()
+
+    @abstractmethod
+    def get_account_values(self) -> Account:
+        pass
+
+    @abstractmethod
+    def get_positions(self) -> Dict[str, PositionData]:
+        pass
+
+    @abstractmethod
+    def create_assets(self, watchlist: Tuple[AssetDefinition]) -> Dict[str, Asset]:
+        pass
+
+    @abstractmethod
+    def update_assets(self, assets: Dict[str, Asset]) -> Dict[str, Current]:
+        pass
+
+    @abstractmethod
+    def get_price_history(self, a: Asset, start: datetime.date = None) -> History:
+        pass
+
+    @abstractmethod
+    def get_iv_history(self, a: Asset, start: datetime.date = None) -> History:
+        pass
+
+    @abstractmethod
+    def get_optionchain(self, asset: Asset, expiration: datetime.date) -> LazyOptionChain:
+        pass
+
+    @abstractmethod
+    def get_options(self, options: List[Option]) -> List[Option]:
+        """Current values of the options, in the same order. None when there isn't a quote
+        """
+        pass
 
 
 class DataManager:
@@ -29,8 +83,15 @@ class DataManager:
 
         self._strategies = {}
 
-        self._strategy_repository = StrategyRepository()
+        self._strategy_repository = WriteBehindRepository(StrategyRepository())
         self._strategies = self._strategy_repository.all_items()
+        self._reconciler = PositionReconciler()
+        for key, strategy in self._strategies.items():
+            self._reconciler.add_strategy(key, strategy)
+
+        self._bar_store = BarStore()
+        # Option chains in use, released when nothing else references them
+        self._option_chains = weakref.WeakValueDictionary()
 
         self._log = logging.getLogger(__name__)
 
@@ -42,6 +103,10 @@ class DataManager:
     def strategies(self):
         return self._strategies
 
+    @property
+    def option_chains(self) -> Dict[Tuple[str, datetime.date], LazyOptionChain]:
+        return self._option_chains
+
     @property
     def account(self):
         return self._account
@@ -53,28 +118,51 @@ class DataManager:
     def update_account(self) -> None:
         self.account = self._da.get_account_values()
 
+    def _account_item(self, name: str, value: float) -> None:
+        """Applies an account value event
+        """
+        if self._account is None:
+            self._account = Account()
+        setattr(self._account, name, value)
+
+    def _position(self, position: PositionData) -> None:
+        """Applies a position event, re-evaluating only the strategies holding it
+        """
+        self._evaluate_strategies(self._reconciler.update_position(position))
+
     def create_assets(self) -> None:
         """Retrieves the ids of the assets (contracts) from IB
         """
         self._assets = self._da.create_assets(self._watch_list)
 
-    def update_assets(self) -> None:
+    @traced('update_assets')
+    def update_assets(self) -> bool:
         """Updates the current asset values.
+
+        Returns whether a quote changed, the cached snapshots of the adapter
+        are the same from one call to the next.
         """
         current_values = self._da.update_assets(self.assets)
+        updated = False
         for code, current in current_values.items():
-            self._assets[code].current = current
+            if self._assets[code].current != current:
+                self._assets[code].current = current
+                updated = True
+        if updated:
+            # The new quotes start the trace of what the loop does with them
+            TRACER.start_trace()
+        return updated
 
     def update_historical_assets(self) -> None:
         """Updates historical assets values
         """
         for a in self._assets.values():
             if a.price_history:
-                delta = datetime.datetime.now() - a.price_history.created
+                delta = self._da.now() - a.price_history.created
                 if delta.days:
-                    a.price_history = self._da.get_price_history(a)
+                    a.price_history = self._history(a, PRICE_SERIES, self._da.get_price_history)
             else:
-                a.price_history = self._da.get_price_history(a)
+                a.price_history = self._history(a, PRICE_SERIES, self._da.get_price_history)
 
     def update_historical_IV_assets(self) -> None:
         """Updates historical IV asset values
@@ -87,12 +175,44 @@ class DataManager:
 
         for a in assets:
             if a.iv_history:
-                delta = datetime.datetime.now() - a.iv_history.created
+                delta = self._da.now() - a.iv_history.created
                 if delta.days:
-                    a.iv_history = self._da.get_iv_history(a)
+                    a.iv_history = self._history(a, IV_SERIES, self._da.get_iv_history)
             else:
-                a.iv_history = self._da.get_iv_history(a)
+                a.iv_history = self._history(a, IV_SERIES, self._da.get_iv_history)
+
+    def _history(self, a: Asset, series: str,
+                 get_history: Callable[[Asset, datetime.date], History]) -> History:
+        if self._da.local_history:
+            return get_history(a)
+        return self._stored_history(a, series, get_history)
+
+    def _stored_history(self, a: Asset, series: str,
+                        get_history: Callable[[Asset, datetime.date], History]) -> History:
+        """Reads the history from the bar store, requesting only the missing range.
 
+        Only completed sessions are stored; today's bar is kept in memory.
+        """
+        today = datetime.date.today()
+        last = self._bar_store.last_time(a.id.code, series)
+        recent = ()
+        if last is None or last < last_session(today):
+            start = last + datetime.timedelta(days=1) if last else None
+            bars = get_history(a, start).values
+            self._bar_store.append(a.id.code, series, [b for b in bars if b.time < today])
+            recent = tuple(b for b in bars if b.time >= today)
+            self._log.debug(f"Requested {series} history of {a.id.code} since {start}")
+
+        start = today - datetime.timedelta(days=HISTORICAL_YEARS * 365)
+        return History(values=self._bar_store.history(a.id.code, series, start) + recent,
+                       created=datetime.datetime.now())
+
+    def history_panel(self, series: str = PRICE_SERIES, field: str = 'close'):
+        """Loads a stored field of every asset into a date-indexed DataFrame
+        """
+        return self._bar_store.panel(list(self._assets.keys()), series, field)
+
+    @traced('compute')
     def compute(self) -> None:
         """Computes some asset measures
         """
@@ -135,69 +255,67 @@ class DataManager:
         for code, v in directional_m.items():
             self._assets[code].forecast = Forecast(v)
 
+    @traced('option_chain')
     def option_chain(self, code: str, expiration: datetime.date) -> None:
         """Update option chain values
         """
         a = self._assets[code]
-        return self._da.get_optionchain(a, expiration)
+        chain = self._da.get_optionchain(a, expiration)
+        if chain is not None:
+            self._option_chains[(code, expiration)] = chain
+        return chain
+
+    def update_strategy_options(self) -> List[Option]:
+        """Refreshes the options of every strategy leg.
 
-    def update_strategy_options(self) -> None:
-        for strategy_key, strategy in self._strategies.items():
-            for leg_key, leg in strategy.legs.items():
-                leg.option = self._da.get_options([leg.option.contract])[0]
-                self._log.debug(f"Updated contract {leg.option.contract}")
+        The unique contracts of all the strategies are requested in one batch
+        and each updated option is shared by the legs referencing it. The
+        updated options are returned.
+        """
+        options = {}
+        for strategy in self._strategies.values():
+            for leg in strategy.strategy.legs:
+                options.setdefault(option_key(leg.option), leg.option)
+        if not options:
+            return []
+
+        updated = self._da.get_options(list(options.values()))
+        updated = {k: o for k, o in zip(options, updated) if o is not None}
+        for strategy in self._strategies.values():
+            legs = tuple(dataclasses.replace(leg, option=updated.get(option_key(leg.option), leg.option))
+                         for leg in strategy.strategy.legs)
+            strategy.strategy = dataclasses.replace(strategy.strategy, legs=legs)
+        self._log.debug(f"Updated {len(updated)} of {len(options)} strategy contracts")
+        return list(updated.values())
 
     def check_strategy_positions(self):
-        positions = self._da.get_positions()
-        strategies_to_remove = []
-        for strategy_key, strategy in self._strategies.items():
-            strategy_positions = 0
-            for leg_key, leg in strategy.legs.items():
-                try:
-                    position = positions[leg.leg_id]
-                    quantity = strategy.quantity * leg.ratio
-                    if position.ownership == leg.ownership:
-                        if position.quantity >= quantity:
-                            position.quantity -= quantity
-                            strategy_positions += quantity
-                            if not position.quantity:
-                                del positions[position.position_id]
-                        else:
-                            strategy_positions += position.quantity
-                            self._log.warning(
-                                f"Leg {leg.leg_id} doesn't have enough positions"
-                            )
-                    else:
-                        self._log.warning(
-                            f"Leg {leg.leg_id} and position ownership don't match"
-                        )
-                except KeyError as e:
-                    self._log.warning(f"Leg {leg.leg_id} doesn't have any position")
-
-            if (
-                    strategy_positions
-                    == sum(
-                [leg.ratio * strategy.quantity for leg in strategy.legs.values()]
-            )
-                    and not strategy.opened
-            ):
+        """Reconciles the strategies with a snapshot of the positions
+        """
+        self._evaluate_strategies(self._reconciler.load(self._da.get_positions()))
+        if self._reconciler.excess():
+            self._log.warning(f"There are excess positions")
+
+    def _evaluate_strategies(self, keys: Set) -> None:
+        for strategy_key in keys:
+            strategy = self._strategies[strategy_key]
+            allocated = self._reconciler.allocated(strategy_key)
+            required = self._reconciler.required(strategy_key)
+            if 0 < allocated < required:
+                self._log.warning(f"Strategy {strategy_key} doesn't have enough positions")
+
+            if allocated == required and not strategy.opened:
                 strategy.opened = datetime.datetime.now()
                 self.update_strategy(strategy)
                 self._log.info(f"Strategy {strategy_key} opened")
 
-            if not strategy_positions and strategy.opened and not strategy.closed:
+            if not allocated and strategy.opened and not strategy.closed:
                 strategy.closed = datetime.datetime.now()
                 self.update_strategy(strategy)
                 self.delete_strategy(strategy)
-                strategies_to_remove.append(strategy.strategy_id)
+                del self._strategies[strategy_key]
                 self._log.info(f"Strategy {strategy_key} closed")
-
-        if len(positions):
-            self._log.warning(f"There are excess positions")
-
-        for s in strategies_to_remove:
-            del self._strategies[s]
-        # self._strategies = self._strategy_repository.all_items()
+                # Its positions are freed for the other strategies
+                self._evaluate_strategies(self._reconciler.remove_strategy(strategy_key))
 
     # def get_strategy(self, strategy_id: str) -> Strategy:
     #    return self._strategies[strategy_id]
@@ -205,6 +323,7 @@ class DataManager:
     def add_strategy(self, strategy: Strategy) -> None:
         self._strategy_repository.add(strategy)
         self._strategies[strategy.strategy_id] = strategy
+        self._evaluate_strategies(self._reconciler.add_strategy(strategy.strategy_id, strategy))
 
     def update_strategy(self, strategy: Strategy) -> None:
         self._strategies[strategy.strategy_id].updated = datetime.datetime.now()
@@ -212,3 +331,8 @@ class DataManager:
 
     def delete_strategy(self, strategy: Strategy) -> None:
         self._strategy_repository.delete(strategy)
+
+    def close(self) -> None:
+        """Writes the pending strategy changes
+        """
+        self._strategy_repository.close()
@@ -4,6 +4,7 @@ from dataclasses import dataclass
 from enum import Enum
 
 from optopus.common import AssetType, OwnershipType
+from optopus.option import RightType
 
 
 # TODO: Create a new file asset.py for Asset, Current, Measures, History...
@@ -77,6 +78,40 @@ class Position:
         )
 
 
+@dataclass
+class PositionData:
+    code: str
+    asset_type: AssetType
+    expiration: datetime.date
+    ownership: OwnershipType
+    quantity: int
+    strike: float
+    right: RightType
+    average_cost: float
+
+    @property
+    def position_id(self):
+        return position_id(self.code, self.ownership, self.right, self.strike, self.expiration)
+
+
+def position_id(code: str,
+                ownership: OwnershipType,
+                right: RightType,
+                strike: float,
+                expiration: datetime.date) -> str:
+    return (
+            code
+            + " "
+            + str(ownership.value)
+            + " "
+            + (right.value if right else "")
+            + " "
+            + str(round(strike or 0, 1))
+            + " "
+            + (expiration.strftime("%d-%m-%Y") if expiration else "")
+    )
+
+
 # https://interactivebrokers.github.io/tws-api/order_submission.html
 @dataclass(frozen=True)
 class Trade:
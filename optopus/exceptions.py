@@ -14,3 +14,8 @@ class CurrencyMismatchError(ValueError):
 class InvalidOperandError(ValueError):
     def __init__(self):
         super().__init__('Invalid operand types for operation')
+
+
+class RecordingExhaustedError(LookupError):
+    def __init__(self, method: str):
+        super().__init__(f'No recorded response left for {method}')
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple
+
+import numpy as np
+
+from optopus.common import OwnershipType
+from optopus.option import Option, option_key
+from optopus.settings import EXIT_MAX_LEGS
+from optopus.strategy import DefinedStrategy
+
+
+class ExitState(NamedTuple):
+    """Columnar state of the open strategies, one row per strategy.
+
+    Prices are of one unit of the combo, a credit is negative. pnl is
+    positive when the strategy gains, whatever its ownership.
+    """
+    entry: np.ndarray
+    mark: np.ndarray
+    pnl: np.ndarray
+    dte: np.ndarray
+    short_delta: np.ndarray
+    max_loss: np.ndarray
+    # Unrealized loss of the whole position, in the account currency
+    loss: np.ndarray
+
+
+class ExitRule(NamedTuple):
+    name: str
+    # Rows of the strategies to close
+    predicate: Callable[[ExitState], np.ndarray]
+
+
+class ExitIntent(NamedTuple):
+    strategy_id: Any
+    rule: str
+    mark: float
+    pnl: float
+
+
+def dte_rule(days: int) -> ExitRule:
+    """Closes the strategies expiring within days
+    """
+    return ExitRule('dte', lambda s: s.dte <= days)
+
+
+def stop_loss_rule(factor: float) -> ExitRule:
+    """Closes when the mark reaches factor times the entry price, the level of the bracket stop loss
+    """
+    return ExitRule('stop_loss', lambda s: s.pnl <= -np.abs(s.entry) * (factor - 1))
+
+
+def profit_rule(factor: float) -> ExitRule:
+    """Closes when the mark reaches factor times the entry price, like the profit factor of the strategies
+    """
+    return ExitRule('profit', lambda s: s.pnl >= np.abs(s.entry) * (1 - factor))
+
+
+def short_delta_rule(limit: float) -> ExitRule:
+    """Closes when the delta of a sold leg breaches limit
+    """
+    return ExitRule('short_delta', lambda s: s.short_delta >= limit)
+
+
+def max_loss_rule(fraction: float) -> ExitRule:
+    """Closes when the unrealized loss reaches a fraction of the maximum loss
+    """
+    return ExitRule('max_loss', lambda s: s.loss >= s.max_loss * fraction)
+
+
+class ExitEngine:
+    """Evaluates the exit rules of all the open strategies in one vectorized pass.
+
+    Each strategy is a row of arrays and its legs point to slots of a
+    quote table shared by the legs of the same contract. A quote update
+    writes the slots of the options it carries, an evaluation gathers the
+    quotes of the legs and runs every rule over all the rows at once.
+
+    A strategy is reported once, by the first of its rules that matches,
+    until it is reset or removed.
+    """
+
+    def __init__(self, rules: Iterable[ExitRule] = (), capacity: int = 64) -> None:
+        self._rules = list(rules)
+        self._keys = []
+        self._rows = {}
+        self._entry = np.full(capacity, np.nan)
+        self._expiration = np.zeros(capacity, dtype=np.int64)
+        self._max_loss = np.full(capacity, np.nan)
+        # Ownership of the strategy times its quantity and multiplier
+        self._size = np.zeros(capacity)
+        self._sign = np.zeros(capacity)
+        self._exiting = np.zeros(capacity, dtype=bool)
+        # Legs, one row per leg number: quote slot, ownership times ratio and
+        # quote slot of the sold legs only. -1 is the slot of the missing legs
+        self._leg_slots = np.full((EXIT_MAX_LEGS, capacity), -1, dtype=np.int64)
+        self._leg_weights = np.zeros((EXIT_MAX_LEGS, capacity))
+        self._short_slots = np.full((EXIT_MAX_LEGS, capacity), -1, dtype=np.int64)
+        # Quotes: one slot per contract, the last one is the zero price and delta of the missing legs
+        self._slots = {}
+        self._slot_keys = {}
+        self._free_slots = []
+        self._slot_refs = np.zeros(capacity, dtype=np.int64)
+        self._mids = np.append(np.full(capacity, np.nan), 0.0)
+        self._deltas = np.append(np.full(capacity, np.nan), 0.0)
+        self._log = logging.getLogger(__name__)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._rows
+
+    @property
+    def rules(self) -> List[ExitRule]:
+        return list(self._rules)
+
+    def add_rule(self, rule: ExitRule) -> None:
+        self._rules.append(rule)
+
+    def add_strategy(self, key: Any, strategy: DefinedStrategy) -> None:
+        """Adds an open strategy, at the price it was opened
+        """
+        self.remove_strategy(key)
+        legs = strategy.strategy.legs
+        if len(legs) > len(self._leg_slots):
+            self._grow_legs(len(legs))
+        row = len(self._keys)
+        if row == len(self._entry):
+            self._grow_rows()
+        self._keys.append(key)
+        self._rows[key] = row
+
+        entry = getattr(strategy, 'opening_price', None)
+        if entry is None:
+            entry = strategy.entry_price
+        sign = strategy.strategy.ownership.value
+        multiplier = float(legs[0].option.id.multiplier)
+        self._entry[row] = entry
+        self._sign[row] = sign
+        self._size[row] = sign * strategy.quantity * multiplier
+        loss = getattr(strategy, 'maximum_loss', None)
+        self._max_loss[row] = abs(loss) * strategy.quantity if loss is not None else np.nan
+        self._expiration[row] = min(leg.option.id.expiration for leg in legs).toordinal()
+        self._exiting[row] = False
+
+        self._leg_slots[:, row] = -1
+        self._leg_weights[:, row] = 0.0
+        self._short_slots[:, row] = -1
+        for i, leg in enumerate(legs):
+            slot = self._acquire_slot(leg.option)
+            self._leg_slots[i, row] = slot
+            self._leg_weights[i, row] = leg.ownership.value * leg.ratio
+            if leg.ownership == OwnershipType.Seller:
+                self._short_slots[i, row] = slot
+
+    def remove_strategy(self, key: Any) -> None:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        slots = self._leg_slots[:, row]
+        for slot in slots[slots >= 0]:
+            self._release_slot(slot)
+        # The last row takes the place of the removed one
+        last = len(self._keys) - 1
+        moved = self._keys.pop()
+        if row != last:
+            self._keys[row] = moved
+            self._rows[moved] = row
+            for a in self._row_arrays():
+                a[..., row] = a[..., last]
+
+    def sync(self, strategies: Dict[Any, DefinedStrategy]) -> None:
+        """Adds the newly opened strategies and removes the closed or deleted ones
+        """
+        for key in [k for k in self._keys if k not in strategies or strategies[k].closed]:
+            self.remove_strategy(key)
+        for key, strategy in strategies.items():
+            if key not in self._rows and strategy.opened and not strategy.closed:
+                self.add_strategy(key, strategy)
+
+    def reset(self, key: Any) -> None:
+        """Reports the strategy again when a rule matches
+        """
+        row = self._rows.get(key)
+        if row is not None:
+            self._exiting[row] = False
+
+    def update_quotes(self, options: Iterable[Option]) -> None:
+        for option in options:
+            slot = self._slots.get(option_key(option))
+            if slot is not None:
+                mid = option.midpoint
+                self._mids[slot] = mid if mid is not None else np.nan
+                self._deltas[slot] = option.delta if option.delta is not None else np.nan
+
+    def state(self, today: datetime.date = None) -> ExitState:
+        n = len(self._keys)
+        today = today or datetime.date.today()
+        with np.errstate(invalid='ignore'):
+            # A missing quote of a leg leaves the mark undefined
+            mark = (self._leg_weights[:, :n] * self._mids[self._leg_slots[:, :n]]).sum(axis=0)
+            pnl = (mark - self._entry[:n]) * self._sign[:n]
+            short_delta = np.fmax.reduce(np.abs(self._deltas[self._short_slots[:, :n]]), axis=0)
+        return ExitState(entry=self._entry[:n],
+                         mark=mark,
+                         pnl=pnl,
+                         dte=self._expiration[:n] - today.toordinal(),
+                         short_delta=short_delta,
+                         max_loss=self._max_loss[:n],
+                         loss=-pnl * np.abs(self._size[:n]))
+
+    def evaluate(self, today: datetime.date = None) -> List[ExitIntent]:
+        """Close intents of the strategies matching a rule for the first time
+        """
+        n = len(self._keys)
+        if not n or not self._rules:
+            return []
+        state = self.state(today)
+        with np.errstate(invalid='ignore'):
+            matches = np.stack([np.broadcast_to(r.predicate(state), (n,)) for r in self._rules])
+        matched = matches.any(axis=0) & ~self._exiting[:n]
+        rows = np.flatnonzero(matched)
+        if not len(rows):
+            return []
+        self._exiting[rows] = True
+        first = matches[:, rows].argmax(axis=0)
+        intents = [ExitIntent(self._keys[row], self._rules[rule].name, float(state.mark[row]),
+                              float(state.pnl[row]))
+                   for row, rule in zip(rows.tolist(), first.tolist())]
+        for i in intents:
+            self._log.info(f'Exit {i.strategy_id} by the {i.rule} rule at {i.mark:.2f}')
+        return intents
+
+    _ROW_ARRAYS = ('_entry', '_expiration', '_max_loss', '_size', '_sign', '_exiting',
+                   '_leg_slots', '_leg_weights', '_short_slots')
+
+    def _row_arrays(self) -> List[np.ndarray]:
+        return [getattr(self, name) for name in self._ROW_ARRAYS]
+
+    def _grow_rows(self) -> None:
+        for name in self._ROW_ARRAYS:
+            a = getattr(self, name)
+            setattr(self, name, np.concatenate([a, a], axis=-1))
+
+    def _grow_legs(self, legs: int) -> None:
+        shape = (legs - len(self._leg_slots), self._leg_slots.shape[1])
+        self._leg_slots = np.vstack([self._leg_slots, np.full(shape, -1, dtype=np.int64)])
+        self._leg_weights = np.vstack([self._leg_weights, np.zeros(shape)])
+        self._short_slots = np.vstack([self._short_slots, np.full(shape, -1, dtype=np.int64)])
+
+    def _acquire_slot(self, option: Option) -> int:
+        key = option_key(option)
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = len(self._slots)
+                if slot == len(self._slot_refs):
+                    self._slot_refs = np.concatenate([self._slot_refs, np.zeros(len(self._slot_refs), np.int64)])
+                    # The slot of the missing legs stays last
+                    self._mids = np.concatenate([self._mids[:-1], np.full(slot, np.nan), [0.0]])
+                    self._deltas = np.concatenate([self._deltas[:-1], np.full(slot, np.nan), [0.0]])
+            self._slots[key] = slot
+            self._slot_keys[slot] = key
+            mid = option.midpoint
+            self._mids[slot] = mid if mid is not None else np.nan
+            self._deltas[slot] = option.delta if option.delta is not None else np.nan
+        self._slot_refs[slot] += 1
+        return slot
+
+    def _release_slot(self, slot: int) -> None:
+        self._slot_refs[slot] -= 1
+        if not self._slot_refs[slot]:
+            del self._slots[self._slot_keys.pop(slot)]
+            self._free_slots.append(int(slot))
+            self._mids[slot] = np.nan
+            self._deltas[slot] = np.nan
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Offline data adapter serving local datasets at a simulated time.
+
+Dataset layout:
+
+    bars/<code>.<series>.bars    BarStore files, memory-mapped
+    options/<code>.<ext>         option quotes, one row per date and contract
+    positions.<ext>              positions, one row per position
+
+where <ext> is parquet, csv or npz. Option rows have the columns date,
+expiration, strike, right, bid, ask, volume and optionally high, low, close,
+last, bid_size, ask_size, last_size, option_price, delta, gamma, theta,
+vega, iv, underlying_price and multiplier. Position rows have the columns
+code, asset_type, expiration, strike, right, ownership, quantity and
+average_cost.
+"""
+import datetime
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from optopus.asset import Asset, AssetId, Current, History, Stock, ETF, Index
+from optopus.bar_store import BarStore, PRICE_SERIES, IV_SERIES, to_bars
+from optopus.common import AssetDefinition, AssetType, OwnershipType
+from optopus.data_manager import DataAdapter
+from optopus.data_objects import Account, PositionData
+from optopus.option import Option, OptionId, RightType
+from optopus.option_chain import LazyOptionChain, OptionDefinition
+from optopus.registry import IdRegistry
+from optopus.settings import HISTORICAL_YEARS, SESSION_CLOSE
+
+DATASET_EXTENSIONS = ('.parquet', '.csv', '.npz')
+
+
+class SimulatedClock:
+    """Clock moved by hand, for point-in-time replays
+    """
+
+    def __init__(self, now: datetime.datetime) -> None:
+        self._now = now
+
+    def now(self) -> datetime.datetime:
+        return self._now
+
+    def set(self, now: datetime.datetime) -> None:
+        self._now = now
+
+    def advance(self, **kwargs) -> None:
+        self._now += datetime.timedelta(**kwargs)
+
+
+def read_dataset(file_name: Path) -> pd.DataFrame:
+    if file_name.suffix == '.parquet':
+        return pd.read_parquet(file_name)
+    elif file_name.suffix == '.csv':
+        return pd.read_csv(file_name)
+    elif file_name.suffix == '.npz':
+        with np.load(file_name, allow_pickle=False) as data:
+            return pd.DataFrame({k: data[k] for k in data.files})
+    raise ValueError(f'Unsupported dataset format {file_name.suffix}')
+
+
+def find_dataset(path: Path, name: str) -> Path:
+    for extension in DATASET_EXTENSIONS:
+        file_name = path / (name + extension)
+        if file_name.exists():
+            return file_name
+    return None
+
+
+class FileDataAdapter(DataAdapter):
+    """Data adapter reading local datasets, sliced at the time of a clock
+    """
+
+    local_history = True
+
+    def __init__(self, path: Path, clock: SimulatedClock, account: Account = None) -> None:
+        self._path = Path(path)
+        self._clock = clock
+        self._account = account or Account()
+        self._bar_store = BarStore(self._path / 'bars')
+        self._option_quotes = {}
+        self._registry = IdRegistry()
+        self._log = logging.getLogger(__name__)
+
+    def now(self) -> datetime.datetime:
+        return self._clock.now()
+
+    def _today(self) -> np.datetime64:
+        return np.datetime64(self._clock.now().date(), 'D')
+
+    def _bars(self, code: str, series: str, start: datetime.date = None) -> np.ndarray:
+        """Bars completed at the clock time, without reading the rest of the file.
+
+        The bar of the clock date holds the whole session, it's only there
+        once the session is closed.
+        """
+        bars = self._bar_store.read(code, series)
+        side = 'right' if self._clock.now().time() >= SESSION_CLOSE else 'left'
+        end = np.searchsorted(bars['time'], self._today(), side=side)
+        begin = np.searchsorted(bars['time'], np.datetime64(start, 'D')) if start else 0
+        return bars[begin:end]
+
+    def get_account_values(self) -> Account:
+        return self._account
+
+    def get_positions(self) -> Dict[str, PositionData]:
+        file_name = find_dataset(self._path, 'positions')
+        if not file_name:
+            return {}
+        positions = {}
+        for row in read_dataset(file_name).itertuples(index=False):
+            expiration = pd.to_datetime(row.expiration).date() if pd.notna(row.expiration) else None
+            p = PositionData(
+                code=row.code,
+                asset_type=AssetType(row.asset_type),
+                expiration=expiration,
+                ownership=OwnershipType[row.ownership],
+                quantity=row.quantity,
+                strike=row.strike if pd.notna(row.strike) else None,
+                right=RightType(row.right) if pd.notna(row.right) else None,
+                average_cost=row.average_cost,
+            )
+            positions[p.position_id] = p
+        return positions
+
+    def create_assets(self, watchlist: Tuple[AssetDefinition]) -> Dict[str, Asset]:
+        assets = {}
+        for item in watchlist:
+            id = self._registry.asset_id(AssetId(code=item.code, asset_type=item.asset_type,
+                                                 currency=item.currency, contract=None))
+            if id.asset_type == AssetType.Stock:
+                assets[id.code] = Stock(id)
+            elif id.asset_type == AssetType.ETF:
+                assets[id.code] = ETF(id)
+            elif id.asset_type == AssetType.Index:
+                assets[id.code] = Index(id)
+        return assets
+
+    def update_assets(self, assets: Dict[str, Asset]) -> Dict[str, Current]:
+        """Quotes at the last completed bar, the previous close during a session
+        """
+        current_values = {}
+        for code in assets:
+            bars = self._bars(code, PRICE_SERIES)
+            if not len(bars):
+                continue
+            b = bars[-1]
+            close = float(b['close'])
+            current_values[code] = Current(
+                high=float(b['high']),
+                low=float(b['low']),
+                close=close,
+                bid=close,
+                bid_size=0,
+                ask=close,
+                ask_size=0,
+                last=close,
+                last_size=0,
+                volume=float(b['volume']),
+                time=self._clock.now(),
+            )
+        return current_values
+
+    def get_price_history(self, a: Asset, start: datetime.date = None) -> History:
+        return self._history(a, PRICE_SERIES, start)
+
+    def get_iv_history(self, a: Asset, start: datetime.date = None) -> History:
+        return self._history(a, IV_SERIES, start)
+
+    def _history(self, a: Asset, series: str, start: datetime.date = None) -> History:
+        if start is None:
+            start = self._clock.now().date() - datetime.timedelta(days=HISTORICAL_YEARS * 365)
+        return History(values=to_bars(self._bars(a.id.code, series, start)),
+                       created=self._clock.now())
+
+    def _quotes(self, code: str) -> Tuple[np.ndarray, pd.DataFrame]:
+        """Option quotes of a symbol sorted by date, loaded once
+        """
+        if code not in self._option_quotes:
+            file_name = find_dataset(self._path / 'options', code)
+            if not file_name:
+                raise FileNotFoundError(f'No option dataset for {code}')
+            df = read_dataset(file_name)
+            df['date'] = pd.to_datetime(df['date']).values.astype('datetime64[D]')
+            df['expiration'] = pd.to_datetime(df['expiration']).values.astype('datetime64[D]')
+            df = df.sort_values('date', kind='stable').reset_index(drop=True)
+            self._option_quotes[code] = (df['date'].values, df)
+        return self._option_quotes[code]
+
+    def get_optionchain(self, asset: Asset, expiration: datetime.date) -> LazyOptionChain:
+        dates, df = self._quotes(asset.id.code)
+        today = self._today()
+        rows = df.iloc[np.searchsorted(dates, today):np.searchsorted(dates, today, side='right')]
+        rows = rows[rows['expiration'].values == np.datetime64(expiration, 'D')]
+
+        underlying_price = asset.current.market_price
+        width = underlying_price * 0.1
+        rows = rows[(rows['strike'] > underlying_price - width) & (rows['strike'] < underlying_price + width)]
+
+        definitions = {}
+        for i, strike, right in zip(rows.index, rows['strike'], rows['right']):
+            right = RightType(right)
+            definitions[f"{float(strike)}{right.value}"] = OptionDefinition(
+                strike=float(strike), right=right, contract=i)
+        return LazyOptionChain(definitions, lambda index: self.create_options(asset, index),
+                               freshness=float("inf"))
+
+    def get_options(self, options: List[Option]) -> List[Option]:
+        today = self._today()
+        result = [None] * len(options)
+        by_code = {}
+        for i, o in enumerate(options):
+            by_code.setdefault(o.id.underlying_id.code, []).append(i)
+        for code, positions in by_code.items():
+            dates, df = self._quotes(code)
+            rows = df.iloc[np.searchsorted(dates, today):np.searchsorted(dates, today, side='right')]
+            index = {(e, float(k), RightType(r)): i
+                     for i, e, k, r in zip(rows.index, rows['expiration'].values, rows['strike'], rows['right'])}
+            terms = {p: (np.datetime64(options[p].id.expiration, 'D'), float(options[p].id.strike),
+                         options[p].id.right) for p in positions}
+            found = [p for p in positions if terms[p] in index]
+            quotes = self._create_options(options[positions[0]].id.underlying_id,
+                                          [index[terms[p]] for p in found])
+            for p, o in zip(found, quotes):
+                result[p] = o
+        return result
+
+    def create_options(self, asset: Asset, index: List[int]) -> Dict[str, Option]:
+        return {f"{o.id.strike}{o.id.right.value}": o for o in self._create_options(asset.id, index)}
+
+    def _create_options(self, underlying_id: AssetId, index: List[int]) -> List[Option]:
+        _, df = self._quotes(underlying_id.code)
+        options = []
+        for row in df.loc[index].to_dict('records'):
+            right = RightType(row['right'])
+            strike = float(row['strike'])
+            opt_id = self._registry.option_id(OptionId(
+                underlying_id=underlying_id,
+                asset_type=AssetType.Option,
+                expiration=row['expiration'].date(),
+                strike=strike,
+                right=right,
+                multiplier=int(row.get('multiplier', 100)),
+                contract=None,
+            ))
+            options.append(Option(
+                id=opt_id,
+                high=row.get('high'),
+                low=row.get('low'),
+                close=row.get('close'),
+                bid=row['bid'],
+                bid_size=row.get('bid_size'),
+                ask=row['ask'],
+                ask_size=row.get('ask_size'),
+                last=row.get('last'),
+                last_size=row.get('last_size'),
+                option_price=row.get('option_price'),
+                volume=row['volume'],
+                delta=row.get('delta'),
+                gamma=row.get('gamma'),
+                theta=row.get('theta'),
+                vega=row.get('vega'),
+                iv=row.get('iv'),
+                underlying_price=row.get('underlying_price'),
+                underlying_dividends=row.get('underlying_dividends'),
+                time=self._clock.now(),
+            ))
+        return options
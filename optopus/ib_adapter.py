@@ -7,6 +7,7 @@ Created on Sun Aug  5 07:21:38 2018
 """
 import datetime
 import logging
+import sys
 from typing import List, Dict, Tuple
 
 from ib_insync.contract import Index as IBIndex, Option as IBOption, Stock as IBStock
@@ -15,15 +16,22 @@ from ib_insync.objects import (
     AccountValue,
     ComboLeg,
 )
-from ib_insync.order import Trade as IBTrade, LimitOrder
+from ib_insync.order import Trade as IBTrade, LimitOrder, StopOrder
+from ib_insync.ticker import Ticker
 
 from optopus.asset import AssetId, Asset, Current, History, Bar, Stock, ETF, Index
 from optopus.common import AssetType, AssetDefinition, Currency
 from optopus.data_manager import DataAdapter
-from optopus.data_objects import Position, OwnershipType, Account, OrderStatus, Trade
+from optopus.data_objects import Position, PositionData, OwnershipType, Account, OrderStatus, Trade
 from optopus.option import Option, OptionId, RightType
-from optopus.settings import CURRENCY, HISTORICAL_YEARS
-from optopus.strategy import StrategyType, Strategy
+from optopus.option_chain import LazyOptionChain, OptionDefinition
+from optopus.order_book import Bracket, PARENT, STOP_LOSS, TAKE_PROFIT
+from optopus.registry import IdRegistry
+from optopus.request_stats import RequestAccounting
+from optopus.settings import CURRENCY, HISTORICAL_YEARS, OPTION_QUOTE_FRESHNESS
+from optopus.strategy import DefinedStrategy, StrategyType
+from optopus.ticker_cache import TickerCache
+from optopus.tracing import TRACER, traced
 from optopus.utils import parse_ib_date, format_ib_date
 
 
@@ -35,11 +43,18 @@ class IBBrokerAdapter:
         self._host = host
         self._port = port
         self._client = client
+        self._registry = IdRegistry()
+        self._requests = RequestAccounting()
         self._translator = IBTranslator()
-        self._data_adapter = IBDataAdapter(self._broker, self._translator)
+        self._data_adapter = IBDataAdapter(self._broker, self._translator, self._registry, self._requests)
 
         self.emit_order_status = None
+        self.emit_position_event = None
+        self.emit_account_item_event = None
         self._broker.orderStatusEvent += self._onOrderStatusEvent
+        self._broker.positionEvent += self._onPositionEvent
+        self._broker.accountValueEvent += self._onAccountValueEvent
+        self._broker.errorEvent += self._onErrorEvent
 
     def connect(self) -> None:
         self._broker.connect(self._host, self._port, self._client)
@@ -53,72 +68,67 @@ class IBBrokerAdapter:
     def _onOrderStatusEvent(self, trade: IBTrade):
         self.emit_order_status(self._translator.translate_trade(trade))
 
-    def _reverse_ownership(sefl, ownership):
-        return "BUY" if ownership == "SELL" else "SELL"
-
-    def open_strategy(self, strategy: Strategy) -> None:
-        """Place a new strategy at the market
+    def _onPositionEvent(self, position: Position):
+        if self.emit_position_event:
+            self.emit_position_event(self._translator.translate_position(position))
+
+    def _onAccountValueEvent(self, value: AccountValue):
+        if self.emit_account_item_event:
+            item = self._translator.translate_account_item(value)
+            if item:
+                self.emit_account_item_event(*item)
+
+    def _onErrorEvent(self, reqId: int, errorCode: int, errorString: str, contract: Contract = None):
+        request = _pacing_errors.get(errorCode)
+        # 162 is a generic historical data error, only some of them are pacing violations
+        if request and (errorCode != 162 or 'pacing' in errorString.lower()):
+            self._requests.pacing_violation(request)
+
+    @property
+    def requests(self) -> RequestAccounting:
+        return self._requests
+
+    @traced("open_strategy")
+    def open_strategy(self, strategy: DefinedStrategy, bracket: Bracket) -> None:
+        """Places the entry order of a strategy with its children, without waiting for the broker
         """
-
-        ownership = "BUY" if strategy.ownership == OwnershipType.Buyer else "SELL"
-        reverse_ownership = "BUY" if ownership == "SELL" else "SELL"
-
-        contract = Contract()
-        contract.symbol = strategy.code
-        contract.secType = "BAG"
-        contract.exchange = "SMART"
-        contract.currency = strategy.currency.value
-        order_comboLegs = []
-        tp_sl_comboLegs = []
-
-        for leg in strategy.legs.values():
-            leg_order = ComboLeg()
-            leg_order.conId = leg.option.contract.conId
-            leg_order.ratio = leg.ratio
-            leg_order.action = "BUY" if leg.ownership == OwnershipType.Buyer else "SELL"
-            # contract.comboLegs.append(leg_order)
-            order_comboLegs.append(leg_order)
-
-        for leg in strategy.legs.values():
-            leg_tp_sl = ComboLeg()
-            leg_tp_sl.conId = leg.option.contract.conId
-            leg_tp_sl.ratio = leg.ratio
-            leg_tp_sl.action = (
-                "SELL" if leg.ownership == OwnershipType.Buyer else "BUY"
-            )  # reverse
-            # contract.comboLegs.append(leg_order)
-            tp_sl_comboLegs.append(leg_tp_sl)
-
-        contract.comboLegs = order_comboLegs
-        order = LimitOrder(
-            action="BUY" if strategy.ownership == OwnershipType.Buyer else "SELL",
-            totalQuantity=strategy.quantity,
-            lmtPrice=strategy.entry_price,
-            orderRef=strategy.strategy_id,
-            orderId=self._broker.client.getReqId(),
-            tif="GTC",
-            transmit=True,
-        )  # Must be False
-        print("ORDER SENDED")
-        self._broker.placeOrder(contract, order)
-
-        # contract.comboLegs = tp_sl_comboLegs
-
-        # print('take_profit_order', strategy.take_profit_price)
-        take_profit = LimitOrder(
-            action="SELL"
-            if strategy.ownership == OwnershipType.Buyer
-            else "BUY",  # reverse
-            totalQuantity=strategy.quantity,
-            lmtPrice=strategy.take_profit_price,
-            # lmtPrice = -0.1,
-            orderRef=strategy.strategy_id + "_TP",
-            orderId=self._broker.client.getReqId(),
-            tif="GTC",
-            transmit=True,
-            parentId=order.orderId,
+        contract = self._combo_contract(strategy)
+        action = "BUY" if bracket.ownership == OwnershipType.Buyer else "SELL"
+        reverse_action = "SELL" if action == "BUY" else "BUY"
+        orders = [LimitOrder(action, bracket.quantity, bracket.entry_price,
+                             orderRef=bracket.order_ref(PARENT), tif="GTC")]
+        if bracket.take_profit_price is not None:
+            orders.append(LimitOrder(reverse_action, bracket.quantity, bracket.take_profit_price,
+                                     orderRef=bracket.order_ref(TAKE_PROFIT), tif="GTC"))
+        if bracket.stop_loss_price is not None:
+            orders.append(StopOrder(reverse_action, bracket.quantity, bracket.stop_loss_price,
+                                    orderRef=bracket.order_ref(STOP_LOSS), tif="GTC"))
+        for o in orders:
+            o.orderId = self._broker.client.getReqId()
+            # Only the last order transmits the bracket, so the children are active with the parent
+            o.transmit = o is orders[-1]
+            if o is not orders[0]:
+                o.parentId = orders[0].orderId
+                # The fill of a child cancels the other one
+                o.ocaGroup = bracket.order_ref(PARENT)
+                o.ocaType = 1
+        TRACER.mark("tick_to_order", TRACER.tagged(strategy.strategy_id))
+        for o in orders:
+            self._requests.call("placeOrder", self._broker.placeOrder, contract, o, contracts=1)
+
+    def _combo_contract(self, strategy: DefinedStrategy) -> Contract:
+        """BAG contract of the strategy legs, with the action and ratio of each leg
+        """
+        legs = strategy.strategy.legs
+        return Contract(
+            symbol=strategy.code,
+            secType="BAG",
+            exchange="SMART",
+            currency=legs[0].option.id.underlying_id.currency.value,
+            comboLegs=[ComboLeg(conId=leg.option.id.contract.conId, ratio=leg.ratio, exchange="SMART",
+                                action="BUY" if leg.ownership == OwnershipType.Buyer else "SELL")
+                       for leg in legs],
         )
-        self._broker.placeOrder(contract, take_profit)
 
 
 class IBTranslator:
@@ -165,6 +175,21 @@ class IBTranslator:
             "SCVS": StrategyType.ShortCallVerticalSpread,
         }
 
+        self._account_translation = {
+            "AvailableFunds": "funds",
+            "BuyingPower": "buying_power",
+            "TotalCashValue": "cash",
+            "DayTradesRemaining": "max_day_trades",
+            "NetLiquidation": "net_liquidation",
+            "InitMarginReq": "initial_margin",
+            "MaintMarginReq": "maintenance_margin",
+            "ExcessLiquidity": "excess_liquidity",
+            "Cushion": "cushion",
+            "GrossPositionValue": "gross_position_value",
+            "EquityWithLoanValue": "equity_with_loan",
+            "SMA": "SMA",
+        }
+
         self._currency_translation = {
             "USD": Currency.USDollar,
             "EUR": Currency.Euro
@@ -173,35 +198,20 @@ class IBTranslator:
     def translate_account(self, values: List[AccountValue]) -> Account:
         account = Account()
         for v in values:
-            if v.currency == CURRENCY.value:
-                if v.tag == "AvailableFunds":
-                    account.funds = float(v.value)
-                elif v.tag == "BuyingPower":
-                    account.buying_power = float(v.value)
-                elif v.tag == "TotalCashValue":
-                    account.cash = float(v.value)
-                elif v.tag == "DayTradesRemaining":
-                    account.max_day_trades = float(v.value)
-                elif v.tag == "NetLiquidation":
-                    account.net_liquidation = float(v.value)
-                elif v.tag == "InitMarginReq":
-                    account.initial_margin = float(v.value)
-                elif v.tag == "MaintMarginReq":
-                    account.maintenance_margin = float(v.value)
-                elif v.tag == "ExcessLiquidity":
-                    account.excess_liquidity = float(v.value)
-                elif v.tag == "Cushion":
-                    account.cushion = float(v.value)
-                elif v.tag == "GrossPositionValue":
-                    account.gross_position_value = float(v.value)
-                elif v.tag == "EquityWithLoanValue":
-                    account.equity_with_loan = float(v.value)
-                elif v.tag == "SMA":
-                    account.SMA = float(v.value)
+            item = self.translate_account_item(v)
+            if item:
+                setattr(account, *item)
         return account
 
-    def translate_position(self, item: Position) -> Position:
-        code = item.contract.symbol
+    def translate_account_item(self, value: AccountValue) -> Tuple[str, float]:
+        """Account attribute and value of an IB account value, None if it isn't used
+        """
+        if value.currency == CURRENCY.value and value.tag in self._account_translation:
+            return self._account_translation[value.tag], float(value.value)
+        return None
+
+    def translate_position(self, item: Position) -> PositionData:
+        code = sys.intern(item.contract.symbol)
         asset_type = self._sectype_translation[item.contract.secType]
 
         if item.position > 0:
@@ -270,18 +280,29 @@ class IBTranslator:
 
 
 class IBDataAdapter(DataAdapter):
-    def __init__(self, broker: IB, translator: IBTranslator) -> None:
+    def __init__(self,
+                 broker: IB,
+                 translator: IBTranslator,
+                 registry: IdRegistry = None,
+                 requests: RequestAccounting = None) -> None:
         self._broker = broker
         self._translator = translator
+        self._registry = registry or IdRegistry()
+        self._requests = requests or RequestAccounting()
+        self._qualified = {}
+        self._ticker_cache = TickerCache(self._request_tickers)
         self._log = logging.getLogger(__name__)
 
+    def ticker_cache_stats(self) -> Dict[str, float]:
+        return self._ticker_cache.stats()
+
     def get_account_values(self):
-        values = self._broker.accountValues()
+        values = self._requests.call("accountValues", self._broker.accountValues)
         account = self._translator.translate_account(values)
         return account
 
-    def get_positions(self) -> Dict[str, Position]:
-        positions = self._broker.positions()
+    def get_positions(self) -> Dict[str, PositionData]:
+        positions = self._requests.call("positions", self._broker.positions)
         positions_data = {}
         for p in positions:
             pd = self._translator.translate_position(p)
@@ -302,16 +323,17 @@ class IBDataAdapter(DataAdapter):
                 )
         # TODO: Remove the limit
         # It works if len(contracts) < 50. IB limit.
-        q_contracts = self._broker.qualifyContracts(*contracts)
+        q_contracts = self._requests.call("qualifyContracts", self._broker.qualifyContracts, *contracts,
+                                          contracts=len(contracts))
         if len(q_contracts) == len(watchlist):
             assets = {}
             for qc in q_contracts:
-                id = AssetId(
+                id = self._registry.asset_id(AssetId(
                     code=qc.symbol,
                     asset_type=watchlist_dict[qc.symbol].asset_type,
                     currency=self._translator._currency_translation[qc.currency],
                     contract=qc,
-                )
+                ))
                 if id.asset_type == AssetType.Stock:
                     assets[id.code] = Stock(id)
                 elif id.asset_type == AssetType.ETF:
@@ -325,9 +347,9 @@ class IBDataAdapter(DataAdapter):
 
         return assets
 
-    def update_assets(self, assets: Dict[str, Asset]) -> Dict[str, Current]:
+    def update_assets(self, assets: Dict[str, Asset], max_staleness: float = None) -> Dict[str, Current]:
         contracts = [a.id.contract for a in assets.values()]
-        tickers = self._broker.reqTickers(*contracts)
+        tickers = self._ticker_cache.tickers(contracts, max_staleness)
         current_values = {}
         for t in tickers:
             c = Current(
@@ -346,11 +368,14 @@ class IBDataAdapter(DataAdapter):
             current_values[t.contract.symbol] = c
         return current_values
 
-    def get_price_history(self, a: Asset) -> None:
-        bars = self._broker.reqHistoricalData(
+    def get_price_history(self, a: Asset, start: datetime.date = None) -> History:
+        bars = self._requests.call(
+            "reqHistoricalData",
+            self._broker.reqHistoricalData,
             a.id.contract,
+            contracts=1,
             endDateTime="",
-            durationStr=str(HISTORICAL_YEARS) + " Y",
+            durationStr=history_duration(start),
             barSizeSetting="1 day",
             whatToShow="TRADES",
             useRTH=True,
@@ -358,11 +383,14 @@ class IBDataAdapter(DataAdapter):
         )
         return History(self._translator.translate_bars(a.id.code, bars))
 
-    def get_iv_history(self, a: Asset) -> None:
-        bars = self._broker.reqHistoricalData(
+    def get_iv_history(self, a: Asset, start: datetime.date = None) -> History:
+        bars = self._requests.call(
+            "reqHistoricalData",
+            self._broker.reqHistoricalData,
             a.id.contract,
+            contracts=1,
             endDateTime="",
-            durationStr=str(HISTORICAL_YEARS) + " Y",
+            durationStr=history_duration(start),
             barSizeSetting="1 day",
             whatToShow="OPTION_IMPLIED_VOLATILITY",
             useRTH=True,
@@ -370,12 +398,15 @@ class IBDataAdapter(DataAdapter):
         )
         return History(self._translator.translate_bars(a.id.code, bars))
 
-    def get_optionchain(self, asset: Asset, expiration: datetime.date) -> List[Option]:
-        chains = self._broker.reqSecDefOptParams(
+    def get_optionchain(self, asset: Asset, expiration: datetime.date) -> LazyOptionChain:
+        chains = self._requests.call(
+            "reqSecDefOptParams",
+            self._broker.reqSecDefOptParams,
             asset.id.contract.symbol,
             "",
             asset.id.contract.secType,
             asset.id.contract.conId,
+            contracts=1,
         )
 
         chain = next(
@@ -399,96 +430,114 @@ class IBDataAdapter(DataAdapter):
             rights = ["P", "C"]
 
             # Create the options contracts
-            contracts = [
-                IBOption(
-                    asset.id.contract.symbol,
-                    format_ib_date(expiration),
-                    strike,
-                    right,
-                    "SMART",
-                )
+            keys = [
+                (asset.id.contract.symbol, format_ib_date(expiration), strike, right)
                 for right in rights
                 # for expiration in expirations
                 for strike in strikes
             ]
-            q_contracts = []
+            # Contracts qualified in previous scans aren't qualified again
+            contracts = {k: IBOption(*k, "SMART") for k in keys if k not in self._qualified}
             # IB has a limit of 50 requests per second
-            for c in chunks(contracts, 50):
-                q_contracts += self._broker.qualifyContracts(*c)
-                self._broker.sleep(1)
-
-            tickers = []
-            # print("Contracts: {} Unqualified: {}".
-            #      format(len(contracts), len(contracts) - len(q_contracts)))
-
-            for q in chunks(q_contracts, 50):
-                tickers += self._broker.reqTickers(*q)
-                self._broker.sleep(1)
-
-            return self.create_options(asset, q_contracts)
+            for i, c in enumerate(chunks(list(contracts.values()), 50)):
+                if i:
+                    self._requests.pace("qualifyContracts", self._broker.sleep, 1)
+                self._requests.call("qualifyContracts", self._broker.qualifyContracts, *c, contracts=len(c))
+            # qualifyContracts fills in the conId of the contracts it qualifies
+            self._qualified.update({k: self._registry.contract(c) for k, c in contracts.items() if c.conId})
+
+            definitions = {}
+            for k in keys:
+                if k in self._qualified:
+                    right = self._translator._right_translation[k[3]]
+                    definitions[f"{float(k[2])}{right.value}"] = OptionDefinition(
+                        strike=float(k[2]), right=right, contract=self._qualified[k])
+
+            # Quotes are requested when the options are accessed
+            return LazyOptionChain(definitions,
+                                   lambda q_contracts: self.create_options(asset, q_contracts))
+
+    def _request_tickers(self, contracts: List[Contract]) -> list:
+        tickers = []
+        # IB has a limit of 50 requests per second
+        for i, c in enumerate(chunks(contracts, 50)):
+            if i:
+                self._requests.pace("reqTickers", self._broker.sleep, 1)
+            tickers += self._requests.call("reqTickers", self._broker.reqTickers, *c, contracts=len(c))
+        return tickers
 
     def create_options(
-            self, asset: Asset, q_contracts: List[Contract]
+            self, asset: Asset, q_contracts: List[Contract], max_staleness: float = OPTION_QUOTE_FRESHNESS
     ) -> Dict[str, Option]:
-        tickers = []
-        for q in chunks(q_contracts, 50):
-            tickers += self._broker.reqTickers(*q)
-            self._broker.sleep(1)
-        # options = []
+        tickers = self._ticker_cache.tickers(q_contracts, max_staleness)
         options = {}
         for t in tickers:
-            expiration = parse_ib_date(t.contract.lastTradeDateOrContractMonth)
-            strike = float(t.contract.strike)
-            right = RightType.Call if t.contract.right == "C" else RightType.Put
-            delta = gamma = theta = vega = None
-            option_price = (
-                implied_volatility
-            ) = underlying_price = underlying_dividends = None
-
-            if t.modelGreeks:
-                delta = t.modelGreeks.delta
-                gamma = t.modelGreeks.gamma
-                theta = t.modelGreeks.theta
-                vega = t.modelGreeks.vega
-                option_price = t.modelGreeks.optPrice
-                implied_volatility = t.modelGreeks.impliedVol
-                underlying_price = t.modelGreeks.undPrice
-                underlying_dividends = t.modelGreeks.pvDividend
-            opt_id = OptionId(
-                underlying_id=asset.id,
+            opt = self._create_option(asset.id, t)
+            options[f"{opt.id.strike}{opt.id.right.value}"] = opt
+        return options
+
+    def get_options(self, options: List[Option], max_staleness: float = OPTION_QUOTE_FRESHNESS) -> List[Option]:
+        # One paced batch for all the contracts, the fresh ones come from the cache
+        tickers = self._ticker_cache.tickers([o.id.contract for o in options], max_staleness)
+        tickers = {t.contract.conId: t for t in tickers}
+        return [self._create_option(o.id.underlying_id, tickers[o.id.contract.conId])
+                if o.id.contract.conId in tickers else None
+                for o in options]
+
+    def _create_option(self, underlying_id: AssetId, t: Ticker) -> Option:
+        delta = gamma = theta = vega = None
+        option_price = (
+            implied_volatility
+        ) = underlying_price = underlying_dividends = None
+
+        if t.modelGreeks:
+            delta = t.modelGreeks.delta
+            gamma = t.modelGreeks.gamma
+            theta = t.modelGreeks.theta
+            vega = t.modelGreeks.vega
+            option_price = t.modelGreeks.optPrice
+            implied_volatility = t.modelGreeks.impliedVol
+            underlying_price = t.modelGreeks.undPrice
+            underlying_dividends = t.modelGreeks.pvDividend
+        # The ids of the contracts already seen are reused
+        opt_id = self._registry.cached_option_id(t.contract.conId)
+        if opt_id is None:
+            opt_id = self._registry.option_id(OptionId(
+                underlying_id=underlying_id,
                 asset_type=AssetType.Option,
-                expiration=expiration,
-                strike=strike,
-                right=right,
-                multiplier=t.contract.multiplier,
+                expiration=parse_ib_date(t.contract.lastTradeDateOrContractMonth),
+                strike=float(t.contract.strike),
+                right=RightType.Call if t.contract.right == "C" else RightType.Put,
+                multiplier=int(t.contract.multiplier or 100),
                 contract=t.contract,
-            )
-            opt = Option(
-                id=opt_id,
-                high=t.high,
-                low=t.low,
-                close=t.close,
-                bid=t.bid if not t.bid == -1 else None,
-                bid_size=t.bidSize,
-                ask=t.ask if not t.ask == -1 else None,
-                ask_size=t.askSize,
-                last=t.last,
-                last_size=t.lastSize,
-                option_price=option_price,
-                volume=t.volume,
-                delta=delta,
-                gamma=gamma,
-                theta=theta,
-                vega=vega,
-                iv=implied_volatility,
-                underlying_price=underlying_price,
-                underlying_dividends=underlying_dividends,
-                time=t.time,
-            )
+            ))
+        return Option(
+            id=opt_id,
+            high=t.high,
+            low=t.low,
+            close=t.close,
+            bid=t.bid if not t.bid == -1 else None,
+            bid_size=t.bidSize,
+            ask=t.ask if not t.ask == -1 else None,
+            ask_size=t.askSize,
+            last=t.last,
+            last_size=t.lastSize,
+            option_price=option_price,
+            volume=t.volume,
+            delta=delta,
+            gamma=gamma,
+            theta=theta,
+            vega=vega,
+            iv=implied_volatility,
+            underlying_price=underlying_price,
+            underlying_dividends=underlying_dividends,
+            time=t.time,
+        )
 
-            # options.append(opt)
-            options[f"{strike}{right.value}"] = opt
-        return options
+
+# Action and ratio of the legs of each strategy type, in the order of the strategy legs
+# IB error codes of pacing violations and the request type they are accounted to
+_pacing_errors = {100: "messages", 162: "reqHistoricalData", 420: "reqTickers"}
 
 
 def chunks(l: list, n: int) -> list:
@@ -496,3 +545,13 @@ def chunks(l: list, n: int) -> list:
     for i in range(0, len(l), n):
         # Create an index range for l of n items:
         yield l[i: i + n]
+
+
+def history_duration(start: datetime.date = None) -> str:
+    """IB duration string covering from start (or the whole history) to today
+    """
+    if start:
+        days = (datetime.date.today() - start).days + 1
+        if days < 365:
+            return str(max(days, 1)) + " D"
+    return str(HISTORICAL_YEARS) + " Y"
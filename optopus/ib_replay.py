@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Recording and replay of IB sessions.
+
+RecordingIB wraps a connected ib_insync IB and writes every call made by the
+adapters, with its response, and every event to a gzipped pickle stream.
+ReplayIB serves a recording without TWS, at real speed (speed=1),
+accelerated (speed > 1) or as fast as possible (speed=None).
+"""
+import datetime
+import gzip
+import logging
+import pickle
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Iterator
+
+from ib_insync import Event
+
+from optopus.exceptions import RecordingExhaustedError
+
+RECORDING_VERSION = 1
+
+RECORDED_METHODS = (
+    'connect',
+    'disconnect',
+    'sleep',
+    'qualifyContracts',
+    'reqTickers',
+    'reqHistoricalData',
+    'reqSecDefOptParams',
+    'positions',
+    'accountValues',
+    'placeOrder',
+    'cancelOrder',
+    'openTrades',
+)
+
+RECORDED_EVENTS = (
+    'orderStatusEvent',
+    'positionEvent',
+    'accountValueEvent',
+    'execDetailsEvent',
+    'errorEvent',
+)
+
+CALL = 'call'
+EVENT = 'event'
+
+
+def _key(args: tuple, kwargs: dict) -> str:
+    return repr((args, sorted(kwargs.items())))
+
+
+class RecordingIB:
+    """IB stand-in forwarding to a real IB and recording the session
+    """
+
+    def __init__(self, ib, file_name: Path) -> None:
+        self._ib = ib
+        self._file = gzip.open(file_name, 'wb')
+        self._t0 = time.monotonic()
+        self._seq = 0
+        self._log = logging.getLogger(__name__)
+        self._dump({'version': RECORDING_VERSION, 'created': datetime.datetime.now()})
+        for name in RECORDED_EVENTS:
+            getattr(ib, name).connect(self._event_recorder(name))
+        self.client = _RecordingClient(self, ib.client)
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._ib, name)
+        if name in RECORDED_METHODS:
+            return self._call_recorder(name, attr)
+        return attr
+
+    def _call_recorder(self, name: str, method):
+        def call(*args, **kwargs):
+            key = _key(args, kwargs)
+            result = method(*args, **kwargs)
+            # args are recorded after the call, as qualifyContracts fills them
+            self.record(CALL, name, key, (args, result))
+            return result
+        return call
+
+    def timeRange(self, start: datetime.time, end: datetime.datetime, step: float) -> Iterator[datetime.datetime]:
+        for t in self._ib.timeRange(start, end, step):
+            self.record(CALL, 'timeRange', _key((), {}), ((), t))
+            yield t
+
+    def _event_recorder(self, name: str):
+        def emitted(*args):
+            self.record(EVENT, name, None, args)
+        return emitted
+
+    def record(self, kind: str, name: str, key: str, payload: Any) -> None:
+        self._seq += 1
+        self._dump((self._seq, time.monotonic() - self._t0, kind, name, key, payload))
+
+    def _dump(self, item: Any) -> None:
+        # Pickled whole first, a failure doesn't leave a partial record in the stream
+        try:
+            data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self._log.error('Failed to record IB item', exc_info=True)
+            return
+        self._file.write(data)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _RecordingClient:
+    def __init__(self, recorder: RecordingIB, client) -> None:
+        self._recorder = recorder
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def getReqId(self) -> int:
+        req_id = self._client.getReqId()
+        self._recorder.record(CALL, 'client.getReqId', _key((), {}), ((), req_id))
+        return req_id
+
+
+class ReplayIB:
+    """IB stand-in serving the responses of a recorded session.
+
+    Calls are matched by method and arguments, falling back to the next
+    recorded call of the same method. Events recorded before a served call
+    are emitted after it.
+    """
+
+    def __init__(self, file_name: Path, speed: float = None) -> None:
+        self._speed = speed
+        self._calls = defaultdict(deque)
+        self._calls_by_key = defaultdict(deque)
+        self._events = deque()
+        self._served = set()
+        self._total = 0
+        self._t0 = None
+        self._log = logging.getLogger(__name__)
+
+        for name in RECORDED_EVENTS:
+            setattr(self, name, Event(name))
+        self.client = _ReplayClient(self)
+
+        with gzip.open(file_name, 'rb') as file:
+            header = pickle.load(file)
+            if header.get('version') != RECORDING_VERSION:
+                raise ValueError('Unsupported recording version')
+            while True:
+                try:
+                    record = pickle.load(file)
+                except EOFError:
+                    break
+                seq, t, kind, name, key, payload = record
+                if kind == CALL:
+                    self._total += 1
+                    self._calls[name].append(record)
+                    self._calls_by_key[(name, key)].append(record)
+                else:
+                    self._events.append(record)
+
+    def __getattr__(self, name: str) -> Any:
+        if name in RECORDED_METHODS:
+            return lambda *args, **kwargs: self._serve(name, args, kwargs)
+        raise AttributeError(name)
+
+    def _next_record(self, name: str, key: str) -> tuple:
+        for queue in (self._calls_by_key[(name, key)], self._calls[name]):
+            while queue and queue[0][0] in self._served:
+                queue.popleft()
+            if queue:
+                record = queue.popleft()
+                self._served.add(record[0])
+                return record
+        raise RecordingExhaustedError(name)
+
+    def _serve(self, name: str, args: tuple, kwargs: dict) -> Any:
+        try:
+            record = self._next_record(name, _key(args, kwargs))
+        except RecordingExhaustedError:
+            if name in ('connect', 'disconnect', 'sleep'):
+                return None
+            raise
+        seq, t, _, _, _, (recorded_args, result) = record
+        self._wait(t)
+        if name == 'qualifyContracts':
+            # Qualification fills in the given contracts
+            for contract, recorded in zip(args, recorded_args):
+                # ib_insync contracts have slots, no __dict__
+                fields = recorded.dict() if hasattr(recorded, 'dict') else vars(recorded)
+                for field, value in fields.items():
+                    setattr(contract, field, value)
+        self._emit_events(seq)
+        return result
+
+    def _wait(self, t: float) -> None:
+        if self._t0 is None:
+            self._t0 = time.monotonic() - (t / self._speed if self._speed else 0)
+        if self._speed:
+            delay = self._t0 + t / self._speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _emit_events(self, seq: int) -> None:
+        while self._events and self._events[0][0] < seq:
+            _, t, _, name, _, args = self._events.popleft()
+            getattr(self, name).emit(*args)
+
+    def pending(self) -> int:
+        """Number of recorded calls not served yet
+        """
+        return self._total - len(self._served)
+
+    def timeRange(self, start: datetime.time, end: datetime.datetime, step: float) -> Iterator[datetime.datetime]:
+        """Iterates as many times as the recorded loop did
+        """
+        while True:
+            try:
+                yield self._serve('timeRange', (), {})
+            except RecordingExhaustedError:
+                return
+
+
+class _ReplayClient:
+    def __init__(self, replay: ReplayIB) -> None:
+        self._replay = replay
+        self._req_id = 0
+
+    def getReqId(self) -> int:
+        try:
+            return self._replay._serve('client.getReqId', (), {})
+        except RecordingExhaustedError:
+            self._req_id += 1
+            return self._req_id
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import logging
+import sys
+from pathlib import Path
+
+from optopus.settings import DATA_DIR, LOG_FILE
+
+FORMAT = "%(asctime)s — %(name)s — %(levelname)s — %(message)s"
+
+
+def setup_logging(path: Path = None, level: int = logging.INFO) -> logging.Logger:
+    """Logs the package to a weekly rotated file and to the console.
+
+    Nothing is configured on import, applications call it once at start.
+    Calling it again replaces the handlers it added before.
+    """
+    from logging.handlers import TimedRotatingFileHandler
+    path = Path(path) if path else Path.cwd() / DATA_DIR
+    path.mkdir(parents=True, exist_ok=True)
+
+    logger = logging.getLogger('optopus')
+    logger.setLevel(level)
+    for handler in [h for h in logger.handlers if getattr(h, '_optopus', False)]:
+        logger.removeHandler(handler)
+        handler.close()
+
+    # Create the Handler for logging data to a file
+    file_handler = TimedRotatingFileHandler(path / LOG_FILE, when='W4')
+    file_handler.setLevel(logging.DEBUG)
+
+    # Create the handler for logging data to console
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(logging.Formatter(FORMAT))
+        handler._optopus = True
+        logger.addHandler(handler)
+    logger.info('Completed configuring the logger')
+    return logger
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import gc
+import logging
+import sys
+import threading
+import tracemalloc
+import types
+from typing import Any, Dict, List, NamedTuple, Set
+
+# Objects not owned by the data they are referenced from
+_EXCLUDED = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType,
+             types.CodeType, types.FrameType, logging.Logger, threading.Thread)
+
+
+def deep_size(obj: Any, seen: Set[int] = None) -> int:
+    """Bytes of an object and of everything it references.
+
+    Functions, classes, modules and loggers aren't followed. Objects whose
+    id is in `seen` aren't counted again, so with a shared `seen` the
+    memory shared by several objects is counted once, for the first one.
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _EXCLUDED):
+            continue
+        seen.add(id(o))
+        if hasattr(o, 'memory_usage') and hasattr(o, 'index'):
+            # pandas objects, their values aren't reachable with get_referents
+            usage = o.memory_usage(deep=True)
+            size += int(usage.sum() if hasattr(usage, 'sum') else usage)
+            continue
+        size += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return size
+
+
+def footprint(data_manager: Any) -> Dict[str, Any]:
+    """Deep memory in bytes of the assets (per field), option chains, strategies and caches.
+
+    Memory shared by several items is counted once, for the first item
+    reported: the contracts shared by an asset and its options count in the
+    asset.
+    """
+    seen = set()
+    assets = {}
+    for code, a in getattr(data_manager, '_assets', {}).items():
+        fields = {f: deep_size(getattr(a, f), seen)
+                  for f in ('price_history', 'iv_history', 'measures', 'forecast', 'current')}
+        fields['id'] = deep_size(a.id, seen)
+        fields['total'] = sum(fields.values())
+        assets[code] = fields
+    chains = {f'{code} {expiration}': deep_size(chain, seen)
+              for (code, expiration), chain in list(data_manager.option_chains.items())}
+    strategies = {key: deep_size(s, seen) for key, s in data_manager.strategies.items()}
+    caches = {'reconciler': deep_size(data_manager._reconciler, seen)}
+    data_adapter = getattr(data_manager, '_da', None)
+    if data_adapter is not None:
+        for name, value in vars(data_adapter).items():
+            if not isinstance(value, _EXCLUDED) and name not in ('_broker', '_translator', '_log'):
+                caches[name.lstrip('_')] = deep_size(value, seen)
+    report = {'assets': assets, 'option_chains': chains, 'strategies': strategies, 'caches': caches}
+    report['total'] = (sum(a['total'] for a in assets.values()) + sum(chains.values())
+                       + sum(strategies.values()) + sum(caches.values()))
+    return report
+
+
+class Growth(NamedTuple):
+    location: str
+    size_diff: int
+    count_diff: int
+
+
+class AllocationTracker:
+    """Allocation growth between checks, to find leaks.
+
+    Tracing the allocations slows the process down, so it runs only
+    between `start` and `stop`.
+    """
+
+    def __init__(self, top: int = 10, frames: int = 1) -> None:
+        self._top = top
+        self._frames = frames
+        self._snapshot = None
+        self._growth = []
+        self._log = logging.getLogger(__name__)
+
+    @property
+    def tracking(self) -> bool:
+        return self._snapshot is not None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+        self._snapshot = self._take()
+        self._growth = []
+
+    def stop(self) -> None:
+        self._snapshot = None
+        tracemalloc.stop()
+
+    def _take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    def check(self) -> List[Growth]:
+        """Largest growths since the previous check, nothing when not tracking
+        """
+        if self._snapshot is None:
+            return []
+        snapshot = self._take()
+        stats = snapshot.compare_to(self._snapshot, 'lineno')
+        self._snapshot = snapshot
+        self._growth = [Growth(str(s.traceback), s.size_diff, s.count_diff)
+                        for s in stats[:self._top] if s.size_diff > 0]
+        total = sum(s.size_diff for s in stats)
+        self._log.debug(f'Allocations grew {total} bytes, top {self._growth[:3]}')
+        return self._growth
+
+    @property
+    def growth(self) -> List[Growth]:
+        return self._growth
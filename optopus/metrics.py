@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator
+
+import numpy as np
+
+# Sub-bucket bits of the histograms: values are kept with a precision of 1 / 2 ** (bits - 1)
+SUB_BUCKET_BITS = 7
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    """HDR-style histogram of durations with microsecond resolution.
+
+    Buckets are linear below 2 ** SUB_BUCKET_BITS microseconds and
+    log-linear above, so any duration up to hours is recorded in constant
+    time and memory with a relative error below 2%.
+    """
+
+    def __init__(self) -> None:
+        self._counts = np.zeros((64 - SUB_BUCKET_BITS + 2) << (SUB_BUCKET_BITS - 1), dtype=np.int64)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _index(value: int) -> int:
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @staticmethod
+    def _value(index: int) -> int:
+        """Highest value of a bucket
+        """
+        if index < 1 << SUB_BUCKET_BITS:
+            return index
+        shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+        return ((index - (shift << (SUB_BUCKET_BITS - 1)) + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        index = self._index(max(int(seconds * 1e6), 0))
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += seconds
+            if seconds > self._max:
+                self._max = seconds
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def quantile(self, q: float) -> float:
+        """Duration in seconds below which are a fraction q of the records
+        """
+        with self._lock:
+            if not self._count:
+                return float('nan')
+            cumulative = np.cumsum(self._counts)
+            index = int(np.searchsorted(cumulative, max(q * self._count, 1)))
+        return min(self._value(index) / 1e6, self._max)
+
+    def snapshot(self) -> Dict[str, float]:
+        summary = {'count': self._count,
+                   'sum': self._sum,
+                   'mean': self._sum / self._count if self._count else float('nan'),
+                   'max': self._max}
+        summary.update({f'p{q * 100:g}': self.quantile(q) for q in QUANTILES})
+        return summary
+
+
+class LoopMetrics:
+    """Latency histograms of the loop stages, exported to local files
+    """
+
+    def __init__(self) -> None:
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        h = self._histograms.get(name)
+        if h is None:
+            with self._lock:
+                h = self._histograms.setdefault(name, LatencyHistogram())
+        return h
+
+    def record(self, name: str, seconds: float) -> None:
+        self.histogram(name).record(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {name: h.snapshot() for name, h in sorted(self._histograms.items())}
+
+    def prometheus(self) -> str:
+        """Snapshot in the Prometheus text exposition format
+        """
+        lines = ['# HELP optopus_stage_seconds Duration of the loop stages',
+                 '# TYPE optopus_stage_seconds summary']
+        for name, s in self.snapshot().items():
+            for q in QUANTILES:
+                lines.append(f'optopus_stage_seconds{{stage="{name}",quantile="{q:g}"}} {s[f"p{q * 100:g}"]:.6f}')
+            lines.append(f'optopus_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+            lines.append(f'optopus_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: Path) -> None:
+        """Writes metrics.prom and metrics.json into a directory, replacing the previous ones
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        _write_atomic(path / 'metrics.prom', self.prometheus())
+        _write_atomic(path / 'metrics.json', json.dumps(self.snapshot(), indent=2))
+
+
+def _write_atomic(file_name: Path, content: str) -> None:
+    # Readers (the node exporter textfile collector) never see a partial file
+    tmp = file_name.with_suffix(file_name.suffix + '.tmp')
+    tmp.write_text(content)
+    os.replace(tmp, file_name)
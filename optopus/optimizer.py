@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Parallel parameter sweeps and walk-forward evaluation of the backtests.
+
+The panels are copied once into shared memory and every worker process maps
+them read-only, so the cost of a worker doesn't grow with the universe. Each
+configuration is evaluated on the walk-forward folds in order and abandoned
+as soon as its train P&L shows it is hopeless.
+"""
+import csv
+import itertools
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+from optopus.backtest import Panels, CreditSpreadParameters, backtest_credit_spreads
+from optopus.computation import panel_percentile
+from optopus.settings import HISTORICAL_YEARS
+
+LOOKBACK = HISTORICAL_YEARS * 252
+SHARED_ARRAYS = ('close', 'volume', 'iv', 'iv_low', 'iv_percentile', 'dates')
+METRICS = ('pnl', 'trades', 'win_rate')
+# Columns of the sweep results, in the order of the results file
+RESULT_FIELDS = (('config', 'fold') + CreditSpreadParameters._fields + tuple('train_' + m for m in METRICS)
+                 + tuple('test_' + m for m in METRICS) + ('stopped',))
+
+_panels = None
+_shared = []
+
+
+class Split(NamedTuple):
+    train_start: int
+    train_end: int
+    test_end: int
+
+
+def grid(base: CreditSpreadParameters = CreditSpreadParameters(),
+         **values: Iterable) -> List[CreditSpreadParameters]:
+    """Every combination of the given parameter values
+    """
+    names = list(values)
+    return [base._replace(**dict(zip(names, combination)))
+            for combination in itertools.product(*values.values())]
+
+
+def random_search(n: int, base: CreditSpreadParameters = CreditSpreadParameters(),
+                  seed: int = None, **ranges) -> List[CreditSpreadParameters]:
+    """n random configurations. A range is a (low, high) tuple or a list of choices
+    """
+    rnd = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        values = {}
+        for name, r in ranges.items():
+            if isinstance(r, tuple):
+                low, high = r
+                values[name] = rnd.randint(low, high) if isinstance(low, int) else rnd.uniform(low, high)
+            else:
+                values[name] = rnd.choice(r)
+        configs.append(base._replace(**values))
+    return configs
+
+
+def walk_forward_splits(n_dates: int, train: int, test: int, step: int = None,
+                        start: int = LOOKBACK) -> List[Split]:
+    """Rolling train/test windows over the date rows, after the measures lookback
+    """
+    step = step or test
+    splits = []
+    train_start = start
+    while train_start + train + test <= n_dates:
+        splits.append(Split(train_start, train_start + train, train_start + train + test))
+        train_start += step
+    return splits
+
+
+def evaluate(panels: Panels, params: CreditSpreadParameters, start: int, end: int) -> Dict[str, float]:
+    """Backtest of the trades entered between two date rows
+    """
+    # The measures need the previous rows, only one with a precomputed IV percentile
+    lookback = 1 if panels.iv_percentile is not None else LOOKBACK
+    window = Panels(*(a[max(0, start - lookback):end] if isinstance(a, np.ndarray) else a
+                      for a in panels))
+    trades = backtest_credit_spreads(window, params).trades
+    trades = trades[trades['entry_date'] >= panels.dates[start]]
+    return {
+        'pnl': float(trades['pnl'].sum()),
+        'trades': len(trades),
+        'win_rate': float((trades['pnl'] > 0).mean()) if len(trades) else np.nan,
+    }
+
+
+def _share(panels: Panels) -> Tuple[list, dict]:
+    blocks = []
+    layout = {}
+    for name in SHARED_ARRAYS:
+        array = getattr(panels, name)
+        if name == 'dates':
+            array = array.astype('datetime64[D]').view('i8')
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        blocks.append(shm)
+        layout[name] = (shm.name, array.shape, array.dtype.str)
+    layout['codes'] = list(panels.codes)
+    return blocks, layout
+
+
+def _attach(layout: dict) -> None:
+    """Worker initializer mapping the shared panels
+    """
+    global _panels
+    arrays = {}
+    for name in SHARED_ARRAYS:
+        shm_name, shape, dtype = layout[name]
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared.append(shm)
+        array = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+    _panels = Panels(arrays['dates'].view('datetime64[D]'), layout['codes'], arrays['close'],
+                     arrays['volume'], arrays['iv'], arrays['iv_low'], arrays['iv_percentile'])
+
+
+def _run(config_id: int, params: CreditSpreadParameters, splits: List[Split],
+         stop_below: float) -> List[dict]:
+    rows = []
+    train_pnl = 0.0
+    for fold, split in enumerate(splits):
+        train = evaluate(_panels, params, split.train_start, split.train_end)
+        test = evaluate(_panels, params, split.train_end, split.test_end)
+        rows.append(dict(config=config_id, fold=fold, **params._asdict(),
+                         **{'train_' + k: v for k, v in train.items()},
+                         **{'test_' + k: v for k, v in test.items()}, stopped=False))
+        train_pnl += train['pnl']
+        # Hopeless configuration: its mean train P&L per fold is below the limit
+        if stop_below is not None and train_pnl / (fold + 1) < stop_below:
+            rows[-1]['stopped'] = True
+            break
+    return rows
+
+
+def sweep(panels: Panels,
+          configs: List[CreditSpreadParameters],
+          splits: List[Split],
+          workers: int = None,
+          stop_below: float = None,
+          results_file: Path = None) -> pd.DataFrame:
+    """Evaluates every configuration on every split in a process pool.
+
+    Rows are streamed to results_file (CSV) as configurations finish.
+    """
+    log = logging.getLogger(__name__)
+    workers = workers or os.cpu_count()
+    if panels.iv_percentile is None:
+        panels = panels._replace(iv_percentile=panel_percentile(panels.iv_low, panels.iv, LOOKBACK))
+    blocks, layout = _share(panels)
+    rows = []
+    file = open(results_file, 'w', newline='') if results_file else None
+    try:
+        if file:
+            writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(layout,)) as pool:
+            futures = [pool.submit(_run, i, c, splits, stop_below) for i, c in enumerate(configs)]
+            for future in as_completed(futures):
+                result = future.result()
+                rows += result
+                if file:
+                    writer.writerows(result)
+                    file.flush()
+        log.info(f'Swept {len(configs)} configurations on {len(splits)} splits')
+    finally:
+        if file:
+            file.close()
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    results = pd.DataFrame(rows, columns=RESULT_FIELDS)
+    # Every row has the flag, the cast only types the column of an empty sweep
+    results['stopped'] = results['stopped'].astype(bool)
+    return results.sort_values(['config', 'fold']).reset_index(drop=True)
+
+
+def walk_forward(results: pd.DataFrame) -> pd.DataFrame:
+    """Out-of-sample result of choosing, in every fold, the best train configuration
+    """
+    best = results.loc[results.groupby('fold')['train_pnl'].idxmax()]
+    return best[['fold', 'config', 'train_pnl', 'test_pnl', 'test_trades']].reset_index(drop=True)
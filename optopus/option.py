@@ -4,7 +4,7 @@ from enum import Enum
 from typing import Any
 
 from optopus.asset import AssetId
-from optopus.common import AssetType
+from optopus.common import AssetType, cached_hash, uncached_state
 
 
 class RightType(Enum):
@@ -29,6 +29,12 @@ class OptionId:
     multiplier: int
     contract: Any
 
+    def __hash__(self):
+        return cached_hash(self)
+
+    def __getstate__(self):
+        return uncached_state(self)
+
 
 @dataclass(frozen=True)
 class Option:
@@ -63,3 +69,12 @@ class Option:
     @property
     def DTE(self):
         return (self.id.expiration - datetime.date.today()).days
+
+
+def option_key(option: Option) -> Any:
+    """Identifies the contract of an option: its conId, or its terms without contract
+    """
+    contract = option.id.contract
+    if contract is not None and getattr(contract, 'conId', 0):
+        return contract.conId
+    return (option.id.underlying_id.code, option.id.expiration, option.id.strike, option.id.right)
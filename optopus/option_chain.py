@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import time
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from optopus.option import Option, RightType
+from optopus.settings import OPTION_QUOTE_FRESHNESS
+
+
+class OptionDefinition(NamedTuple):
+    strike: float
+    right: RightType
+    contract: Any
+
+
+class LazyOptionChain(Mapping):
+    """Option chain holding the qualified contracts, whose quotes are
+    requested only when an option is accessed.
+
+    Options are keyed by f"{strike}{right}". A quote is not requested again
+    while it is fresher than `freshness` seconds. An option of the chain
+    without a ticker from the broker is None.
+    """
+
+    def __init__(self,
+                 definitions: Dict[str, OptionDefinition],
+                 fetch: Callable[[List[Any]], Dict[str, Option]],
+                 freshness: float = OPTION_QUOTE_FRESHNESS) -> None:
+        self._definitions = definitions
+        self._fetch = fetch
+        self._freshness = freshness
+        self._options = {}
+        self._loaded = {}
+
+    def __getitem__(self, key: str) -> Optional[Option]:
+        if key not in self._definitions:
+            raise KeyError(key)
+        self.load([key])
+        return self._options.get(key)
+
+    def __iter__(self):
+        return iter(self._definitions)
+
+    def __len__(self) -> int:
+        return len(self._definitions)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._definitions
+
+    @property
+    def definitions(self) -> Dict[str, OptionDefinition]:
+        return self._definitions
+
+    def load(self, keys: Iterable[str]) -> None:
+        """Requests in one batch the quotes of the keys that aren't fresh
+        """
+        now = time.monotonic()
+        stale = [k for k in keys
+                 if k in self._definitions
+                 and (k not in self._loaded or now - self._loaded[k] > self._freshness)]
+        if not stale:
+            return
+        options = self._fetch([self._definitions[k].contract for k in stale])
+        for k in stale:
+            self._loaded[k] = now
+            if k in options:
+                self._options[k] = options[k]
+
+    def values(self) -> List[Option]:
+        self.load(self._definitions)
+        return [self._options[k] for k in self._definitions if k in self._options]
+
+    def items(self) -> List[tuple]:
+        self.load(self._definitions)
+        return [(k, self._options[k]) for k in self._definitions if k in self._options]
+
+    def select(self, right: RightType, min_strike: float = None, max_strike: float = None) -> List[Option]:
+        """Returns the options of a right between two strikes, sorted by strike
+        """
+        keys = [k for k, d in self._definitions.items()
+                if d.right == right
+                and (min_strike is None or d.strike >= min_strike)
+                and (max_strike is None or d.strike <= max_strike)]
+        return self._sorted_options(keys)
+
+    def nearest(self, price: float, right: RightType, count: int) -> List[Option]:
+        """Returns the `count` options of a right nearest to the price, sorted by strike
+        """
+        keys = sorted((k for k, d in self._definitions.items() if d.right == right),
+                      key=lambda k: abs(self._definitions[k].strike - price))[:count]
+        return self._sorted_options(keys)
+
+    def chain(self, right: RightType = None, min_strike: float = None, max_strike: float = None) -> 'OptionChain':
+        """Columnar chain with the quotes of the options of a right between two strikes
+        """
+        from optopus.columnar_chain import OptionChain
+        if right is None:
+            options = self.values()
+        else:
+            options = self.select(right, min_strike, max_strike)
+        return OptionChain.from_options(options)
+
+    def _sorted_options(self, keys: List[str]) -> List[Option]:
+        self.load(keys)
+        keys = sorted((k for k in keys if k in self._options),
+                      key=lambda k: self._definitions[k].strike)
+        return [self._options[k] for k in keys]
+
+
+def __getattr__(name):
+    # The columnar chain needs NumPy and pandas, it's only loaded when it's used
+    if name in ('OptionChain', 'OptionRow', 'QUOTE_FIELDS'):
+        from optopus import columnar_chain
+        return getattr(columnar_chain, name)
+    raise AttributeError(f"module 'optopus.option_chain' has no attribute '{name}'")
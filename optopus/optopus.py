@@ -7,20 +7,42 @@ Created on Sat Aug  4 16:30:25 2018
 """
 import datetime
 import logging
-from typing import List, Callable, Dict, Tuple
+from pathlib import Path
+from typing import Any, List, Callable, Dict, Tuple
 
 from optopus.asset import Asset, AssetType
 from optopus.data_manager import DataManager
 from optopus.data_objects import Account, Portfolio
+from optopus.exit_rules import ExitEngine, ExitIntent, ExitRule, dte_rule, short_delta_rule
 from optopus.option import Option
+from optopus.memory import AllocationTracker, Growth, footprint
+from optopus.order_book import OrderRecord
 from optopus.order_manager import OrderManager
+from optopus.profiler import LoopProfiler
+from optopus.request_stats import RequestStats
+from optopus.risk import RiskEngine
+from optopus.scheduler import LoopScheduler, Stage, StageStats
 from optopus.settings import (
-    SLEEP_LOOP,
+    DATA_DIR,
     EXPIRATIONS,
-    PRESERVED_CASH_FACTOR,
-    MAXIMUM_RISK_FACTOR,
+    EXIT_DTE,
+    EXIT_SHORT_DELTA,
+    LOOP_TICK,
+    LOOP_WORKERS,
+    QUOTES_CADENCE,
+    STRATEGY_OPTIONS_CADENCE,
+    POSITIONS_CADENCE,
+    HISTORY_CADENCE,
+    METRICS_CADENCE,
+    METRICS_DIR,
+    MEMORY_CHECK_CADENCE,
+    TRACE_DIR,
+    TRACE_EXPORT_CADENCE,
+    PROFILE_CHECK_CADENCE,
+    SLEEP_LOOP,
 )
 from optopus.strategy import Strategy
+from optopus.tracing import TRACER, Span
 from optopus.watch_list import WATCH_LIST
 
 
@@ -30,24 +52,50 @@ class Optopus:
     def __init__(self, broker) -> None:
         self._broker = broker
         self._algorithms = []
+        self._exit_handlers = []
         self._log = logging.getLogger(__name__)
 
+        self._scheduler = LoopScheduler(workers=LOOP_WORKERS, pass_budget=SLEEP_LOOP)
+        self._scheduler.add(Stage('quotes', lambda: self._data_manager.update_assets(),
+                                  cadence=QUOTES_CADENCE))
+        self._scheduler.add(Stage('history', self._update_history, cadence=HISTORY_CADENCE))
+        self._scheduler.add(Stage('strategy_options', self._update_strategy_options,
+                                  cadence=STRATEGY_OPTIONS_CADENCE))
+        self._scheduler.add(Stage('positions', lambda: self._data_manager.check_strategy_positions(),
+                                  cadence=POSITIONS_CADENCE))
+        self._scheduler.add(Stage('compute', lambda: self._data_manager.compute(),
+                                  depends=('quotes', 'history')))
+        self._exits = ExitEngine((dte_rule(EXIT_DTE), short_delta_rule(EXIT_SHORT_DELTA)))
+        self._scheduler.add(Stage('exits', self._evaluate_exits, depends=('strategy_options',)))
+        self._scheduler.add(Stage('metrics', self.export_loop_metrics, cadence=METRICS_CADENCE))
+        self._profiler = LoopProfiler()
+        self._scheduler.add(Stage('profiler', self._profiler.check_flag, cadence=PROFILE_CHECK_CADENCE))
+        self._allocations = AllocationTracker()
+        self._scheduler.add(Stage('memory', self._allocations.check, cadence=MEMORY_CHECK_CADENCE))
+        self._scheduler.add(Stage('traces', self.export_traces, cadence=TRACE_EXPORT_CADENCE))
+
     def start(self) -> None:
         self._data_manager = DataManager(self._broker._data_adapter, WATCH_LIST)
-        self._order_manager = OrderManager(self._broker, self._data_manager)
+        self._risk = RiskEngine()
+        for key, strategy in self._data_manager.strategies.items():
+            if not strategy.closed:
+                self._risk.add_strategy(key, strategy)
+        self._order_manager = OrderManager(self._broker, self._data_manager, self._risk)
 
         # Events
-        # self._broker.emit_account_item_event = self._data_manager._account_item
-        # self._broker.emit_position_event = self._data_manager._position
+        self._broker.emit_account_item_event = self._account_item
+        self._broker.emit_position_event = self._data_manager._position
         # self._broker.emit_new_order = self._new_order
         self._broker.emit_order_status = self._order_manager.order_status_changed
         # self._broker.emit_commission_report = self._data_manager._commission_report
+        self._profiler.install_signal()
 
         self._log.debug("Connecting to IB broker")
         self._broker.connect()
         self._broker.sleep(1)
 
         self._data_manager.update_account()
+        self._risk.load_account(self._data_manager.account)
 
         self._log.debug("Retrieving underling data")
         self._data_manager.create_assets()
@@ -59,6 +107,7 @@ class Optopus:
 
         self._data_manager.update_strategy_options()
         self._data_manager.check_strategy_positions()
+        self._exits.sync(self._data_manager.strategies)
 
         self._log.info("System started")
 
@@ -86,7 +135,90 @@ class Optopus:
     def strategies(self) -> Dict[str, Strategy]:
         return self._data_manager.strategies
 
+    def _account_item(self, name: str, value: float) -> None:
+        self._data_manager._account_item(name, value)
+        self._risk.update_account(name, value)
+
+    def _update_strategy_options(self) -> None:
+        options = self._data_manager.update_strategy_options()
+        self._risk.sync(self._data_manager.strategies)
+        self._exits.sync(self._data_manager.strategies)
+        self._exits.update_quotes(options)
+
+    def _evaluate_exits(self) -> None:
+        for intent in self._exits.evaluate():
+            for handler in self._exit_handlers:
+                handler(intent)
+
+    @property
+    def risk(self) -> RiskEngine:
+        return self._risk
+
+    def _update_history(self) -> None:
+        self._data_manager.update_historical_assets()
+        self._data_manager.update_historical_IV_assets()
+
+    def loop_stats(self) -> Dict[str, StageStats]:
+        return self._scheduler.stats()
+
+    def loop_metrics(self) -> Dict[str, Dict[str, float]]:
+        """Latency summary (count, mean, max, p50, p90, p99, p99.9) of each stage and of the whole pass
+        """
+        return self._scheduler.metrics.snapshot()
+
+    def export_loop_metrics(self, path: Path = None) -> None:
+        """Writes the loop metrics as a Prometheus text file and a JSON snapshot
+        """
+        self._scheduler.metrics.export(path if path else Path.cwd() / DATA_DIR / METRICS_DIR)
+
+    def ticker_cache_stats(self) -> Dict[str, float]:
+        return self._broker._data_adapter.ticker_cache_stats()
+
+    def request_stats(self, minutes: int = None) -> Dict[str, RequestStats]:
+        """Broker requests of each type over the last minutes
+        """
+        return self._broker.requests.summary(minutes)
+
+    def request_stats_per_minute(self) -> List[Tuple[datetime.datetime, str, RequestStats]]:
+        return self._broker.requests.per_minute()
+
+    def profile(self, iterations: int = None) -> None:
+        """Profiles the next loop passes, the output is written into DATA_DIR
+        """
+        self._profiler.request(iterations)
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Deep memory in bytes of every asset field, option chain, strategy and cache
+        """
+        return footprint(self._data_manager)
+
+    def track_allocations(self, enabled: bool = True) -> None:
+        """Traces the allocations to report their growth between memory checks of the loop
+        """
+        if enabled and not self._allocations.tracking:
+            self._allocations.start()
+        elif not enabled and self._allocations.tracking:
+            self._allocations.stop()
+
+    def allocation_growth(self) -> List[Growth]:
+        """Largest allocation growths between the last two memory checks
+        """
+        return self._allocations.growth
+
+    def traces(self, trace_id: int = None) -> List[Span]:
+        """Recent tick-to-order spans, of every trace or of one
+        """
+        return TRACER.spans(trace_id)
+
+    def export_traces(self, path: Path = None) -> None:
+        """Appends the new spans to the JSON lines file of the day
+        """
+        path = path if path else Path.cwd() / DATA_DIR / TRACE_DIR
+        TRACER.export(path / f'spans-{datetime.date.today():%Y%m%d}.jsonl')
+
     def stop(self) -> None:
+        self._scheduler.shutdown()
+        self._data_manager.close()
         self._broker.disconnect()
 
     def pause(self, time: float) -> None:
@@ -95,18 +227,11 @@ class Optopus:
     def loop(self) -> None:
 
         for t in self._broker._broker.timeRange(
-                datetime.time(0, 0), datetime.datetime(2100, 1, 1, 0), 10
+                datetime.time(0, 0), datetime.datetime(2100, 1, 1, 0), LOOP_TICK
         ):
-            self._log.debug("Initiating loop iteration")
-            self._data_manager.update_assets()
-            self._data_manager.update_strategy_options()
-            self._data_manager.check_strategy_positions()
-            # FIXME: Compute must be before check_strategy?
-            self._data_manager.compute()
-
-            for algorithm in self._algorithms:
-                algorithm()
-            self._broker.sleep(SLEEP_LOOP)
+            self._profiler.start_pass()
+            self._scheduler.run_pending(t.timestamp())
+            self._profiler.end_pass()
 
     def series(self, code: str, item: str) -> Tuple:
         if item == "time":
@@ -160,11 +285,29 @@ class Optopus:
         # return self._data_manager._assets[code]._option_chain
 
     def register_algorithm(self, algo: Callable[[], None]) -> None:
+        """The algorithm runs as soon as quotes, measures, strategy options and positions are fresh
+        """
         self._algorithms.append(algo)
+        self._scheduler.add(Stage(f'algorithm_{len(self._algorithms)}', algo,
+                                  depends=('compute', 'strategy_options', 'positions')))
+
+    def register_exit_rule(self, rule: ExitRule) -> None:
+        self._exits.add_rule(rule)
 
-    def new_strategy(self, strategy: Strategy) -> None:
-        self._data_manager.add_strategy(strategy)
-        self._order_manager.new_strategy(strategy)
+    def register_exit_handler(self, handler: Callable[[ExitIntent], None]) -> None:
+        """The handler receives the close intent of each open strategy matching an exit rule
+        """
+        self._exit_handlers.append(handler)
+
+    def new_strategy(self, strategy: Strategy) -> List[OrderRecord]:
+        return self._order_manager.new_strategy(strategy)
+
+    def orders(self, strategy_id: str = None) -> List[OrderRecord]:
+        """Orders of a strategy, or the open orders
+        """
+        if strategy_id:
+            return self._order_manager.orders.strategy_orders(strategy_id)
+        return self._order_manager.orders.open_orders()
 
     def expiration_target(self) -> datetime.date:
         for expiration in EXPIRATIONS:
@@ -173,10 +316,4 @@ class Optopus:
                 return expiration
 
     def maximum_risk_per_trade(self) -> float:
-        account = self.account
-        preserved_cash = account.net_liquidation * PRESERVED_CASH_FACTOR
-        available_cash = account.cash - preserved_cash
-
-        maximum_risk = account.net_liquidation * MAXIMUM_RISK_FACTOR
-
-        return min(maximum_risk, available_cash)
+        return self._risk.maximum_risk
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Iterable, List, NamedTuple
+
+from optopus.data_objects import OrderStatus, OwnershipType, Trade
+
+PARENT = 'parent'
+TAKE_PROFIT = 'take_profit'
+STOP_LOSS = 'stop_loss'
+
+_ref_suffixes = {PARENT: '', TAKE_PROFIT: '_TP', STOP_LOSS: '_SL'}
+
+
+class Bracket(NamedTuple):
+    """Entry order of a strategy with its take profit and stop loss children.
+
+    The prices are of the whole combo, a credit is negative. The children
+    are optional.
+    """
+    strategy_id: str
+    ownership: OwnershipType
+    quantity: int
+    entry_price: float
+    take_profit_price: float = None
+    stop_loss_price: float = None
+
+    def order_ref(self, role: str) -> str:
+        return self.strategy_id + _ref_suffixes[role]
+
+    @property
+    def roles(self) -> List[str]:
+        return [PARENT] + [role for role, price in ((TAKE_PROFIT, self.take_profit_price),
+                                                    (STOP_LOSS, self.stop_loss_price))
+                           if price is not None]
+
+
+class OrderState(Enum):
+    Created = 0
+    # Sent, not yet acknowledged by the broker
+    Submitted = 1
+    # Acknowledged, working or partially filled
+    Working = 2
+    Filled = 3
+    Cancelled = 4
+    Inactive = 5
+
+
+TERMINAL_STATES = (OrderState.Filled, OrderState.Cancelled, OrderState.Inactive)
+
+_state_translation = {
+    OrderStatus.APIPending: OrderState.Submitted,
+    OrderStatus.PendingSubmit: OrderState.Submitted,
+    OrderStatus.PreSubmitted: OrderState.Working,
+    OrderStatus.Submitted: OrderState.Working,
+    OrderStatus.PendingCancel: OrderState.Working,
+    OrderStatus.APICancelled: OrderState.Cancelled,
+    OrderStatus.Cancelled: OrderState.Cancelled,
+    OrderStatus.Filled: OrderState.Filled,
+    OrderStatus.Inactive: OrderState.Inactive,
+}
+
+
+@dataclass
+class OrderRecord:
+    order_ref: str
+    strategy_id: str
+    role: str
+    quantity: int
+    state: OrderState = OrderState.Created
+    remaining: float = None
+    commission: float = None
+    submitted: datetime.datetime = None
+    acknowledged: datetime.datetime = None
+    completed: datetime.datetime = None
+
+
+class OrderBook:
+    """State machine of the orders, indexed by orderRef.
+
+    Orders only move forward: Created, Submitted, Working and then one of
+    the terminal states. Late or repeated status events are ignored.
+    """
+
+    def __init__(self) -> None:
+        self._orders = {}
+        self._strategies = {}
+        self._log = logging.getLogger(__name__)
+
+    def add(self, bracket: Bracket) -> List[OrderRecord]:
+        records = [OrderRecord(bracket.order_ref(role), bracket.strategy_id, role, bracket.quantity,
+                               remaining=bracket.quantity)
+                   for role in bracket.roles]
+        for r in records:
+            self._orders[r.order_ref] = r
+        self._strategies.setdefault(bracket.strategy_id, []).extend(r.order_ref for r in records)
+        return records
+
+    def remove(self, strategy_id: str) -> None:
+        """Forgets the orders of a strategy
+        """
+        for ref in self._strategies.pop(strategy_id, []):
+            self._orders.pop(ref, None)
+
+    def submitted(self, records: Iterable[OrderRecord], time: datetime.datetime = None) -> None:
+        time = time or datetime.datetime.now()
+        for r in records:
+            if r.state == OrderState.Created:
+                r.state = OrderState.Submitted
+                r.submitted = time
+
+    def update(self, trade: Trade, time: datetime.datetime = None) -> OrderRecord:
+        """Applies a status event, returns the record if its state changed
+        """
+        record = self._orders.get(trade.order_id)
+        if record is None:
+            return None
+        state = _state_translation[trade.status]
+        if state == OrderState.Filled and trade.remaining:
+            # Partially filled
+            state = OrderState.Working
+        record.remaining = trade.remaining
+        if trade.commission is not None:
+            record.commission = trade.commission
+        if record.state in TERMINAL_STATES or state.value <= record.state.value:
+            return None
+        time = time or datetime.datetime.now()
+        if state.value >= OrderState.Working.value and record.acknowledged is None:
+            record.acknowledged = time
+        if state in TERMINAL_STATES:
+            record.completed = time
+        self._log.debug(f'Order {record.order_ref} {record.state.name} -> {state.name}')
+        record.state = state
+        return record
+
+    def get(self, order_ref: str) -> OrderRecord:
+        return self._orders.get(order_ref)
+
+    def strategy_orders(self, strategy_id: str) -> List[OrderRecord]:
+        return [self._orders[ref] for ref in self._strategies.get(strategy_id, [])]
+
+    def open_orders(self) -> List[OrderRecord]:
+        return [r for r in self._orders.values() if r.state not in TERMINAL_STATES]
+
+    def orders(self) -> Dict[str, OrderRecord]:
+        return dict(self._orders)
@@ -1,32 +1,96 @@
 # -*- coding: utf-8 -*-
 import logging
+from typing import List
 
+from optopus.common import OwnershipType
 from optopus.data_manager import DataManager
-from optopus.data_objects import (OrderStatus)
-from optopus.strategy import Strategy
+from optopus.order_book import Bracket, OrderBook, OrderRecord, OrderState
+from optopus.risk import RiskEngine
+from optopus.settings import MAXIMUM_STRATEGY_QUANTITY, STOP_LOSS_FACTOR
+from optopus.strategy import DefinedStrategy
+from optopus.tracing import TRACER, traced
 
 
 class OrderManager():
-    def __init__(self, broker, data_manager: DataManager) -> None:
+    def __init__(self, broker, data_manager: DataManager, risk: RiskEngine = None) -> None:
         self._broker = broker
         self._data_manager = data_manager
+        self._risk = risk or RiskEngine()
+        self._orders = OrderBook()
         self._log = logging.getLogger(__name__)
 
+    @property
+    def orders(self) -> OrderBook:
+        return self._orders
+
     def order_status_changed(self, trade) -> None:
-        if trade.status == OrderStatus.Filled and trade.remaining == 0:
-            self._log.info(f'Order filled (remaining {trade.remaining}): {trade.order_id}')
+        trace_id = TRACER.untag(trade.order_id)
+        if trace_id is not None:
+            TRACER.mark('order_ack', trace_id)
+        record = self._orders.update(trade)
+        if record is None:
+            return
+        if record.state == OrderState.Filled:
+            self._log.info(f'Order filled: {record.order_ref}')
+        elif record.state in (OrderState.Cancelled, OrderState.Inactive):
+            self._log.warning(f'Order {record.state.name.lower()}: {record.order_ref}')
+        else:
+            self._log.debug(f'Order status changed {record.order_ref} : {record.state.name}')
+
+    @traced('new_strategy')
+    def new_strategy(self, strategy: DefinedStrategy) -> List[OrderRecord]:
+        """Sizes a new strategy within the risk limits and submits its bracket.
+
+        It returns the orders as soon as they are sent, nothing when the
+        strategy isn't allowed. Their acknowledgements and fills update the
+        order book from the order status events.
+        """
+        if not self._size_strategy(strategy):
+            return []
+        # The order ack closes the trace of the data the strategy comes from
+        TRACER.tag(strategy.strategy_id)
+        bracket = self._bracket(strategy)
+        # The records are there before the orders, for their first status events
+        records = self._orders.add(bracket)
+        try:
+            self._broker.open_strategy(strategy, bracket)
+        except Exception:
+            # Nothing is kept of a strategy the broker didn't take
+            self._orders.remove(strategy.strategy_id)
+            raise
+        self._orders.submitted(records)
+        # Kept with the strategy, the exit rules measure the gains from it
+        strategy.opening_price = bracket.entry_price
+        self._data_manager.add_strategy(strategy)
+        self._risk.add_strategy(strategy.strategy_id, strategy)
+        self._log.info(f'Strategy submitted {strategy.strategy_id}: entry {bracket.entry_price}, '
+                       f'take profit {bracket.take_profit_price}, stop loss {bracket.stop_loss_price}')
+        return records
+
+    def _size_strategy(self, strategy: DefinedStrategy) -> bool:
+        quantity = self._risk.size(strategy, MAXIMUM_STRATEGY_QUANTITY)
+        if quantity < 1:
+            return False
+        strategy.quantity = quantity
+        return True
+
+    def _bracket(self, strategy: DefinedStrategy) -> Bracket:
+        entry_price = strategy.entry_price
+        ownership = strategy.strategy.ownership
+        return Bracket(strategy_id=strategy.strategy_id,
+                       ownership=ownership,
+                       quantity=strategy.quantity,
+                       entry_price=entry_price,
+                       take_profit_price=getattr(strategy, 'profit_price', None),
+                       stop_loss_price=stop_loss_price(entry_price, ownership))
 
-        self._log.debug(f'Order status changed {trade.order_id} : {trade.status.value}')
 
-    def new_strategy(self, strategy: Strategy) -> None:
-        # self._price_strategy(strategy)
-        self._size_strategy(strategy)
-        self._data_manager.update_strategy(strategy)
-        print(str(strategy))
-        self._broker.open_strategy(strategy)
+def stop_loss_price(entry_price: float, ownership: OwnershipType, factor: float = STOP_LOSS_FACTOR) -> float:
+    """Price losing (factor - 1) times the entry amount, below the entry of a bought combo, above a sold one.
 
-    def _size_strategy(self, strategy: Strategy) -> None:
-        strategy.quantity = 1
+    A credit entry of -0.40 bought stops at -0.80, a debit of 1.00 sold at 2.00.
+    """
+    return round(entry_price - ownership.value * abs(entry_price) * (factor - 1), 2)
 
     # def _price_strategy(self, strategy: Strategy) -> None:
     #    for leg in strategy.legs.values():
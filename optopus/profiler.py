@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import collections
+import cProfile
+import datetime
+import logging
+import pstats
+import signal
+import sys
+import threading
+from pathlib import Path
+from typing import Optional
+
+from optopus.settings import (DATA_DIR, PROFILE_DIR, PROFILE_FLAG, PROFILE_ITERATIONS,
+                              PROFILE_SAMPLE_INTERVAL)
+
+
+class LoopProfiler:
+    """Profiles the next loop passes on demand, without stopping the loop.
+
+    A profile is requested by a signal, a flag file or `request`. The next
+    `iterations` passes run under cProfile while a thread samples the loop
+    stack, and then are written into `path`:
+
+    - profile-<time>.prof: cProfile stats (call graph, for snakeviz or gprof2dot)
+    - profile-<time>.txt: the stats sorted by cumulative time
+    - profile-<time>.folded: sampled stacks in the collapsed format of flamegraph.pl and speedscope
+
+    When no profile is requested a pass only checks an attribute.
+    """
+
+    def __init__(self, path: Path = None, flag_file: Path = None, iterations: int = PROFILE_ITERATIONS,
+                 sample_interval: float = PROFILE_SAMPLE_INTERVAL) -> None:
+        self._path = Path(path) if path else Path(Path.cwd() / DATA_DIR / PROFILE_DIR)
+        self._flag_file = Path(flag_file) if flag_file else Path(Path.cwd() / DATA_DIR / PROFILE_FLAG)
+        self._iterations = iterations
+        self._sample_interval = sample_interval
+        self.requested = 0
+        self._remaining = 0
+        self._profile = None
+        self._sampler = None
+        self._stop = threading.Event()
+        self._stacks = collections.Counter()
+        self._in_pass = False
+        self._thread_id = None
+        self._log = logging.getLogger(__name__)
+
+    @property
+    def active(self) -> bool:
+        return self._profile is not None
+
+    def request(self, iterations: int = None) -> None:
+        """Profiles the next passes. Safe to call from a signal handler
+        """
+        self.requested = iterations or self._iterations
+
+    def install_signal(self, signum: int = getattr(signal, 'SIGUSR1', None)) -> bool:
+        """Requests a profile when the process receives the signal, only possible from the main thread
+        """
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, lambda *_: self.request())
+        return True
+
+    def check_flag(self) -> None:
+        """Requests a profile if the flag file exists, it can hold the number of passes
+        """
+        if not self._flag_file.exists():
+            return
+        try:
+            text = self._flag_file.read_text().strip()
+            self._flag_file.unlink()
+            self.request(int(text) if text else None)
+        except (OSError, ValueError):
+            self._log.warning(f'Invalid profile flag file {self._flag_file}', exc_info=True)
+
+    def start_pass(self) -> None:
+        if self.requested and self._profile is None:
+            self._start()
+        if self._profile is not None:
+            self._in_pass = True
+            self._profile.enable()
+
+    def end_pass(self) -> None:
+        if self._profile is None:
+            return
+        self._profile.disable()
+        self._in_pass = False
+        self._remaining -= 1
+        if self._remaining <= 0:
+            self._finish()
+
+    def _start(self) -> None:
+        self._remaining = self.requested
+        self.requested = 0
+        self._log.info(f'Profiling the next {self._remaining} loop passes')
+        self._profile = cProfile.Profile()
+        self._stacks = collections.Counter()
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name='loop-profiler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self._sample_interval):
+            if not self._in_pass:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{Path(code.co_filename).name}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self._stacks[';'.join(reversed(stack))] += 1
+
+    def _finish(self) -> Optional[Path]:
+        self._stop.set()
+        self._sampler.join()
+        profile = self._profile
+        self._profile = None
+        try:
+            self._path.mkdir(parents=True, exist_ok=True)
+            base = self._path / f'profile-{datetime.datetime.now():%Y%m%d-%H%M%S}'
+            profile.dump_stats(str(base.with_suffix('.prof')))
+            with open(base.with_suffix('.txt'), 'w') as f:
+                pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats(50)
+            base.with_suffix('.folded').write_text(
+                ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common()))
+            self._log.info(f'Loop profile written to {base}')
+            return base
+        except OSError:
+            self._log.error('Failed to write the loop profile', exc_info=True)
+            return None
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import logging
+from typing import Any, Dict, Iterable, Set
+
+from optopus.common import OwnershipType
+from optopus.data_objects import PositionData, position_id
+from optopus.strategy import DefinedStrategy
+
+
+class PositionReconciler:
+    """Matches the broker positions with the strategy legs incrementally.
+
+    Positions are indexed by position id and the strategies by the position
+    ids of their legs, so a position change only re-evaluates the strategies
+    holding that contract. A position shared by several strategies is
+    allocated to them in the order they were added.
+    """
+
+    def __init__(self) -> None:
+        self._positions = {}
+        # position id -> {strategy key: required quantity}
+        self._holders = {}
+        # strategy key -> {position id: required quantity}
+        self._required = {}
+        # strategy key -> {position id: allocated quantity}
+        self._allocated = {}
+        self._log = logging.getLogger(__name__)
+
+    @property
+    def positions(self) -> Dict[str, PositionData]:
+        return self._positions
+
+    def add_strategy(self, key: Any, strategy: DefinedStrategy) -> Set[Any]:
+        """Indexes the legs of a strategy and returns the strategies whose allocation changed
+        """
+        required = {}
+        for leg in strategy.strategy.legs:
+            required[leg.position_id] = required.get(leg.position_id, 0) + strategy.quantity * leg.ratio
+        self._required[key] = required
+        self._allocated[key] = {}
+        for p_id, quantity in required.items():
+            self._holders.setdefault(p_id, {})[key] = quantity
+        return self._allocate(required)
+
+    def remove_strategy(self, key: Any) -> Set[Any]:
+        """Frees the positions of a strategy for the other strategies holding them
+        """
+        required = self._required.pop(key)
+        del self._allocated[key]
+        for p_id in required:
+            del self._holders[p_id][key]
+            if not self._holders[p_id]:
+                del self._holders[p_id]
+        return self._allocate(required)
+
+    def update_position(self, position: PositionData) -> Set[Any]:
+        """Applies a position change and returns the strategies whose allocation changed
+        """
+        # A contract is held either bought or sold, a closed position has no ownership
+        ids = {position_id(position.code, o, position.right, position.strike, position.expiration)
+               for o in OwnershipType}
+        if position.quantity and position.ownership:
+            current = self._positions.get(position.position_id)
+            self._positions[position.position_id] = position
+            if current and current.quantity == position.quantity:
+                return set()
+            ids.discard(position.position_id)
+            for p_id in ids:
+                self._positions.pop(p_id, None)
+            ids.add(position.position_id)
+        else:
+            for p_id in ids:
+                self._positions.pop(p_id, None)
+        return self._allocate(ids)
+
+    def load(self, positions: Dict[str, PositionData]) -> Set[Any]:
+        """Replaces the positions with a snapshot, re-evaluating only the changed ones
+        """
+        changed = {p_id for p_id in self._positions.keys() | positions.keys()
+                   if p_id not in positions
+                   or p_id not in self._positions
+                   or self._positions[p_id].quantity != positions[p_id].quantity}
+        self._positions = dict(positions)
+        return self._allocate(changed)
+
+    def _allocate(self, ids: Iterable[str]) -> Set[Any]:
+        changed = set()
+        for p_id in ids:
+            available = self._positions[p_id].quantity if p_id in self._positions else 0
+            for key, required in self._holders.get(p_id, {}).items():
+                quantity = min(required, available)
+                available -= quantity
+                if self._allocated[key].get(p_id, 0) != quantity:
+                    self._allocated[key][p_id] = quantity
+                    changed.add(key)
+        return changed
+
+    def allocated(self, key: Any) -> int:
+        return sum(self._allocated[key].values())
+
+    def required(self, key: Any) -> int:
+        return sum(self._required[key].values())
+
+    def excess(self) -> Dict[str, int]:
+        """Quantity of each position not allocated to any strategy
+        """
+        excess = {}
+        for p_id, p in self._positions.items():
+            allocated = sum(self._allocated[k].get(p_id, 0) for k in self._holders.get(p_id, {}))
+            if p.quantity > allocated:
+                excess[p_id] = p.quantity - allocated
+        return excess
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import threading
+import weakref
+from typing import Any, Dict, Hashable
+
+from optopus.asset import AssetId
+from optopus.option import OptionId
+
+
+class IdRegistry:
+    """Interning registry of contracts and asset and option ids.
+
+    Returns one canonical object per conId (or per terms when there isn't
+    a contract), so the same contract isn't held many times over and
+    equal ids are usually the same object. Objects no longer referenced
+    elsewhere are released.
+    """
+
+    def __init__(self) -> None:
+        self._contracts = weakref.WeakValueDictionary()
+        self._asset_ids = weakref.WeakValueDictionary()
+        self._option_ids = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def contract(self, contract: Any) -> Any:
+        if contract is None or not getattr(contract, 'conId', 0):
+            return contract
+        return self._intern(self._contracts, contract.conId, contract)
+
+    def asset_id(self, id: AssetId) -> AssetId:
+        contract = self.contract(id.contract)
+        key = contract.conId if contract is not None else (id.code, id.asset_type, id.currency)
+        canonical = self._asset_ids.get(key)
+        if canonical is None:
+            if contract is not id.contract:
+                id = AssetId(id.code, id.asset_type, id.currency, contract)
+            canonical = self._intern(self._asset_ids, key, id)
+        return canonical
+
+    def option_id(self, id: OptionId) -> OptionId:
+        contract = self.contract(id.contract)
+        key = (contract.conId if contract is not None
+               else (id.underlying_id.code, id.expiration, id.strike, id.right, id.multiplier))
+        canonical = self._option_ids.get(key)
+        if canonical is None:
+            underlying_id = self.asset_id(id.underlying_id)
+            if contract is not id.contract or underlying_id is not id.underlying_id:
+                id = OptionId(underlying_id, id.asset_type, id.expiration, id.strike, id.right,
+                              id.multiplier, contract)
+            canonical = self._intern(self._option_ids, key, id)
+        return canonical
+
+    def cached_option_id(self, conId: int) -> OptionId:
+        """Canonical option id of a conId, None if it isn't registered
+        """
+        return self._option_ids.get(conId)
+
+    def _intern(self, registry: weakref.WeakValueDictionary, key: Hashable, value: Any) -> Any:
+        with self._lock:
+            return registry.setdefault(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        return {'contracts': len(self._contracts),
+                'asset_ids': len(self._asset_ids),
+                'option_ids': len(self._option_ids)}
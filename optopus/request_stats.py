@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import datetime
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from optopus.settings import REQUEST_STATS_MINUTES
+
+
+class RequestStats(NamedTuple):
+    """Aggregated broker requests of a type"""
+    calls: int = 0
+    contracts: int = 0
+    items: int = 0
+    errors: int = 0
+    pacing_violations: int = 0
+    latency: float = 0.0
+    max_latency: float = 0.0
+    pacing_wait: float = 0.0
+
+
+def merge(a: RequestStats, b: RequestStats) -> RequestStats:
+    return RequestStats(calls=a.calls + b.calls,
+                        contracts=a.contracts + b.contracts,
+                        items=a.items + b.items,
+                        errors=a.errors + b.errors,
+                        pacing_violations=a.pacing_violations + b.pacing_violations,
+                        latency=a.latency + b.latency,
+                        max_latency=max(a.max_latency, b.max_latency),
+                        pacing_wait=a.pacing_wait + b.pacing_wait)
+
+
+class RequestAccounting:
+    """Accounts the requests to the broker per minute and request type.
+
+    Only the last `minutes` minutes are kept. The latencies are measured
+    with perf_counter, the minute of a request comes from `clock`.
+    """
+
+    def __init__(self, minutes: int = REQUEST_STATS_MINUTES, clock: Callable[[], float] = time.time) -> None:
+        self._minutes = minutes
+        self._clock = clock
+        # minute -> {request type: RequestStats}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def call(self, request: str, func: Callable, *args, contracts: int = 0, **kwargs) -> Any:
+        """Calls func, accounting it as a request of the type. The items are the length of the result
+        """
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            latency = time.perf_counter() - start
+            self._add(request, RequestStats(calls=1, contracts=contracts, errors=1,
+                                            latency=latency, max_latency=latency))
+            raise
+        latency = time.perf_counter() - start
+        items = len(result) if hasattr(result, '__len__') else int(result is not None)
+        self._add(request, RequestStats(calls=1, contracts=contracts, items=items,
+                                        latency=latency, max_latency=latency))
+        return result
+
+    def pace(self, request: str, sleep: Callable[[float], None], seconds: float) -> None:
+        """Waits to respect the pacing limits, accounting the wait to the request type
+        """
+        start = time.perf_counter()
+        sleep(seconds)
+        self._add(request, RequestStats(pacing_wait=time.perf_counter() - start))
+
+    def pacing_violation(self, request: str) -> None:
+        self._add(request, RequestStats(pacing_violations=1))
+
+    def _add(self, request: str, stats: RequestStats) -> None:
+        minute = int(self._clock() // 60)
+        with self._lock:
+            bucket = self._buckets.get(minute)
+            if bucket is None:
+                bucket = self._buckets[minute] = {}
+                for m in [m for m in self._buckets if m <= minute - self._minutes]:
+                    del self._buckets[m]
+            bucket[request] = merge(bucket[request], stats) if request in bucket else stats
+
+    def per_minute(self) -> List[Tuple[datetime.datetime, str, RequestStats]]:
+        """Stats of each minute and request type, oldest first
+        """
+        with self._lock:
+            return [(datetime.datetime.fromtimestamp(minute * 60), request, stats)
+                    for minute, bucket in sorted(self._buckets.items())
+                    for request, stats in sorted(bucket.items())]
+
+    def summary(self, minutes: int = None) -> Dict[str, RequestStats]:
+        """Totals of each request type over the last minutes, all the kept ones by default
+        """
+        since = int(self._clock() // 60) - minutes + 1 if minutes else None
+        totals = {}
+        with self._lock:
+            for minute, bucket in self._buckets.items():
+                if since is None or minute >= since:
+                    for request, stats in bucket.items():
+                        totals[request] = merge(totals[request], stats) if request in totals else stats
+        return totals
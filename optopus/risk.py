@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import logging
+from typing import Any, Dict, NamedTuple, Sequence
+
+import numpy as np
+
+from optopus.common import OwnershipType
+from optopus.data_objects import Account
+from optopus.settings import (MAXIMUM_RISK_FACTOR, MAXIMUM_UNDERLYING_FACTOR, PORTFOLIO_GREEKS_LIMITS,
+                              PRESERVED_CASH_FACTOR)
+from optopus.strategy import DefinedStrategy
+
+GREEKS = ('delta', 'gamma', 'theta', 'vega')
+# Limits of a candidate, in the order of RiskDecision.binding
+LIMITS = ('trade_risk', 'underlying_exposure', 'margin') + GREEKS
+
+
+class Candidates(NamedTuple):
+    """Columnar candidate strategies: underlying codes, maximum loss and greeks of one unit"""
+    codes: np.ndarray
+    unit_loss: np.ndarray
+    unit_greeks: np.ndarray
+
+
+class RiskDecision(NamedTuple):
+    allowed: np.ndarray
+    max_quantity: np.ndarray
+    # Index in LIMITS of the limit setting the maximum quantity
+    binding: np.ndarray
+
+    def reason(self, i: int) -> str:
+        return LIMITS[self.binding[i]]
+
+
+def unit_loss(strategy: DefinedStrategy) -> float:
+    """Maximum loss of one unit of the strategy
+    """
+    loss = getattr(strategy, 'maximum_loss', None)
+    if loss is not None:
+        return abs(float(loss))
+    # Undefined risk, the sold options assigned at their strike
+    return float(sum(leg.strike * float(leg.option.id.multiplier) * leg.ratio
+                     for leg in strategy.strategy.legs if leg.ownership == OwnershipType.Seller))
+
+
+def unit_greeks(strategy: DefinedStrategy) -> np.ndarray:
+    """Position greeks of one unit of the strategy
+    """
+    greeks = np.zeros(len(GREEKS))
+    for leg in strategy.strategy.legs:
+        size = leg.ownership.value * leg.ratio * float(leg.option.id.multiplier)
+        greeks += size * np.array([getattr(leg.option, g) or 0.0 for g in GREEKS])
+    return greeks
+
+
+def candidates(strategies: Sequence[DefinedStrategy]) -> Candidates:
+    return Candidates(codes=np.array([s.code for s in strategies], dtype=object),
+                      unit_loss=np.array([unit_loss(s) for s in strategies], dtype=float),
+                      unit_greeks=np.array([unit_greeks(s) for s in strategies], dtype=float)
+                      .reshape(len(strategies), len(GREEKS)))
+
+
+class RiskEngine:
+    """Pre-trade risk checks against cached limits.
+
+    The account budgets, the exposure of each underlying and the portfolio
+    greeks are kept as arrays and updated from the account events and the
+    strategies added or removed, so a check is only arithmetic on arrays.
+    Each candidate of a batch is checked on its own against the current
+    state, not against the other candidates.
+    """
+
+    def __init__(self,
+                 preserved_cash_factor: float = PRESERVED_CASH_FACTOR,
+                 maximum_risk_factor: float = MAXIMUM_RISK_FACTOR,
+                 maximum_underlying_factor: float = MAXIMUM_UNDERLYING_FACTOR,
+                 greeks_limits: Dict[str, float] = PORTFOLIO_GREEKS_LIMITS) -> None:
+        self._preserved_cash_factor = preserved_cash_factor
+        self._maximum_risk_factor = maximum_risk_factor
+        self._maximum_underlying_factor = maximum_underlying_factor
+        self._greeks_limits = np.array([greeks_limits.get(g, np.inf) for g in GREEKS], dtype=float)
+        self._account = {'net_liquidation': 0.0, 'cash': 0.0, 'excess_liquidity': None, 'buying_power': 0.0}
+        # Budgets: maximum risk of a trade, maximum exposure of an underlying, available margin
+        self._budgets = np.zeros(3)
+        self._codes = {}
+        self._exposure = np.zeros(16)
+        self._greeks = np.zeros(len(GREEKS))
+        # strategy key -> (code index, loss, greeks) of the strategy
+        self._strategies = {}
+        self._log = logging.getLogger(__name__)
+
+    @property
+    def maximum_risk(self) -> float:
+        return float(self._budgets[0])
+
+    @property
+    def portfolio_greeks(self) -> Dict[str, float]:
+        return dict(zip(GREEKS, self._greeks.tolist()))
+
+    def exposure(self, code: str) -> float:
+        i = self._codes.get(code)
+        return float(self._exposure[i]) if i is not None else 0.0
+
+    def load_account(self, account: Account) -> None:
+        for name in self._account:
+            value = getattr(account, name, None)
+            if value is not None:
+                self._account[name] = value
+        self._update_budgets()
+
+    def update_account(self, name: str, value: float) -> None:
+        """Applies an account value event
+        """
+        if name in self._account:
+            self._account[name] = value
+            self._update_budgets()
+
+    def _update_budgets(self) -> None:
+        a = self._account
+        net_liquidation = a['net_liquidation'] or 0.0
+        available_cash = (a['cash'] or 0.0) - net_liquidation * self._preserved_cash_factor
+        self._budgets[0] = max(0.0, min(net_liquidation * self._maximum_risk_factor, available_cash))
+        self._budgets[1] = net_liquidation * self._maximum_underlying_factor
+        margin = a['excess_liquidity'] if a['excess_liquidity'] is not None else a['buying_power']
+        self._budgets[2] = max(0.0, margin or 0.0)
+
+    def _code_index(self, code: str) -> int:
+        i = self._codes.get(code)
+        if i is None:
+            i = self._codes[code] = len(self._codes)
+            if i == len(self._exposure):
+                self._exposure = np.concatenate([self._exposure, np.zeros(len(self._exposure))])
+        return i
+
+    def add_strategy(self, key: Any, strategy: DefinedStrategy) -> None:
+        """Counts an open or pending strategy in the exposure and the portfolio greeks
+        """
+        self.remove_strategy(key)
+        i = self._code_index(strategy.code)
+        loss = unit_loss(strategy) * strategy.quantity
+        greeks = unit_greeks(strategy) * strategy.quantity
+        self._exposure[i] += loss
+        self._greeks += greeks
+        self._strategies[key] = (i, loss, greeks)
+
+    def remove_strategy(self, key: Any) -> None:
+        previous = self._strategies.pop(key, None)
+        if previous:
+            i, loss, greeks = previous
+            self._exposure[i] -= loss
+            self._greeks -= greeks
+
+    def sync(self, strategies: Dict[Any, DefinedStrategy]) -> None:
+        """Recomputes the greeks from the current values of the options and drops the closed strategies
+        """
+        for key in list(self._strategies):
+            strategy = strategies.get(key)
+            if strategy is None or strategy.closed:
+                self.remove_strategy(key)
+            else:
+                self.add_strategy(key, strategy)
+
+    def check(self, batch: Candidates, quantity: Any = 1) -> RiskDecision:
+        """Maximum quantity of each candidate within every limit, in one vectorized pass
+        """
+        n = len(batch.unit_loss)
+        index = np.array([self._codes.get(c, -1) for c in batch.codes], dtype=int)
+        exposure = np.where(index >= 0, self._exposure[np.maximum(index, 0)], 0.0)
+        loss = batch.unit_loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            limits = np.empty((len(LIMITS), n))
+            limits[0] = self._budgets[0] / loss
+            limits[1] = (self._budgets[1] - exposure) / loss
+            limits[2] = self._budgets[2] / loss
+            # |portfolio + q * candidate| <= limit, for q >= 0
+            g = batch.unit_greeks.T
+            headroom = np.where(g > 0, self._greeks_limits[:, None] - self._greeks[:, None],
+                                self._greeks_limits[:, None] + self._greeks[:, None])
+            limits[3:] = np.where(g == 0, np.inf, headroom / np.abs(g))
+        limits[:3] = np.where(loss > 0, limits[:3], np.inf)
+        limits = np.nan_to_num(limits, nan=0.0, posinf=np.inf)
+        binding = np.argmin(limits, axis=0)
+        # The epsilon keeps an exact fit, like 10 / 10, from rounding down
+        max_quantity = np.floor(np.maximum(limits[binding, np.arange(n)], 0.0) + 1e-9)
+        return RiskDecision(allowed=max_quantity >= quantity, max_quantity=max_quantity, binding=binding)
+
+    def check_strategies(self, strategies: Sequence[DefinedStrategy], quantity: Any = 1) -> RiskDecision:
+        return self.check(candidates(strategies), quantity)
+
+    def size(self, strategy: DefinedStrategy, maximum: int = None) -> int:
+        """Largest quantity of the strategy within the limits, up to maximum. 0 when it isn't allowed
+        """
+        decision = self.check_strategies([strategy])
+        quantity = decision.max_quantity[0]
+        if quantity < 1:
+            self._log.info(f'Strategy {strategy.strategy_id} rejected by the {decision.reason(0)} limit')
+        if maximum is not None:
+            quantity = min(quantity, maximum)
+        return int(quantity) if np.isfinite(quantity) else int(maximum or 1)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from optopus.metrics import LoopMetrics
+from optopus.tracing import TRACER
+
+# Metrics name of a whole pass of the loop
+PASS = 'loop'
+
+
+class Stage(NamedTuple):
+    """Step of the trading loop.
+
+    A stage with a cadence runs every `cadence` seconds. A stage without
+    cadence is triggered as soon as one of its dependencies has run again.
+    In both cases it waits until every dependency has run once. An action
+    returning False ran without new data, after its first run it doesn't
+    trigger its dependents. A run longer than `budget` (the cadence by
+    default) is an overrun.
+    """
+    name: str
+    action: Callable[[], None]
+    cadence: float = None
+    depends: Tuple[str, ...] = ()
+    budget: float = None
+
+
+class StageStats(NamedTuple):
+    runs: int
+    overruns: int
+    errors: int
+    last_duration: float
+    max_duration: float
+    last_run: float
+
+
+class LoopScheduler:
+    """Runs the stages of the loop that are due, respecting their dependencies.
+
+    Due stages that don't depend on each other form a wave and run
+    concurrently when there are more than one worker. The adapters must be
+    thread-safe to use more than one worker, the ib_insync client isn't.
+    The durations of the stages and of the whole pass are recorded in
+    `metrics`, a pass longer than `pass_budget` is an overrun.
+    """
+
+    def __init__(self,
+                 workers: int = 1,
+                 clock: Callable[[], float] = time.monotonic,
+                 metrics: LoopMetrics = None,
+                 pass_budget: float = None) -> None:
+        self._stages = {}
+        self._metrics = metrics if metrics is not None else LoopMetrics()
+        self._pass_budget = pass_budget
+        self._pass_overruns = 0
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self._last_run = {}
+        self._last_end = {}
+        self._sequence = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._log = logging.getLogger(__name__)
+
+    def add(self, stage: Stage) -> None:
+        for d in stage.depends:
+            if d not in self._stages:
+                raise ValueError(f'Stage {stage.name} depends on unknown stage {d}')
+        self._stages[stage.name] = stage
+        self._stats[stage.name] = StageStats(0, 0, 0, 0.0, 0.0, None)
+
+    def remove(self, name: str) -> None:
+        for s in self._stages.values():
+            if name in s.depends:
+                raise ValueError(f'Stage {s.name} depends on {name}')
+        del self._stages[name]
+        del self._stats[name]
+        self._last_run.pop(name, None)
+        self._last_end.pop(name, None)
+
+    @property
+    def stages(self) -> Dict[str, Stage]:
+        return self._stages
+
+    def stats(self) -> Dict[str, StageStats]:
+        return dict(self._stats)
+
+    @property
+    def metrics(self) -> LoopMetrics:
+        return self._metrics
+
+    @property
+    def pass_overruns(self) -> int:
+        return self._pass_overruns
+
+    def _due(self, stage: Stage, now: float) -> bool:
+        if not all(d in self._last_end for d in stage.depends):
+            return False
+        if stage.name not in self._last_run:
+            return True
+        if stage.cadence is not None:
+            return now - self._last_run[stage.name] >= stage.cadence
+        # Triggered by a dependency ending after the stage's own last run
+        own = self._last_end.get(stage.name, 0)
+        return any(self._last_end[d] > own for d in stage.depends)
+
+    def run_pending(self, now: float = None) -> List[str]:
+        """Runs the due stages, each at most once, and returns their names in run order
+        """
+        if now is None:
+            now = self._clock()
+        start = time.perf_counter()
+        done = []
+        while True:
+            due = [s for s in self._stages.values()
+                   if s.name not in done and self._due(s, now)]
+            due_names = {s.name for s in due}
+            # A stage waits for its due dependencies, that will run in an earlier wave
+            wave = [s for s in due if not due_names.intersection(s.depends)]
+            if not wave:
+                # The quotes of the pass don't trace what the next passes do
+                TRACER.end_trace()
+                if done:
+                    self._end_pass(time.perf_counter() - start)
+                return done
+            if self._executor and len(wave) > 1:
+                list(self._executor.map(lambda s: self._execute(s, now), wave))
+            else:
+                for s in wave:
+                    self._execute(s, now)
+            done += [s.name for s in wave]
+
+    def _end_pass(self, duration: float) -> None:
+        self._metrics.record(PASS, duration)
+        if self._pass_budget is not None and duration > self._pass_budget:
+            self._pass_overruns += 1
+            self._log.warning(f'Loop pass overran its budget: {duration:.2f}s > {self._pass_budget:.2f}s')
+
+    def _execute(self, stage: Stage, now: float) -> None:
+        self._last_run[stage.name] = now
+        start = time.perf_counter()
+        error = False
+        updated = None
+        try:
+            with TRACER.span(stage.name):
+                updated = stage.action()
+        except Exception:
+            error = True
+            self._log.exception(f'Stage {stage.name} failed')
+        duration = time.perf_counter() - start
+        self._metrics.record(stage.name, duration)
+        budget = stage.budget if stage.budget is not None else stage.cadence
+        overrun = budget is not None and duration > budget
+        if overrun:
+            self._log.warning(f'Stage {stage.name} overran its budget: {duration:.2f}s > {budget:.2f}s')
+        with self._lock:
+            s = self._stats[stage.name]
+            self._stats[stage.name] = StageStats(runs=s.runs + 1,
+                                                 overruns=s.overruns + overrun,
+                                                 errors=s.errors + error,
+                                                 last_duration=duration,
+                                                 max_duration=max(s.max_duration, duration),
+                                                 last_run=now)
+            # A failed stage, or one without new data, doesn't make its dependents fresh
+            if not error and (updated is not False or stage.name not in self._last_end):
+                self._sequence += 1
+                self._last_end[stage.name] = self._sequence
+
+    def next_due(self, now: float = None) -> float:
+        """Seconds until the next stage with cadence is due
+        """
+        if now is None:
+            now = self._clock()
+        waits = [max(0.0, self._last_run[s.name] + s.cadence - now) if s.name in self._last_run else 0.0
+                 for s in self._stages.values() if s.cadence is not None]
+        return min(waits) if waits else None
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown()
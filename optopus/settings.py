@@ -2,7 +2,7 @@
 # TODO: import from a cfg file
 import datetime
 
-from optopus.data_objects import Currency
+from optopus.common import Currency
 
 CURRENCY = Currency.USDollar
 HISTORICAL_YEARS = 1
@@ -11,7 +11,22 @@ SELL_COLOR = 'tomato'
 BUY_COLOR = 'green'
 UNDERLYING_COLOR = 'lightseagreen'
 DATA_DIR = 'data'
+LOG_FILE = 'optopus.log'
 STRATEGY_DIR = 'strategy'
+STRATEGY_DB = 'strategies.db'
+# Seconds the strategy updates are coalesced before being written
+PERSISTENCE_WINDOW = 1
+BAR_STORE_DIR = 'bars'
+# Close of the regular session, the daily bar of a day is complete from then
+SESSION_CLOSE = datetime.time(16, 0)
+METRICS_DIR = 'metrics'
+BENCHMARK_DIR = 'benchmarks'
+# Seconds to import a light module in a fresh interpreter
+IMPORT_TIME_BUDGET = 0.1
+PROFILE_DIR = 'profiles'
+TRACE_DIR = 'traces'
+# Creating this file in DATA_DIR profiles the next loop passes
+PROFILE_FLAG = 'profile'
 POSITIONS_FILE = 'positions.pckl'
 DTE_MAX = 50
 DTE_MIN = 0
@@ -38,8 +53,39 @@ CORRELATION_WINDOW = 252
 PRICE_WINDOW = 22
 IV_WINDOW = 22
 SLEEP_LOOP = 20
+# Loop stages cadence in seconds
+LOOP_TICK = 1
+LOOP_WORKERS = 1
+QUOTES_CADENCE = 1
+STRATEGY_OPTIONS_CADENCE = 10
+POSITIONS_CADENCE = 10
+HISTORY_CADENCE = 24 * 60 * 60
+METRICS_CADENCE = 60
+PROFILE_CHECK_CADENCE = 5
+MEMORY_CHECK_CADENCE = 60
+TRACE_EXPORT_CADENCE = 60
+# Spans kept in memory
+TRACE_BUFFER = 10000
+PROFILE_ITERATIONS = 10
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Minutes of broker request stats kept
+REQUEST_STATS_MINUTES = 24 * 60
+OPTION_QUOTE_FRESHNESS = 10
+TICKER_MAX_STALENESS = 10
 PRESERVED_CASH_FACTOR = 0.4
 MAXIMUM_RISK_FACTOR = 0.05
+# Exposure (maximum loss) of an underlying relative to the net liquidation
+MAXIMUM_UNDERLYING_FACTOR = 0.2
+# Absolute limits of the portfolio greeks, in shares equivalent
+PORTFOLIO_GREEKS_LIMITS = {'delta': 500, 'vega': 1000}
+MAXIMUM_STRATEGY_QUANTITY = 1
+# Stop loss price of a bracket, relative to the entry price
+STOP_LOSS_FACTOR = 2
+# In-process exit rules of the open strategies
+EXIT_DTE = 7
+EXIT_SHORT_DELTA = 0.5
+# Legs of a strategy held by the exit rule engine, more are added when needed
+EXIT_MAX_LEGS = 4
 RSI_WINDOW = 14
 FAST_SMA_WINDOW = 20
 SLOW_SMA_WINDOW = 50
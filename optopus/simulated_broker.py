@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""Simulated IB broker.
+
+SimulatedIB implements the subset of the ib_insync IB interface used by
+IBBrokerAdapter and IBDataAdapter. Quotes are synthetic (a random walk for
+the underlyings and Black-Scholes for the options) and limit orders,
+including BAG combos, are matched against the mid or natural price of their
+legs. Time is simulated: it only moves forward with sleep(), which is when
+order acknowledgements and fills are emitted.
+"""
+import datetime
+import heapq
+import itertools
+import logging
+import math
+import random
+from typing import Dict, Iterator, List
+
+from ib_insync import Event
+from ib_insync.contract import Contract
+from ib_insync.objects import (AccountValue, BarData, OptionChain, OptionComputation,
+                               Position as IBPosition, TradeLogEntry)
+from ib_insync.order import OrderStatus as IBOrderStatus, Trade as IBTrade
+from ib_insync.ticker import Ticker
+
+from optopus.settings import CURRENCY
+from optopus.utils import format_ib_date, parse_ib_date
+
+MID = 'mid'
+NATURAL = 'natural'
+
+ACCOUNT = 'SIM'
+TRADING_DAYS = 252
+
+
+class SimulatedIB:
+    """Local IB stand-in with synthetic quotes and combo order matching
+    """
+
+    def __init__(self,
+                 prices: Dict[str, float] = None,
+                 iv: float = 0.25,
+                 volatility: float = 0.2,
+                 spread: float = 0.05,
+                 match: str = MID,
+                 slippage: float = 0.0,
+                 ack_latency: float = 0.05,
+                 fill_latency: float = 0.2,
+                 cash: float = 100000.0,
+                 start: datetime.datetime = None,
+                 loop_iterations: int = None,
+                 seed: int = None) -> None:
+        if match not in (MID, NATURAL):
+            raise ValueError('Order match must be mid or natural')
+        self._prices = dict(prices or {})
+        self._iv = iv
+        self._volatility = volatility
+        self._spread = spread
+        self._match = match
+        self._slippage = slippage
+        self._ack_latency = ack_latency
+        self._fill_latency = fill_latency
+        self._cash = cash
+        self._now = start or datetime.datetime.now()
+        self._loop_iterations = loop_iterations
+        self._random = random.Random(seed)
+        self._log = logging.getLogger(__name__)
+
+        self._con_ids = {}
+        self._contracts = {}
+        self._req_ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._scheduled = []
+        self._working = {}
+        self._orders = {}
+        self._trades = []
+        self._positions = {}
+        self._connected = False
+
+        self.orderStatusEvent = Event('orderStatusEvent')
+        self.positionEvent = Event('positionEvent')
+        self.accountValueEvent = Event('accountValueEvent')
+        self.errorEvent = Event('errorEvent')
+        self.execDetailsEvent = Event('execDetailsEvent')
+        self.client = self
+
+    # Connection and time
+
+    def connect(self, host: str = None, port: int = None, clientId: int = None) -> None:
+        self._connected = True
+
+    def disconnect(self) -> None:
+        self._connected = False
+
+    def isConnected(self) -> bool:
+        return self._connected
+
+    def getReqId(self) -> int:
+        return next(self._req_ids)
+
+    @property
+    def now(self) -> datetime.datetime:
+        return self._now
+
+    def sleep(self, seconds: float = 0) -> None:
+        """Moves the simulated time forward, delivering the due order events
+        """
+        end = self._now + datetime.timedelta(seconds=seconds)
+        while True:
+            self._match_orders()
+            if not self._scheduled or self._scheduled[0][0] > end:
+                break
+            due, _, action = heapq.heappop(self._scheduled)
+            self._advance(due)
+            action()
+        self._advance(end)
+
+    def timeRange(self, start: datetime.time, end: datetime.datetime, step: float) -> Iterator[datetime.datetime]:
+        iterations = itertools.count() if self._loop_iterations is None else range(self._loop_iterations)
+        for _ in iterations:
+            yield self._now
+            self.sleep(step)
+
+    def _advance(self, to: datetime.datetime) -> None:
+        seconds = (to - self._now).total_seconds()
+        if seconds > 0:
+            dt = seconds / (TRADING_DAYS * 24 * 3600)
+            for code, price in self._prices.items():
+                shock = self._random.gauss(0, self._volatility * math.sqrt(dt))
+                self._prices[code] = price * math.exp(shock - self._volatility ** 2 * dt / 2)
+            self._now = to
+
+    def _schedule(self, delay: float, action) -> None:
+        due = self._now + datetime.timedelta(seconds=delay)
+        heapq.heappush(self._scheduled, (due, next(self._seq), action))
+
+    # Contracts and market data
+
+    def _contract_key(self, c: Contract) -> tuple:
+        return (c.symbol, c.secType, c.lastTradeDateOrContractMonth, float(c.strike or 0), c.right)
+
+    def qualifyContracts(self, *contracts: Contract) -> List[Contract]:
+        for c in contracts:
+            key = self._contract_key(c)
+            if key not in self._con_ids:
+                self._con_ids[key] = len(self._con_ids) + 1
+            c.conId = self._con_ids[key]
+            c.currency = c.currency or CURRENCY.value
+            c.tradingClass = c.symbol
+            c.localSymbol = c.localSymbol or c.symbol
+            if c.secType == 'OPT':
+                c.multiplier = '100'
+            self._prices.setdefault(c.symbol, 100.0)
+            self._contracts[c.conId] = c
+        return list(contracts)
+
+    def reqSecDefOptParams(self, underlyingSymbol: str, futFopExchange: str,
+                           underlyingSecType: str, underlyingConId: int) -> List[OptionChain]:
+        price = self._prices.setdefault(underlyingSymbol, 100.0)
+        strikes = {float(s) for s in range(max(1, int(price * 0.5)), int(price * 1.5) + 1)}
+        return [OptionChain(exchange='SMART',
+                            underlyingConId=underlyingConId,
+                            tradingClass=underlyingSymbol,
+                            multiplier='100',
+                            expirations={format_ib_date(e) for e in self._expirations()},
+                            strikes=strikes)]
+
+    def _expirations(self, months: int = 6) -> List[datetime.date]:
+        """Third Friday of the next months
+        """
+        expirations = []
+        year, month = self._now.year, self._now.month
+        for _ in range(months):
+            first = datetime.date(year, month, 1)
+            third_friday = first + datetime.timedelta(days=(4 - first.weekday()) % 7 + 14)
+            if third_friday >= self._now.date():
+                expirations.append(third_friday)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return expirations
+
+    def reqTickers(self, *contracts: Contract) -> List[Ticker]:
+        return [self._ticker(c) for c in contracts]
+
+    def _quote(self, c: Contract) -> tuple:
+        """Returns bid, mid, ask and the option model values of a contract
+        """
+        underlying = self._prices.setdefault(c.symbol, 100.0)
+        greeks = None
+        if c.secType == 'OPT':
+            expiration = parse_ib_date(c.lastTradeDateOrContractMonth)
+            t = max((expiration - self._now.date()).days, 0) / 365
+            mid, delta, gamma, vega, theta = black_scholes(underlying, c.strike, t, self._iv, c.right)
+            greeks = OptionComputation(self._iv, delta, mid, 0.0, gamma, vega, theta, underlying)
+        else:
+            mid = underlying
+        half_spread = max(mid * self._spread / 2, 0.01) if c.secType == 'OPT' else 0.01
+        bid = round(max(mid - half_spread, 0.0), 2)
+        ask = round(mid + half_spread, 2)
+        return bid, round(mid, 4), ask, greeks
+
+    def _ticker(self, c: Contract) -> Ticker:
+        bid, mid, ask, greeks = self._quote(c)
+        return Ticker(contract=c, time=self._now,
+                      bid=bid, bidSize=100, ask=ask, askSize=100,
+                      last=mid, lastSize=1, volume=10000,
+                      open=mid, high=mid, low=mid, close=mid,
+                      modelGreeks=greeks)
+
+    def reqHistoricalData(self, contract: Contract, endDateTime: str, durationStr: str,
+                          barSizeSetting: str, whatToShow: str, useRTH: bool,
+                          formatDate: int = 1, **kwargs) -> List[BarData]:
+        n, unit = durationStr.split()
+        days = int(n) * (TRADING_DAYS if unit == 'Y' else 1)
+        iv_series = whatToShow == 'OPTION_IMPLIED_VOLATILITY'
+        value = self._iv if iv_series else self._prices.setdefault(contract.symbol, 100.0)
+        volatility = 0.5 if iv_series else self._volatility
+        values = [value]
+        # The random walk goes backwards from the current value
+        for _ in range(days - 1):
+            values.append(values[-1] * math.exp(self._random.gauss(0, volatility / math.sqrt(TRADING_DAYS))))
+        bars = []
+        day = self._now.date()
+        for v in values:
+            while day.weekday() > 4:
+                day -= datetime.timedelta(days=1)
+            bars.append(BarData(date=day, open=v, high=v * 1.01, low=v * 0.99, close=v,
+                                volume=0 if iv_series else 1000000, average=v, barCount=1000))
+            day -= datetime.timedelta(days=1)
+        return bars[::-1]
+
+    # Account and positions
+
+    def positions(self) -> List[IBPosition]:
+        return [p for p in self._positions.values() if p.position]
+
+    def accountValues(self) -> List[AccountValue]:
+        value = sum(p.position * self._quote(p.contract)[1] * float(p.contract.multiplier or 1)
+                    for p in self._positions.values())
+        net_liquidation = self._cash + value
+        values = {
+            'AvailableFunds': self._cash,
+            'BuyingPower': self._cash * 4,
+            'TotalCashValue': self._cash,
+            'DayTradesRemaining': -1,
+            'NetLiquidation': net_liquidation,
+            'InitMarginReq': 0.0,
+            'MaintMarginReq': 0.0,
+            'ExcessLiquidity': self._cash,
+            'Cushion': self._cash / net_liquidation if net_liquidation else 0.0,
+            'GrossPositionValue': abs(value),
+            'EquityWithLoanValue': net_liquidation,
+            'SMA': self._cash,
+        }
+        return [AccountValue(ACCOUNT, tag, str(v), CURRENCY.value, '') for tag, v in values.items()]
+
+    # Orders
+
+    def placeOrder(self, contract: Contract, order) -> IBTrade:
+        if not order.orderId:
+            order.orderId = self.getReqId()
+        status = IBOrderStatus(orderId=order.orderId, status='PendingSubmit',
+                               remaining=order.totalQuantity, parentId=order.parentId)
+        trade = IBTrade(contract=contract, order=order, orderStatus=status, fills=[], log=[])
+        self._trades.append(trade)
+        self._orders[order.orderId] = trade
+        self._working[order.orderId] = trade
+        self._schedule(self._ack_latency, lambda: self._set_status(trade, 'Submitted'))
+        return trade
+
+    def cancelOrder(self, order) -> None:
+        trade = self._working.pop(order.orderId, None)
+        if trade:
+            self._schedule(self._ack_latency, lambda: self._set_status(trade, 'Cancelled'))
+
+    def openTrades(self) -> List[IBTrade]:
+        return [t for t in self._trades if t.orderStatus.status not in ('Filled', 'Cancelled')]
+
+    def trades(self) -> List[IBTrade]:
+        return list(self._trades)
+
+    def _set_status(self, trade: IBTrade, status: str) -> None:
+        trade.orderStatus.status = status
+        trade.log.append(TradeLogEntry(self._now, status, ''))
+        self.orderStatusEvent.emit(trade)
+
+    def combo_price(self, contract: Contract) -> tuple:
+        """Returns the mid price and the natural buying and selling prices of a contract
+        """
+        if contract.secType != 'BAG':
+            bid, mid, ask, _ = self._quote(contract)
+            return mid, ask, bid
+        mid = buy = sell = 0.0
+        for leg in contract.comboLegs:
+            bid, leg_mid, ask, _ = self._quote(self._contracts[leg.conId])
+            sign = 1 if leg.action == 'BUY' else -1
+            mid += sign * leg.ratio * leg_mid
+            buy += sign * leg.ratio * (ask if sign > 0 else bid)
+            sell += sign * leg.ratio * (bid if sign > 0 else ask)
+        return mid, buy, sell
+
+    def _match_orders(self) -> None:
+        for trade in list(self._working.values()):
+            order = trade.order
+            # Cancelled by an order of its OCA group matched in this pass
+            if trade.orderStatus.status != 'Submitted' or order.orderId not in self._working:
+                continue
+            # Child orders are only active once their parent is filled
+            if order.parentId and self._orders[order.parentId].orderStatus.status != 'Filled':
+                continue
+            mid, buy, sell = self.combo_price(trade.contract)
+            # A stop order is triggered at its auxPrice and filled at the market
+            stop = order.orderType == 'STP'
+            if order.action == 'BUY':
+                price = (mid if self._match == MID else buy) + self._slippage
+                matched = price >= order.auxPrice if stop else order.lmtPrice >= price
+            else:
+                price = (mid if self._match == MID else sell) - self._slippage
+                matched = price <= order.auxPrice if stop else order.lmtPrice <= price
+            if matched:
+                del self._working[order.orderId]
+                if order.ocaGroup:
+                    for other in [t for t in self._working.values() if t.order.ocaGroup == order.ocaGroup]:
+                        self.cancelOrder(other.order)
+                trade.orderStatus.status = 'PreSubmitted'
+                self._schedule(self._fill_latency, lambda t=trade, p=price: self._fill(t, p))
+
+    def _fill(self, trade: IBTrade, price: float) -> None:
+        order = trade.order
+        sign = 1 if order.action == 'BUY' else -1
+        quantity = order.totalQuantity
+        multiplier = 1.0
+        if trade.contract.secType == 'BAG':
+            for leg in trade.contract.comboLegs:
+                leg_contract = self._contracts[leg.conId]
+                leg_sign = sign * (1 if leg.action == 'BUY' else -1)
+                multiplier = float(leg_contract.multiplier or 1)
+                self._update_position(leg_contract, leg_sign * leg.ratio * quantity,
+                                      self._quote(leg_contract)[1] * multiplier)
+        else:
+            multiplier = float(trade.contract.multiplier or 1)
+            self._update_position(trade.contract, sign * quantity, price * multiplier)
+        self._cash -= sign * price * quantity * multiplier
+
+        trade.orderStatus.filled = quantity
+        trade.orderStatus.remaining = 0
+        trade.orderStatus.avgFillPrice = price
+        trade.orderStatus.lastFillPrice = price
+        self._set_status(trade, 'Filled')
+        for value in self.accountValues():
+            self.accountValueEvent.emit(value)
+
+    def _update_position(self, contract: Contract, quantity: float, cost: float) -> None:
+        previous = self._positions.get(contract.conId)
+        position = (previous.position if previous else 0) + quantity
+        if previous and previous.position and (previous.position > 0) == (quantity > 0):
+            cost = (previous.avgCost * previous.position + cost * quantity) / position
+        elif previous and position and (previous.position > 0) == (position > 0):
+            cost = previous.avgCost
+        p = IBPosition(ACCOUNT, contract, position, cost if position else 0.0)
+        self._positions[contract.conId] = p
+        self.positionEvent.emit(p)
+
+
+def _norm_cdf(x: float) -> float:
+    return (1 + math.erf(x / math.sqrt(2))) / 2
+
+
+def black_scholes(underlying: float, strike: float, t: float, iv: float, right: str,
+                  rate: float = 0.0) -> tuple:
+    """Returns price, delta, gamma, vega and theta of an european option
+    """
+    if t <= 0 or iv <= 0:
+        intrinsic = max(underlying - strike, 0.0) if right == 'C' else max(strike - underlying, 0.0)
+        delta = (1.0 if underlying > strike else 0.0) if right == 'C' else (-1.0 if underlying < strike else 0.0)
+        return intrinsic, delta, 0.0, 0.0, 0.0
+    sqrt_t = math.sqrt(t)
+    d1 = (math.log(underlying / strike) + (rate + iv ** 2 / 2) * t) / (iv * sqrt_t)
+    d2 = d1 - iv * sqrt_t
+    pdf = math.exp(-d1 ** 2 / 2) / math.sqrt(2 * math.pi)
+    discount = math.exp(-rate * t)
+    if right == 'C':
+        price = underlying * _norm_cdf(d1) - strike * discount * _norm_cdf(d2)
+        delta = _norm_cdf(d1)
+        theta = -underlying * pdf * iv / (2 * sqrt_t) - rate * strike * discount * _norm_cdf(d2)
+    else:
+        price = strike * discount * _norm_cdf(-d2) - underlying * _norm_cdf(-d1)
+        delta = _norm_cdf(d1) - 1
+        theta = -underlying * pdf * iv / (2 * sqrt_t) + rate * strike * discount * _norm_cdf(-d2)
+    gamma = pdf / (underlying * iv * sqrt_t)
+    vega = underlying * pdf * sqrt_t / 100
+    return price, delta, gamma, vega, theta / 365
@@ -4,6 +4,7 @@ from enum import Enum
 from typing import Tuple
 
 from optopus.common import OwnershipType
+from optopus.data_objects import position_id
 from optopus.option import Option
 
 
@@ -32,21 +33,17 @@ class Leg:
     def strike(self):
         return self.option.id.strike
 
-    # FIXME: I have to use a leg_id property?
-
-    # @property
-    # def leg_id(self):
-    #    return (
-    #        self.option.code
-    #        + " "
-    #        + str(self.ownership.value)
-    #        + " "
-    #        + self.option.right.value
-    #        + " "
-    #        + str(round(self.option.strike, 1))
-    #        + " "
-    #        + self.option.expiration.strftime("%d-%m-%Y")
-    #    )
+    @property
+    def position_id(self):
+        """Id of the position holding the leg
+        """
+        return position_id(
+            self.option.id.underlying_id.code,
+            self.ownership,
+            self.option.id.right,
+            self.option.id.strike,
+            self.option.id.expiration,
+        )
 
 
 @dataclass(frozen=True)
@@ -56,10 +53,6 @@ class Strategy:
     strategy_type: StrategyType
     ownership: OwnershipType
 
-    # FIXME: Do I need a strategy_id?
-    # @property
-    # def strategy_id(self):
-    #    return self.code + ' ' + self.created.strftime('%d-%m-%Y %H:%M:%S')
     @property
     def multiplier(self):
         return self.legs[0].option.id.multiplier
@@ -80,6 +73,18 @@ class DefinedStrategy:
     def strategy(self):
         return self._strategy
 
+    @strategy.setter
+    def strategy(self, val):
+        self._strategy = val
+
+    @property
+    def code(self):
+        return self._strategy.legs[0].option.id.underlying_id.code
+
+    @property
+    def strategy_id(self):
+        return self.code + ' ' + self.created.strftime('%d-%m-%Y %H:%M:%S')
+
     @property
     def created(self):
         return self._created
@@ -104,7 +109,14 @@ class DefinedStrategy:
             raise ValueError("Opened time must be defined")
         if val <= self.opened:
             raise ValueError("Closed time must be after opened time")
+        self._closed = val
 
     @property
     def quantity(self):
         return self._quantity
+
+    @quantity.setter
+    def quantity(self, val):
+        if val < 1:
+            raise ValueError("Strategy quantity must be greater than 0")
+        self._quantity = val
@@ -1,56 +1,261 @@
 # -*- coding: utf-8 -*-
+import dataclasses
+import datetime
+import importlib
+import json
 import logging
-import os
+import sqlite3
+import threading
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, Iterable, List
 
-import jsonpickle
+from optopus.asset import AssetId
+from optopus.common import AssetType, Currency, OwnershipType
+from optopus.option import Option, OptionId, RightType
+from optopus.settings import DATA_DIR, STRATEGY_DIR, STRATEGY_DB
+from optopus.strategy import DefinedStrategy, Leg, Strategy, StrategyType
 
-from optopus.settings import (DATA_DIR, STRATEGY_DIR)
-from optopus.strategy import Strategy
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strategies (
+    strategy_id TEXT PRIMARY KEY,
+    code TEXT NOT NULL,
+    strategy_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created TEXT NOT NULL,
+    opened TEXT,
+    closed TEXT,
+    updated TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS strategies_code ON strategies (code);
+CREATE INDEX IF NOT EXISTS strategies_status ON strategies (deleted, status);
+CREATE INDEX IF NOT EXISTS strategies_created ON strategies (created);
+CREATE INDEX IF NOT EXISTS strategies_closed ON strategies (closed);
+"""
+
+CREATED = 'created'
+OPENED = 'opened'
+CLOSED = 'closed'
+
+# DefinedStrategy attributes with their own encoding, the rest are stored as they are
+_CORE_ATTRIBUTES = ('_strategy', '_quantity', '_created', '_opened', '_closed', 'updated')
 
 
 class StrategyRepository:
     """Repository class for mananging strategies
+
+    Strategies are stored in a SQLite database, one row per strategy with
+    indexed columns and a compact JSON encoding of the strategy. Writes of
+    several strategies are done in one transaction.
     """
 
-    def __init__(self) -> None:
-        self._path = Path(Path.cwd() / DATA_DIR / STRATEGY_DIR)
+    def __init__(self, path: Path = None) -> None:
+        self._path = Path(path) if path else Path(Path.cwd() / DATA_DIR / STRATEGY_DIR)
+        self._path.mkdir(parents=True, exist_ok=True)
         self._log = logging.getLogger(__name__)
-        jsonpickle.set_preferred_backend('json')
-        jsonpickle.set_encoder_options('json', sort_keys=True, indent=4)
-
-    def add(self, item: Strategy) -> None:
-        file_name = self._path / (item.strategy_id + '.json')
-
-        serialized = jsonpickle.encode(item)
-        try:
-            with open(file_name, 'w') as file:
-                file.write(serialized)
-        except Exception as e:
-            self._log.error('Failed to write strategy file', exc_info=True)
-
-    def update(self, item: Strategy) -> None:
-        self.add(item)
-
-    def delete(self, item: Strategy) -> None:
-        file_name_src = self._path / (item.strategy_id + '.json')
-        file_name_dst = self._path / (item.strategy_id + '.json_closed')
-        try:
-            os.rename(file_name_src, file_name_dst)
-        except Exception as e:
-            self._log.error('Failed to delete strategy file', exc_info=True)
-
-    def all_items(self) -> List[Strategy]:
-        strategies = {}
-        for f in self._path.glob('*.json'):
-            file_name = self._path / f
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self._path / STRATEGY_DB), check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=FULL')
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+        self._import_json_files()
+
+    def add(self, item: DefinedStrategy) -> None:
+        self.save([item])
+
+    def update(self, item: DefinedStrategy) -> None:
+        self.save([item])
+
+    def save(self, items: Iterable[DefinedStrategy]) -> None:
+        """Inserts or updates the strategies in one transaction
+        """
+        self.write(items, ())
+
+    def delete(self, item: DefinedStrategy) -> None:
+        """Marks the strategy as deleted, it is kept as history
+        """
+        self.write((), [item])
+
+    def write(self, saved: Iterable[DefinedStrategy], deleted: Iterable[DefinedStrategy]) -> None:
+        """Saves and deletes strategies in one transaction
+        """
+        self.write_rows([encode_row(s) for s in saved], [s.strategy_id for s in deleted])
+
+    def write_rows(self, rows: Iterable[tuple], deleted: Iterable[str]) -> None:
+        """Saves the rows of encode_row and deletes the strategy ids in one transaction
+        """
+        deleted_ids = [(strategy_id,) for strategy_id in deleted]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT INTO strategies '
+                '(strategy_id, code, strategy_type, status, created, opened, closed, updated, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (strategy_id) DO UPDATE SET '
+                'code=excluded.code, strategy_type=excluded.strategy_type, status=excluded.status, '
+                'opened=excluded.opened, closed=excluded.closed, updated=excluded.updated, '
+                'data=excluded.data',
+                rows)
+            self._connection.executemany('UPDATE strategies SET deleted = 1 WHERE strategy_id = ?',
+                                         deleted_ids)
+
+    def all_items(self) -> Dict[str, DefinedStrategy]:
+        return {s.strategy_id: s for s in self.find()}
+
+    def find(self,
+             code: str = None,
+             status: str = None,
+             created_from: datetime.datetime = None,
+             created_to: datetime.datetime = None,
+             deleted: bool = False) -> List[DefinedStrategy]:
+        """Strategies matching the filters, in creation order
+        """
+        conditions = ['deleted = ?']
+        parameters = [int(deleted)]
+        for column, operator, value in (('code', '=', code),
+                                        ('status', '=', status),
+                                        ('created', '>=', _encode_time(created_from)),
+                                        ('created', '<', _encode_time(created_to))):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                parameters.append(value)
+        with self._lock:
+            rows = self._connection.execute(
+                f'SELECT data FROM strategies WHERE {" AND ".join(conditions)} ORDER BY created',
+                parameters).fetchall()
+        return [decode_strategy(json.loads(r[0])) for r in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _import_json_files(self) -> None:
+        """Imports the strategies of the former jsonpickle files, once
+        """
+        files = list(self._path.glob('*.json')) + list(self._path.glob('*.json_closed'))
+        if not files or self._connection.execute('SELECT COUNT(*) FROM strategies').fetchone()[0]:
+            return
+        import jsonpickle
+        for f in files:
             try:
-                with open(file_name, 'r') as file:
-                    serialized = file.read()
-                s = jsonpickle.decode(serialized)
-                strategies[s.strategy_id] = s
-                self._log.debug(f'Loaded {f}')
-            except FileNotFoundError as e:
-                self._log.error('Failed to open strategy file', exc_info=True)
-        return strategies
+                s = jsonpickle.decode(f.read_text())
+                self.save([s])
+                if f.suffix == '.json_closed':
+                    self.delete(s)
+                self._log.debug(f'Imported {f}')
+            except Exception:
+                self._log.error(f'Failed to import strategy file {f}', exc_info=True)
+
+
+def status(strategy: DefinedStrategy) -> str:
+    if strategy.closed:
+        return CLOSED
+    if strategy.opened:
+        return OPENED
+    return CREATED
+
+
+def encode_row(s: DefinedStrategy) -> tuple:
+    """Row of the strategies table, without the deleted flag
+    """
+    return (s.strategy_id, s.code, s.strategy.strategy_type.value, status(s), _encode_time(s.created),
+            _encode_time(s.opened), _encode_time(s.closed), _encode_time(getattr(s, 'updated', None)),
+            json.dumps(encode_strategy(s), separators=(',', ':'), default=_encode_scalar))
+
+
+def encode_strategy(strategy: DefinedStrategy) -> dict:
+    s = strategy.strategy
+    extra = {k: v for k, v in vars(strategy).items()
+             if k not in _CORE_ATTRIBUTES and isinstance(v, (str, int, float, bool, type(None)))}
+    return {
+        'class': f'{type(strategy).__module__}.{type(strategy).__qualname__}',
+        'type': s.strategy_type.value,
+        'ownership': s.ownership.value,
+        'quantity': strategy.quantity,
+        'created': _encode_time(strategy.created),
+        'opened': _encode_time(strategy.opened),
+        'closed': _encode_time(strategy.closed),
+        'updated': _encode_time(getattr(strategy, 'updated', None)),
+        'legs': [{'ownership': leg.ownership.value, 'ratio': leg.ratio, 'option': _encode_option(leg.option)}
+                 for leg in s.legs],
+        'extra': extra,
+    }
+
+
+def decode_strategy(data: dict) -> DefinedStrategy:
+    module, name = data['class'].rsplit('.', 1)
+    cls = getattr(importlib.import_module(module), name)
+    strategy = cls.__new__(cls)
+    # The stored state is restored as it is, without the validations of the constructor
+    strategy.__dict__.update(data['extra'])
+    strategy._strategy = Strategy(
+        legs=tuple(Leg(option=_decode_option(leg['option']),
+                       ownership=OwnershipType(leg['ownership']),
+                       ratio=leg['ratio'])
+                   for leg in data['legs']),
+        strategy_type=StrategyType(data['type']),
+        ownership=OwnershipType(data['ownership']),
+    )
+    strategy._quantity = data['quantity']
+    strategy._created = _decode_time(data['created'])
+    strategy._opened = _decode_time(data['opened'])
+    strategy._closed = _decode_time(data['closed'])
+    if data['updated']:
+        strategy.updated = _decode_time(data['updated'])
+    return strategy
+
+
+def _encode_option(option: Option) -> dict:
+    i = option.id
+    u = i.underlying_id
+    encoded = {
+        'underlying': [u.code, u.asset_type.value, u.currency.value, _encode_contract(u.contract)],
+        'id': [i.asset_type.value, i.expiration.isoformat(), i.strike, i.right.value, i.multiplier,
+               _encode_contract(i.contract)],
+        'time': _encode_time(option.time),
+    }
+    for f in dataclasses.fields(Option):
+        if f.name not in ('id', 'time'):
+            value = getattr(option, f.name)
+            if value is not None:
+                encoded[f.name] = value
+    return encoded
+
+
+def _decode_option(data: dict) -> Option:
+    code, asset_type, currency, contract = data['underlying']
+    underlying_id = AssetId(code, AssetType(asset_type), Currency(currency), _decode_contract(contract))
+    asset_type, expiration, strike, right, multiplier, contract = data['id']
+    option_id = OptionId(underlying_id, AssetType(asset_type), datetime.date.fromisoformat(expiration),
+                         strike, RightType(right), multiplier, _decode_contract(contract))
+    values = {f.name: data.get(f.name) for f in dataclasses.fields(Option) if f.name not in ('id', 'time')}
+    return Option(id=option_id, time=_decode_time(data['time']), **values)
+
+
+def _encode_contract(contract: Any) -> dict:
+    if contract is None:
+        return None
+    return contract.nonDefaults()
+
+
+def _decode_contract(data: dict) -> Any:
+    if data is None:
+        return None
+    from ib_insync.contract import Contract
+    return Contract.create(**data)
+
+
+def _encode_scalar(value: Any) -> Any:
+    # NumPy scalars from the datasets
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not serializable')
+
+
+def _encode_time(t: datetime.datetime) -> str:
+    return t.isoformat() if t else None
+
+
+def _decode_time(t: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(t) if t else None
@@ -85,14 +85,11 @@ class Taco:
 
         """
         options = self._opt.option_chain(asset.id.code, expiration)
-        df = to_df(options.values())
+        # Only the quotes of the OTM puts are requested
+        df = to_df(options.select(RightType.Put, max_strike=asset.current.market_price))
         df = df.dropna()
         if not df.empty:
             df["spread"] = df["ask"] - df["bid"]
-            # OTM puts filter
-            df = df[
-                (df["right"] == RightType.Put.value) & (df["strike"] <= asset.current.market_price)
-                ]
             # nearest ATM option
             sell_strike = df.iloc[-1, df.columns.get_loc("strike")]
             sell_midpoint = df.iloc[-1, df.columns.get_loc("midpoint")]
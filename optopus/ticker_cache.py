@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from optopus.settings import TICKER_MAX_STALENESS
+
+
+class TickerCache:
+    """Snapshot cache of tickers keyed by contract conId.
+
+    Only the contracts without a snapshot fresher than `max_staleness` seconds
+    are requested. A contract already being requested by another thread is
+    waited for instead of being requested twice.
+    """
+
+    def __init__(self,
+                 request: Callable[[List[Any]], List[Any]],
+                 max_staleness: float = TICKER_MAX_STALENESS) -> None:
+        self._request = request
+        self._max_staleness = max_staleness
+        self._snapshots = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._requests = 0
+        self._log = logging.getLogger(__name__)
+
+    def tickers(self, contracts: List[Any], max_staleness: float = None) -> List[Any]:
+        """Returns the tickers of the contracts, in the same order.
+
+        Contracts without market data are left out, as reqTickers does.
+        """
+        if max_staleness is None:
+            max_staleness = self._max_staleness
+        now = time.monotonic()
+        thread = threading.get_ident()
+        to_request = {}
+        to_wait = {}
+        with self._lock:
+            for c in contracts:
+                if c.conId in to_request or c.conId in to_wait:
+                    continue
+                snapshot = self._snapshots.get(c.conId)
+                if snapshot and now - snapshot[0] <= max_staleness:
+                    self._hits += 1
+                elif c.conId in self._in_flight and self._in_flight[c.conId][0] != thread:
+                    self._coalesced += 1
+                    to_wait[c.conId] = self._in_flight[c.conId][1]
+                else:
+                    self._misses += 1
+                    to_request[c.conId] = c
+                    self._in_flight[c.conId] = (thread, threading.Event())
+            if to_request:
+                self._requests += 1
+
+        if to_request:
+            try:
+                tickers = self._request(list(to_request.values()))
+                received = time.monotonic()
+                with self._lock:
+                    for t in tickers:
+                        self._snapshots[t.contract.conId] = (received, t)
+            finally:
+                with self._lock:
+                    for conId in to_request:
+                        self._in_flight.pop(conId)[1].set()
+            self._log.debug(f"Requested {len(to_request)} tickers")
+
+        for event in to_wait.values():
+            event.wait()
+
+        tickers = []
+        with self._lock:
+            for c in contracts:
+                snapshot = self._snapshots.get(c.conId)
+                if snapshot:
+                    tickers.append(snapshot[1])
+        return tickers
+
+    def invalidate(self, conId: int = None) -> None:
+        with self._lock:
+            if conId is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(conId, None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self._hits + self._misses + self._coalesced
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'requests': self._requests,
+                'hit_ratio': (self._hits + self._coalesced) / total if total else None,
+                'size': len(self._snapshots),
+            }
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Tick-to-order latency tracing.
+
+A trace starts when new quotes arrive and every span recorded while the
+loop works on those quotes belongs to it, down to the order placement. It
+ends with the loop pass, the passes without new quotes aren't traced. The
+strategy id of an order is tagged with the trace, so the order ack from
+orderStatusEvent closes the same trace. Spans are kept in a ring buffer
+and exported periodically as JSON lines.
+"""
+import collections
+import functools
+import itertools
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple
+
+from optopus.settings import TRACE_BUFFER
+
+
+class Span(NamedTuple):
+    sequence: int
+    trace_id: int
+    name: str
+    parent: str
+    # Wall clock time of the start, in seconds
+    start: float
+    duration: float
+
+
+class Tracer:
+    def __init__(self, capacity: int = TRACE_BUFFER) -> None:
+        self._spans = collections.deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count(1)
+        self._active = None
+        # trace id -> perf_counter and wall clock time of its start, the oldest are dropped
+        self._starts = collections.OrderedDict()
+        self._tags = collections.OrderedDict()
+        self._capacity = capacity
+        self._local = threading.local()
+        self._exported = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def start_trace(self) -> int:
+        """Starts the trace of newly arrived data, the following spans belong to it
+        """
+        trace_id = next(self._ids)
+        with self._lock:
+            self._starts[trace_id] = (time.perf_counter(), time.time())
+            while len(self._starts) > self._capacity:
+                self._starts.popitem(last=False)
+        self._active = trace_id
+        return trace_id
+
+    def end_trace(self) -> None:
+        """Ends the active trace, the following spans don't belong to any until the next start
+        """
+        self._active = None
+
+    def span(self, name: str, trace_id: int = None) -> 'SpanContext':
+        return SpanContext(self, name, trace_id)
+
+    def record(self, trace_id: int, name: str, start: float, duration: float, parent: str = None) -> None:
+        self._spans.append(Span(next(self._sequence), trace_id, name, parent, start, duration))
+
+    def tag(self, key: Any, trace_id: int = None) -> None:
+        """Associates a key, like a strategy id, with a trace
+        """
+        trace_id = trace_id if trace_id is not None else self._active
+        if trace_id is None:
+            return
+        with self._lock:
+            self._tags[key] = trace_id
+            while len(self._tags) > self._capacity:
+                self._tags.popitem(last=False)
+
+    def tagged(self, key: Any) -> int:
+        return self._tags.get(key)
+
+    def untag(self, key: Any) -> int:
+        with self._lock:
+            return self._tags.pop(key, None)
+
+    def mark(self, name: str, trace_id: int) -> None:
+        """Records the time elapsed from the start of the trace to now
+        """
+        start = self._starts.get(trace_id)
+        if start is not None:
+            self.record(trace_id, name, start[1], time.perf_counter() - start[0])
+
+    def spans(self, trace_id: int = None) -> List[Span]:
+        spans = list(self._spans)
+        return spans if trace_id is None else [s for s in spans if s.trace_id == trace_id]
+
+    def export(self, file_name: Path) -> int:
+        """Appends the spans recorded since the previous export, returns their number.
+        Spans overwritten in the ring buffer before an export are lost
+        """
+        spans = [s for s in list(self._spans) if s.sequence > self._exported]
+        if not spans:
+            return 0
+        file_name = Path(file_name)
+        file_name.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_name, 'a') as f:
+            for s in spans:
+                f.write(json.dumps(s._asdict()) + '\n')
+        self._exported = spans[-1].sequence
+        return len(spans)
+
+
+class SpanContext:
+    """Times a block as a span of a trace.
+
+    Without a trace id the span belongs to the trace active when it ends,
+    so the block starting a trace is part of it. Nothing is recorded when
+    there isn't any trace.
+    """
+    __slots__ = ('_tracer', '_name', '_trace_id', '_start', '_wall', '_parent')
+
+    def __init__(self, tracer: Tracer, name: str, trace_id: int) -> None:
+        self._tracer = tracer
+        self._name = name
+        self._trace_id = trace_id
+
+    def __enter__(self) -> 'SpanContext':
+        stack = self._tracer._local.__dict__.setdefault('stack', [])
+        self._parent = stack[-1] if stack else None
+        stack.append(self._name)
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        duration = time.perf_counter() - self._start
+        self._tracer._local.stack.pop()
+        trace_id = self._trace_id if self._trace_id is not None else self._tracer.active
+        if trace_id is not None:
+            self._tracer.record(trace_id, self._name, self._wall, duration, self._parent)
+
+
+TRACER = Tracer()
+
+
+def traced(name: str) -> Callable:
+    """Decorator recording the calls as spans of the active trace of TRACER
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
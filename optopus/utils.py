@@ -1,17 +1,19 @@
 import datetime
 from collections import OrderedDict
 from enum import Enum
-from typing import List, Any
-from urllib import request, parse
-
-import pandas as pd
-from pandas import DataFrame
+from typing import TYPE_CHECKING, List, Any
 
 from optopus.asset import Asset
 from optopus.option import Option, OptionId
+from optopus.tracing import traced
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
 
-def to_df(items: List[Any]) -> DataFrame:
+@traced('to_df')
+def to_df(items: List[Any]) -> 'DataFrame':
+    import pandas as pd
     rows = []
     if all([isinstance(i, Asset) for i in items]):
         rows = assets_to_df(items)
@@ -153,6 +155,7 @@ def format_ib_date(d: datetime.date) -> str:
 
 
 def notify(event: str, value1: str = None, value2: str = None, value3: str = None):
+    from urllib import request, parse
     data = {'value1': value1, 'value2': value2, 'value3': value3}
     data = parse.urlencode(data).encode()
     url = f'https://maker.ifttt.com/trigger/{event}/with/key/cy0nEe3pY7MJjeLakJNeL-'
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from typing import Dict
+
+from optopus.settings import PERSISTENCE_WINDOW
+from optopus.strategy import DefinedStrategy
+from optopus.strategy_repository import StrategyRepository, encode_row
+
+
+class WriteBehindRepository:
+    """Strategy repository writing the changes on a background thread.
+
+    add, update and delete only queue the change and return. Repeated
+    changes of a strategy within `window` seconds are coalesced and the
+    queued changes are written in one transaction, so the trading loop
+    never waits for the disk.
+
+    The strategies are encoded when they are queued, the writer thread
+    never reads a strategy the trading loop keeps changing.
+    """
+
+    def __init__(self, repository: StrategyRepository, window: float = PERSISTENCE_WINDOW) -> None:
+        self._repository = repository
+        self._window = window
+        # strategy id -> (encoded row, deleted)
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._writing = False
+        self._closed = False
+        self._flush = False
+        self._writes = 0
+        self._coalesced = 0
+        self._failures = 0
+        self._error = None
+        self._log = logging.getLogger(__name__)
+        self._thread = threading.Thread(target=self._run, name='strategy-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, item: DefinedStrategy) -> None:
+        self._queue(item, False)
+
+    def update(self, item: DefinedStrategy) -> None:
+        self._queue(item, False)
+
+    def delete(self, item: DefinedStrategy) -> None:
+        self._queue(item, True)
+
+    def all_items(self) -> Dict[str, DefinedStrategy]:
+        self.flush()
+        return self._repository.all_items()
+
+    def find(self, *args, **kwargs):
+        self.flush()
+        return self._repository.find(*args, **kwargs)
+
+    def _queue(self, item: DefinedStrategy, deleted: bool) -> None:
+        row = encode_row(item)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Strategy repository closed')
+            if item.strategy_id in self._pending:
+                self._coalesced += 1
+                # A deleted strategy stays deleted
+                deleted = deleted or self._pending[item.strategy_id][1]
+            self._pending[item.strategy_id] = (row, deleted)
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending and self._closed:
+                    return
+                # Coalescing window, cut short by a flush or close
+                deadline = time.monotonic() + self._window
+                while not (self._flush or self._closed) and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+                pending = self._pending
+                self._pending = {}
+                self._writing = True
+            try:
+                self._repository.write_rows([row for row, _ in pending.values()],
+                                            [i for i, (_, deleted) in pending.items() if deleted])
+                self._writes += 1
+            except Exception as e:
+                self._log.error('Failed to write strategies', exc_info=True)
+                with self._condition:
+                    self._failures += 1
+                    self._error = e
+                    if self._closed:
+                        self._log.error(f'Lost the changes of {len(pending)} strategies')
+                    else:
+                        # Retried with the next changes, the newer rows take precedence
+                        # but a deleted strategy stays deleted
+                        for strategy_id, (row, deleted) in self._pending.items():
+                            deleted = deleted or pending.get(strategy_id, (row, False))[1]
+                            pending[strategy_id] = (row, deleted)
+                        self._pending = pending
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def flush(self) -> None:
+        """Waits until the queued changes are written.
+
+        It raises if the write fails, the changes stay queued and are
+        retried with the next ones.
+        """
+        with self._condition:
+            failures = self._failures
+            self._flush = True
+            self._condition.notify_all()
+            # A failed write isn't waited for again
+            while ((self._pending or self._writing) and self._failures == failures
+                   and self._thread.is_alive()):
+                self._condition.wait()
+            self._flush = False
+            if self._failures != failures:
+                raise RuntimeError('Failed to write strategies') from self._error
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {'pending': len(self._pending), 'writes': self._writes, 'coalesced': self._coalesced,
+                    'failures': self._failures}
+
+    def close(self) -> None:
+        """Drains the queue and closes the repository
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._repository.close()
@@ -3,8 +3,8 @@ import sys
 import codecs
 from setuptools import setup, find_packages
 
-if sys.version_info < (3, 6, 0):
-    raise RuntimeError("optopus requires Python 3.6 or higher")
+if sys.version_info < (3, 8, 0):
+    raise RuntimeError("optopus requires Python 3.8 or higher")
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -23,13 +23,13 @@ setup(
     author='ciherraiz',
     author_email='a@a.com',
     license='BSD',
-    python_requires='>=3.6',
+    python_requires='>=3.8',
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
         'Topic :: Office/Business :: Financial :: Investment',
         'License :: OSI Approved :: BSD License',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3 :: Only',
     ],
     keywords='ibapi asyncio jupyter interactive brokers async',
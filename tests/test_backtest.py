@@ -0,0 +1,71 @@
+import datetime
+import numpy as np
+import pytest
+from optopus.asset import Bar
+from optopus.backtest import (Panels, CreditSpreadParameters, backtest_credit_spreads,
+                              entry_signals, load_panels, TAKE_PROFIT, EXPIRATION)
+from optopus.bar_store import BarStore, PRICE_SERIES, IV_SERIES
+from optopus.computation import put_price
+
+
+def make_panels(close, iv):
+    close = np.asarray(close, dtype=float)
+    iv = np.asarray(iv, dtype=float)
+    dates = np.datetime64("2018-09-03") + np.arange(len(close))
+    return Panels(dates, ["SPY", "XLE"][:close.shape[1]], close,
+                  np.full(close.shape, 1e6), iv, iv)
+
+
+@pytest.fixture
+def params():
+    return CreditSpreadParameters(minimum_iv_percentile=-1.0, minimum_reward=0.1,
+                                  minimum_ROI=0.1, DTE=5)
+
+
+def test_entry_signals(params):
+    panels = make_panels([[100], [85], [84], [90]], [[0.3], [0.3], [0.1], [0.3]])
+    signals = entry_signals(panels, params)
+    assert signals[:, 0].tolist() == [False, True, False, False]
+
+
+def test_backtest_take_profit(params):
+    # The underlying rallies after the entry so the spread loses its value
+    panels = make_panels([[100], [85], [100], [110], [110], [110], [110], [110]], [[0.5]] * 8)
+    result = backtest_credit_spreads(panels, params)
+    trade = result.trades.iloc[0]
+    assert len(result.trades) == 1
+    assert trade.exit_reason == TAKE_PROFIT
+    assert trade.exit_date == panels.dates[2]
+    assert trade.pnl == pytest.approx(trade.credit * (1 - params.profit_factor) * 100)
+    assert result.pnl.iloc[-1] == pytest.approx(result.trades.pnl.sum())
+
+
+def test_backtest_expiration_settlement(params):
+    # The underlying keeps falling, the spread expires at its maximum loss
+    panels = make_panels([[100], [85], [80], [70], [60], [55], [50], [50]], [[0.5]] * 8)
+    result = backtest_credit_spreads(panels, params)
+    trade = result.trades.iloc[0]
+    assert trade.exit_reason == EXPIRATION
+    assert trade.exit_value == pytest.approx(trade.sell_strike - trade.buy_strike)
+    assert result.pnl.iloc[-1] == pytest.approx(trade.pnl)
+
+
+def test_backtest_one_spread_per_asset(params):
+    panels = make_panels([[100], [85], [74], [65], [60], [60], [60], [60]], [[0.5]] * 8)
+    result = backtest_credit_spreads(panels, params)
+    assert len(result.trades) == 1
+
+
+def test_put_price_expiration():
+    assert put_price(np.array([90.0]), np.array([100.0]), np.array([0.0]), np.array([0.3]))[0] == 10.0
+
+
+def test_load_panels(tmp_path):
+    store = BarStore(tmp_path)
+    for code, series, value in (("SPY", PRICE_SERIES, 100.0), ("SPY", IV_SERIES, 0.2)):
+        store.append(code, series, [Bar(count=1, open=value, high=value, low=value, close=value,
+                                        average=value, volume=10, time=datetime.date(2018, 9, d))
+                                    for d in (3, 4)])
+    panels = load_panels(store, ["SPY"])
+    assert panels.close.shape == (2, 1)
+    assert panels.iv[-1, 0] == 0.2
@@ -0,0 +1,65 @@
+import datetime
+import pytest
+from optopus.asset import Bar
+from optopus.bar_store import BarStore, BAR_DTYPE, PRICE_SERIES, last_session
+
+
+def bar(day, close):
+    return Bar(count=10, open=close, high=close + 1, low=close - 1, close=close,
+               average=close, volume=1000, time=datetime.date(2018, 9, day))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(tmp_path)
+
+
+def test_BarStore_empty(store):
+    assert len(store.read("SPY", PRICE_SERIES)) == 0
+    assert store.last_time("SPY", PRICE_SERIES) is None
+
+
+def test_BarStore_append_and_history(store):
+    assert store.append("SPY", PRICE_SERIES, [bar(3, 10.0), bar(4, 11.0)]) == 2
+    history = store.history("SPY", PRICE_SERIES)
+    assert history == (bar(3, 10.0), bar(4, 11.0))
+    assert store.last_time("SPY", PRICE_SERIES) == datetime.date(2018, 9, 4)
+
+
+def test_BarStore_append_only_newer(store):
+    store.append("SPY", PRICE_SERIES, [bar(3, 10.0), bar(4, 11.0)])
+    assert store.append("SPY", PRICE_SERIES, [bar(4, 12.0), bar(5, 13.0)]) == 1
+    assert [b.close for b in store.history("SPY", PRICE_SERIES)] == [10.0, 11.0, 13.0]
+
+
+def test_BarStore_history_start(store):
+    store.append("SPY", PRICE_SERIES, [bar(3, 10.0), bar(4, 11.0), bar(5, 12.0)])
+    history = store.history("SPY", PRICE_SERIES, datetime.date(2018, 9, 4))
+    assert [b.close for b in history] == [11.0, 12.0]
+
+
+def test_BarStore_partial_record_ignored(store, tmp_path):
+    store.append("SPY", PRICE_SERIES, [bar(3, 10.0)])
+    with open(tmp_path / "SPY.price.bars", "ab") as f:
+        f.write(b"\x00" * (BAR_DTYPE.itemsize // 2))
+    assert len(store.read("SPY", PRICE_SERIES)) == 1
+    store.append("SPY", PRICE_SERIES, [bar(4, 11.0)])
+    assert [b.close for b in store.history("SPY", PRICE_SERIES)] == [10.0, 11.0]
+
+
+def test_BarStore_panel(store):
+    store.append("SPY", PRICE_SERIES, [bar(3, 10.0), bar(4, 11.0)])
+    store.append("XLE", PRICE_SERIES, [bar(4, 20.0)])
+    panel = store.panel(store.codes(PRICE_SERIES), PRICE_SERIES)
+    assert list(panel.columns) == ["SPY", "XLE"]
+    assert panel.loc["2018-09-04", "XLE"] == 20.0
+    assert len(panel) == 2
+
+
+def test_last_session():
+    assert last_session(datetime.date(2018, 9, 24)) == datetime.date(2018, 9, 21)
+    assert last_session(datetime.date(2018, 9, 20)) == datetime.date(2018, 9, 19)
+    # Labor Day, Good Friday and the Christmas observed on a Monday
+    assert last_session(datetime.date(2018, 9, 4)) == datetime.date(2018, 8, 31)
+    assert last_session(datetime.date(2019, 4, 22)) == datetime.date(2019, 4, 18)
+    assert last_session(datetime.date(2022, 12, 27)) == datetime.date(2022, 12, 23)
@@ -0,0 +1,34 @@
+from optopus.benchmark import (import_time, load_baseline, report, run, save_baseline,
+                               synthetic_assets)
+
+
+def test_synthetic_assets():
+    assets = synthetic_assets(3, 1)
+    assert list(assets) == ["SPY", "S0001", "S0002"]
+    assert len(assets["S0001"].price_history.values) == 252
+
+
+def test_run_and_baseline(tmp_path):
+    results = run(symbols=[5], years=[1])
+    assert [r.case for r in results] == ["assets_loop_computation", "assets_vector_computation",
+                                         "assets_directional_assumption", "to_df", "create_options",
+                                         "strategy_repository.all_items"]
+    assert all(r.seconds > 0 and r.throughput > 0 for r in results)
+    assert results[4].items == 5 * 40
+    save_baseline(results, tmp_path / "baseline.json")
+    baseline = load_baseline(tmp_path / "baseline.json")
+    assert baseline[results[0].key] == results[0]
+    assert "1.00x" in report(results, baseline)
+    assert load_baseline(tmp_path / "missing.json") == {}
+
+
+def test_light_modules_skip_heavy_dependencies():
+    # The time budget is checked by the --imports benchmark, the machines running the tests vary
+    for module in ("optopus", "optopus.strategy", "optopus.utils", "optopus.strategy_repository",
+                   "optopus.option_chain"):
+        assert import_time(module)[1] == [], module
+
+
+def test_import_time_reports_heavy_dependencies():
+    seconds, heavy = import_time("optopus.bar_store")
+    assert seconds > 0 and {"numpy", "pandas"} <= set(heavy)
@@ -0,0 +1,71 @@
+import dataclasses
+import datetime
+import pytest
+from optopus.asset import Current
+from optopus.common import AssetDefinition, AssetType
+from optopus.data_manager import DataManager
+from optopus.file_adapter import FileDataAdapter, SimulatedClock
+from optopus.short_put_vertical_spread import ShortPutVerticalSpread
+from optopus.tracing import TRACER
+
+
+@pytest.fixture
+def adapter(tmp_path):
+    (tmp_path / "options").mkdir()
+    (tmp_path / "options" / "SPY.csv").write_text(
+        "date,expiration,strike,right,bid,ask,volume\n"
+        "2018-09-04,2018-10-19,100,P,2.0,2.2,50\n"
+        "2018-09-04,2018-10-19,98,P,1.5,1.6,40\n"
+        "2018-09-04,2018-10-19,95,P,1.0,1.1,40\n"
+        "2018-09-05,2018-10-19,100,P,1.8,2.0,60\n"
+        "2018-09-05,2018-10-19,98,P,1.3,1.4,60\n"
+        "2018-09-05,2018-10-19,95,P,0.8,0.9,60\n"
+    )
+    return FileDataAdapter(tmp_path, SimulatedClock(datetime.datetime(2018, 9, 4, 16)))
+
+
+@pytest.fixture
+def data_manager(adapter, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dm = DataManager(adapter, (AssetDefinition("SPY", AssetType.ETF),))
+    dm.create_assets()
+    return dm
+
+
+def test_update_strategy_options_batch(data_manager, adapter, monkeypatch):
+    spy = data_manager.assets["SPY"]
+    options = adapter.create_options(spy, [0, 1, 2])
+    data_manager._strategies = {
+        "a": ShortPutVerticalSpread(options["95.0P"], options["100.0P"]),
+        "b": ShortPutVerticalSpread(options["98.0P"], options["100.0P"]),
+    }
+    requests = []
+    get_options = adapter.get_options
+    monkeypatch.setattr(adapter, "get_options", lambda o: requests.append(o) or get_options(o))
+    adapter._clock.advance(days=1)
+
+    data_manager.update_strategy_options()
+
+    assert len(requests) == 1
+    assert sorted(o.id.strike for o in requests[0]) == [95.0, 98.0, 100.0]
+    a, b = (data_manager.strategies[k].strategy.legs for k in ("a", "b"))
+    assert a[1].option is b[1].option
+    assert a[1].option.bid == 1.8
+    assert a[0].option.bid == 0.8
+
+
+def test_update_assets_reports_new_quotes(data_manager, adapter, monkeypatch):
+    current = Current(1.0, 1.0, 1.0, 1.0, 1, 1.1, 1, 1.0, 1, 100, datetime.datetime(2018, 9, 4, 16))
+    quotes = {"SPY": current}
+    monkeypatch.setattr(adapter, "update_assets", lambda assets: dict(quotes))
+    TRACER.end_trace()
+    assert data_manager.update_assets()
+    trace_id = TRACER.active
+    assert trace_id is not None
+    TRACER.end_trace()
+    # Cached quotes don't start a trace
+    assert not data_manager.update_assets()
+    assert TRACER.active is None
+    quotes["SPY"] = dataclasses.replace(current, bid=1.05)
+    assert data_manager.update_assets()
+    assert data_manager.assets["SPY"].current.bid == 1.05
@@ -0,0 +1,108 @@
+import dataclasses
+import datetime
+import pytest
+from optopus.asset import AssetId, AssetType
+from optopus.common import Currency
+from optopus.exit_rules import (ExitEngine, dte_rule, max_loss_rule, profit_rule, short_delta_rule,
+                                stop_loss_rule)
+from optopus.option import OptionId, Option, RightType
+from optopus.short_put_vertical_spread import ShortPutVerticalSpread
+
+EXPIRATION = datetime.date(2018, 10, 19)
+TODAY = datetime.date(2018, 9, 4)
+
+
+def put(strike, bid=None, ask=None, delta=None):
+    id = AssetId("SPY", AssetType.ETF, Currency.USDollar, None)
+    opt_id = OptionId(id, AssetType.Option, EXPIRATION, strike, RightType.Put, 100, None)
+    return dataclasses.replace(Option(opt_id, *[None] * 18, datetime.datetime.now()),
+                               bid=bid, ask=ask, delta=delta)
+
+
+def spread(low=95.0, high=100.0):
+    s = ShortPutVerticalSpread(put(low, 0.9, 1.1, -0.2), put(high, 2.9, 3.1, -0.4))
+    s.opening_price = s.entry_price
+    s.opened = s.created + datetime.timedelta(seconds=1)
+    return s
+
+
+@pytest.fixture
+def engine():
+    e = ExitEngine((stop_loss_rule(2), max_loss_rule(0.5), profit_rule(0.5), dte_rule(7),
+                    short_delta_rule(0.5)))
+    e.add_strategy("a", spread())
+    e.add_strategy("b", spread(90.0))
+    return e
+
+
+def test_state_of_the_open_strategies(engine):
+    state = engine.state(TODAY)
+    assert state.entry.tolist() == [-2.0, -2.0]
+    assert state.mark.tolist() == pytest.approx([-2.0, -2.0])
+    assert state.pnl.tolist() == pytest.approx([0.0, 0.0])
+    assert state.dte.tolist() == [45, 45]
+    assert state.short_delta.tolist() == [0.4, 0.4]
+    assert state.max_loss.tolist() == pytest.approx([300.0, 800.0])
+    assert engine.evaluate(TODAY) == []
+
+
+def test_profit_and_stop_loss(engine):
+    engine.update_quotes([put(95.0, 0.3, 0.5), put(100.0, 1.1, 1.3, -0.3), put(90.0, 0.05, 0.15)])
+    intents = engine.evaluate(TODAY)
+    assert [(i.strategy_id, i.rule) for i in intents] == [("a", "profit")]
+    assert intents[0].mark == pytest.approx(-0.8) and intents[0].pnl == pytest.approx(1.2)
+
+    engine.update_quotes([put(100.0, 6.0, 6.2, -0.45)])
+    # The strategies are reported once
+    assert [(i.strategy_id, i.rule) for i in engine.evaluate(TODAY)] == [("b", "stop_loss")]
+    assert engine.evaluate(TODAY) == []
+    engine.reset("a")
+    assert [(i.strategy_id, i.rule) for i in engine.evaluate(TODAY)] == [("a", "stop_loss")]
+
+
+def test_max_loss_dte_and_short_delta():
+    engine = ExitEngine((max_loss_rule(0.5),))
+    engine.add_strategy("a", spread())
+    engine.update_quotes([put(100.0, 4.5, 4.7)])
+    assert engine.evaluate(TODAY)[0].rule == "max_loss"
+
+    engine = ExitEngine((dte_rule(7), short_delta_rule(0.5)))
+    engine.add_strategy("a", spread())
+    engine.add_strategy("b", spread(90.0))
+    assert engine.evaluate(EXPIRATION - datetime.timedelta(days=10)) == []
+    engine.update_quotes([put(100.0, 2.9, 3.1, -0.55)])
+    assert [i.rule for i in engine.evaluate(TODAY)] == ["short_delta", "short_delta"]
+    engine.reset("a")
+    assert [i.rule for i in engine.evaluate(EXPIRATION - datetime.timedelta(days=7))] == ["dte"]
+
+
+def test_missing_quote_leaves_the_strategy_open(engine):
+    engine.update_quotes([put(100.0, None, None, -0.45), put(95.0, 5.0, 5.2)])
+    assert engine.state(TODAY).mark[0] != engine.state(TODAY).mark[0]
+    assert [i.strategy_id for i in engine.evaluate(TODAY)] == []
+
+
+def test_removed_strategy_releases_its_quotes(engine):
+    engine.remove_strategy("a")
+    assert "a" not in engine and len(engine) == 1
+    engine.update_quotes([put(95.0, 0.05, 0.15)])
+    assert len(engine._slots) == 2
+    engine.update_quotes([put(100.0, 6.0, 6.2), put(90.0, 0.05, 0.15)])
+    assert [(i.strategy_id, i.rule) for i in engine.evaluate(TODAY)] == [("b", "stop_loss")]
+
+
+def test_sync_keeps_the_opened_strategies(engine):
+    opened, pending = spread(80.0, 85.0), ShortPutVerticalSpread(put(70.0, 0.9, 1.1), put(75.0, 2.9, 3.1))
+    engine.sync({"b": spread(90.0), "c": opened, "d": pending})
+    assert "a" not in engine and "b" in engine and "c" in engine and "d" not in engine
+    opened.closed = opened.opened + datetime.timedelta(seconds=1)
+    engine.sync({"b": spread(90.0), "c": opened})
+    assert len(engine) == 1
+
+
+def test_engine_grows(engine):
+    for strike in range(200):
+        engine.add_strategy(strike, spread(1000.0 + strike * 10, 1005.0 + strike * 10))
+    assert len(engine) == 202
+    state = engine.state(TODAY)
+    assert state.mark.tolist() == pytest.approx([-2.0] * 202)
@@ -0,0 +1,89 @@
+import datetime
+import pytest
+from optopus.asset import Bar
+from optopus.bar_store import BarStore, PRICE_SERIES, IV_SERIES
+from optopus.common import AssetDefinition, AssetType, OwnershipType
+from optopus.file_adapter import FileDataAdapter, SimulatedClock
+from optopus.option import RightType
+
+
+def bar(day, close):
+    return Bar(count=10, open=close, high=close + 1, low=close - 1, close=close,
+               average=close, volume=1000, time=datetime.date(2018, 9, day))
+
+
+@pytest.fixture
+def clock():
+    return SimulatedClock(datetime.datetime(2018, 9, 4, 16))
+
+
+@pytest.fixture
+def adapter(tmp_path, clock):
+    store = BarStore(tmp_path / "bars")
+    store.append("SPY", PRICE_SERIES, [bar(3, 100.0), bar(4, 101.0), bar(5, 102.0)])
+    store.append("SPY", IV_SERIES, [bar(3, 0.2), bar(4, 0.21), bar(5, 0.22)])
+    (tmp_path / "options").mkdir()
+    (tmp_path / "options" / "SPY.csv").write_text(
+        "date,expiration,strike,right,bid,ask,volume,delta\n"
+        "2018-09-04,2018-10-19,100,P,2.0,2.2,50,-0.45\n"
+        "2018-09-04,2018-10-19,95,P,1.0,1.1,40,-0.25\n"
+        "2018-09-04,2018-10-19,150,P,50.0,51.0,1,-1.0\n"
+        "2018-09-05,2018-10-19,100,P,1.8,2.0,60,-0.42\n"
+    )
+    (tmp_path / "positions.csv").write_text(
+        "code,asset_type,expiration,strike,right,ownership,quantity,average_cost\n"
+        "SPY,OPT,2018-10-19,100,P,Seller,1,210.0\n"
+    )
+    return FileDataAdapter(tmp_path, clock)
+
+
+@pytest.fixture
+def assets(adapter):
+    assets = adapter.create_assets((AssetDefinition("SPY", AssetType.ETF),))
+    for code, current in adapter.update_assets(assets).items():
+        assets[code].current = current
+    return assets
+
+
+def test_FileDataAdapter_point_in_time_history(adapter, assets, clock):
+    history = adapter.get_price_history(assets["SPY"])
+    assert [b.close for b in history.values] == [100.0, 101.0]
+    clock.advance(days=1)
+    history = adapter.get_iv_history(assets["SPY"])
+    assert [b.close for b in history.values] == [0.2, 0.21, 0.22]
+
+
+def test_FileDataAdapter_current(assets):
+    assert assets["SPY"].current.market_price == 101.0
+
+
+def test_FileDataAdapter_no_lookahead_during_the_session(adapter, assets, clock):
+    clock.set(datetime.datetime(2018, 9, 5, 10))
+    assert adapter.update_assets(assets)["SPY"].close == 101.0
+    assert [b.close for b in adapter.get_price_history(assets["SPY"]).values] == [100.0, 101.0]
+    clock.set(datetime.datetime(2018, 9, 5, 16))
+    assert adapter.update_assets(assets)["SPY"].close == 102.0
+
+
+def test_FileDataAdapter_optionchain(adapter, assets):
+    chain = adapter.get_optionchain(assets["SPY"], datetime.date(2018, 10, 19))
+    assert sorted(chain) == ["100.0P", "95.0P"]
+    puts = chain.select(RightType.Put, max_strike=101.0)
+    assert [(o.id.strike, o.bid, o.delta) for o in puts] == [(95.0, 1.0, -0.25), (100.0, 2.0, -0.45)]
+
+
+def test_FileDataAdapter_positions(adapter):
+    positions = list(adapter.get_positions().values())
+    assert len(positions) == 1
+    assert positions[0].ownership == OwnershipType.Seller
+    assert positions[0].right == RightType.Put
+    assert positions[0].expiration == datetime.date(2018, 10, 19)
+
+
+def test_FileDataAdapter_get_options(adapter, assets, clock):
+    chain = adapter.get_optionchain(assets["SPY"], datetime.date(2018, 10, 19))
+    options = [chain["100.0P"], chain["95.0P"]]
+    clock.advance(days=1)
+    updated = adapter.get_options(options)
+    assert updated[0].bid == 1.8
+    assert updated[1] is None
@@ -0,0 +1,150 @@
+import datetime
+import pytest
+from ib_insync import Event
+from optopus.exceptions import RecordingExhaustedError
+from optopus.ib_adapter import IBBrokerAdapter
+from optopus.ib_replay import RecordingIB, ReplayIB, RECORDED_EVENTS
+from optopus.optopus import Optopus
+from optopus.settings import STRATEGY_OPTIONS_CADENCE
+from optopus.simulated_broker import SimulatedIB
+
+
+class Contract:
+    def __init__(self, symbol, conId=0):
+        self.symbol = symbol
+        self.conId = conId
+
+    def __repr__(self):
+        return f"Contract({self.symbol!r}, {self.conId})"
+
+
+class FakeClient:
+    def __init__(self):
+        self._req_id = 100
+
+    def getReqId(self):
+        self._req_id += 1
+        return self._req_id
+
+
+class FakeIB:
+    def __init__(self):
+        for name in RECORDED_EVENTS:
+            setattr(self, name, Event(name))
+        self.client = FakeClient()
+
+    def qualifyContracts(self, *contracts):
+        for c in contracts:
+            c.conId = len(c.symbol)
+        return list(contracts)
+
+    def reqTickers(self, *contracts):
+        return [f"ticker {c.symbol}" for c in contracts]
+
+    def sleep(self, seconds):
+        self.orderStatusEvent.emit("filled")
+
+    def timeRange(self, start, end, step):
+        for i in range(2):
+            yield datetime.datetime(2018, 9, 21, 10, i)
+
+
+@pytest.fixture
+def recording(tmp_path):
+    file_name = tmp_path / "session.rec.gz"
+    ib = RecordingIB(FakeIB(), file_name)
+    ib.qualifyContracts(Contract("SPY"), Contract("XLE"))
+    ib.reqTickers(Contract("SPY", 3))
+    ib.reqTickers(Contract("XLE", 3))
+    for _ in ib.timeRange(None, None, 10):
+        ib.sleep(1)
+    ib.client.getReqId()
+    ib.close()
+    return file_name
+
+
+def test_ReplayIB_qualify_fills_contracts(recording):
+    ib = ReplayIB(recording)
+    contracts = [Contract("SPY"), Contract("XLE")]
+    ib.qualifyContracts(*contracts)
+    assert [c.conId for c in contracts] == [3, 3]
+
+
+def test_ReplayIB_matches_by_arguments(recording):
+    ib = ReplayIB(recording)
+    assert ib.reqTickers(Contract("XLE", 3)) == ["ticker XLE"]
+    assert ib.reqTickers(Contract("SPY", 3)) == ["ticker SPY"]
+    with pytest.raises(RecordingExhaustedError):
+        ib.reqTickers(Contract("SPY", 3))
+
+
+def test_ReplayIB_events_and_loop(recording):
+    ib = ReplayIB(recording)
+    statuses = []
+    ib.orderStatusEvent += statuses.append
+    iterations = 0
+    for _ in ib.timeRange(None, None, 10):
+        ib.sleep(1)
+        iterations += 1
+    assert iterations == 2
+    assert statuses == ["filled", "filled"]
+    assert ib.client.getReqId() == 101
+    assert ib.pending() == 3
+
+
+class Unpicklable:
+    def __init__(self):
+        self.ok = "x" * 100000
+
+    def __reduce__(self):
+        raise TypeError("not picklable")
+
+
+def test_unpicklable_item_is_skipped(tmp_path):
+    file_name = tmp_path / "session.rec.gz"
+    ib = RecordingIB(FakeIB(), file_name)
+    ib.orderStatusEvent.emit(["x" * 100000, Unpicklable()])
+    ib.orderStatusEvent.emit("filled")
+    ib.sleep(1)
+    ib.close()
+
+    replay = ReplayIB(file_name)
+    statuses = []
+    replay.orderStatusEvent += statuses.append
+    replay.sleep(1)
+    assert statuses == ["filled", "filled"]
+
+
+def test_ReplayIB_errors_reach_the_adapter(tmp_path):
+    file_name = tmp_path / "session.rec.gz"
+    ib = RecordingIB(FakeIB(), file_name)
+    ib.errorEvent.emit(1, 100, "Max rate of messages per second has been exceeded", None)
+    ib.sleep(1)
+    ib.close()
+
+    broker = IBBrokerAdapter(ReplayIB(file_name), "", 0, 0)
+    broker._broker.sleep(1)
+    assert broker.requests.summary()["messages"].pacing_violations == 1
+
+
+def run_session(ib):
+    opt = Optopus(IBBrokerAdapter(ib, "", 0, 0))
+    opt.start()
+    opt.loop()
+    opt.stop()
+    prices = {code: asset.current.market_price for code, asset in opt.assets.items()}
+    return prices, {name: (s.runs, s.errors) for name, s in opt.loop_stats().items()}
+
+
+def test_recorded_session_replays_through_optopus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    file_name = tmp_path / "session.rec.gz"
+    ib = RecordingIB(SimulatedIB(loop_iterations=2 * STRATEGY_OPTIONS_CADENCE + 1, seed=1), file_name)
+    recorded = run_session(ib)
+    ib.close()
+
+    replayed = run_session(ReplayIB(file_name))
+    assert replayed == recorded
+    prices, stats = replayed
+    assert prices and all(prices.values())
+    assert stats["strategy_options"] == (3, 0) and not any(errors for _, errors in stats.values())
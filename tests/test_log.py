@@ -0,0 +1,19 @@
+import logging
+from optopus import setup_logging
+from optopus.settings import LOG_FILE
+
+
+def test_setup_logging(tmp_path):
+    logger = setup_logging(tmp_path / "logs")
+    try:
+        setup_logging(tmp_path / "logs")
+        assert len(logger.handlers) == 2
+        logging.getLogger("optopus.test").info("message")
+        for h in logger.handlers:
+            h.flush()
+        assert "optopus.test — INFO — message" in (tmp_path / "logs" / LOG_FILE).read_text()
+    finally:
+        for h in list(logger.handlers):
+            logger.removeHandler(h)
+            h.close()
+        logger.setLevel(logging.NOTSET)
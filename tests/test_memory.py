@@ -0,0 +1,46 @@
+import datetime
+import numpy as np
+import pytest
+from optopus.memory import AllocationTracker, deep_size, footprint
+from optopus.benchmark import synthetic_assets, synthetic_strategies
+
+
+class Manager:
+    def __init__(self, assets, strategies):
+        self._assets = assets
+        self.strategies = strategies
+        self.option_chains = {}
+        self._reconciler = {}
+
+
+def test_deep_size_counts_shared_objects_once():
+    shared = np.zeros(1000)
+    seen = set()
+    assert deep_size([shared], seen) > shared.nbytes
+    assert deep_size((shared,), seen) < shared.nbytes
+    assert deep_size(lambda: shared) < shared.nbytes
+
+
+def test_footprint():
+    assets = synthetic_assets(2, 1)
+    strategies = {s.strategy_id: s for s in synthetic_strategies(assets)}
+    report = footprint(Manager(assets, strategies))
+    spy = report["assets"]["SPY"]
+    assert spy["price_history"] > 252 * 50
+    assert spy["measures"] < 100
+    assert len(report["strategies"]) == 2
+    assert report["total"] >= sum(a["total"] for a in report["assets"].values())
+
+
+def test_allocation_growth():
+    tracker = AllocationTracker()
+    assert tracker.check() == []
+    tracker.start()
+    try:
+        leak = [bytearray(1000) for _ in range(100)]
+        growth = tracker.check()
+        assert growth and growth[0].size_diff >= 100 * 1000
+        assert "test_memory.py" in growth[0].location
+    finally:
+        tracker.stop()
+    assert not tracker.tracking
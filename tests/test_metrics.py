@@ -0,0 +1,56 @@
+import json
+import time
+import pytest
+from optopus.metrics import LatencyHistogram, LoopMetrics
+from optopus.scheduler import LoopScheduler, Stage, PASS
+
+
+def test_bucket_bounds_are_contiguous():
+    previous = -1
+    for index in range(2000):
+        value = LatencyHistogram._value(index)
+        assert value > previous
+        assert LatencyHistogram._index(value) == index
+        assert LatencyHistogram._index(previous + 1) == index
+        previous = value
+
+
+def test_quantiles():
+    h = LatencyHistogram()
+    for ms in range(1, 1001):
+        h.record(ms / 1000)
+    assert h.count == 1000
+    assert h.quantile(0.5) == pytest.approx(0.5, rel=0.02)
+    assert h.quantile(0.99) == pytest.approx(0.99, rel=0.02)
+    assert h.quantile(1) == pytest.approx(1.0)
+    assert h.snapshot()["mean"] == pytest.approx(0.5005)
+
+
+def test_empty_histogram():
+    assert LatencyHistogram().snapshot()["count"] == 0
+
+
+def test_export(tmp_path):
+    m = LoopMetrics()
+    with m.timer("quotes"):
+        pass
+    m.record("compute", 0.25)
+    m.export(tmp_path)
+    snapshot = json.loads((tmp_path / "metrics.json").read_text())
+    assert snapshot["compute"]["p99"] == pytest.approx(0.25, rel=0.02)
+    assert snapshot["quotes"]["count"] == 1
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert 'optopus_stage_seconds{stage="compute",quantile="0.5"} 0.25' in prom
+    assert 'optopus_stage_seconds_count{stage="quotes"} 1' in prom
+
+
+def test_scheduler_records_stages_and_pass_overruns(caplog):
+    s = LoopScheduler(pass_budget=0.01)
+    s.add(Stage("quotes", lambda: time.sleep(0.02), cadence=1))
+    s.run_pending(0)
+    s.run_pending(0.5)
+    snapshot = s.metrics.snapshot()
+    assert snapshot["quotes"]["count"] == 1
+    assert snapshot[PASS]["count"] == 1
+    assert s.pass_overruns == 1
+    assert "Loop pass overran" in caplog.text
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from optopus.backtest import Panels, CreditSpreadParameters
+from optopus.optimizer import (RESULT_FIELDS, Split, grid, random_search, walk_forward_splits, sweep,
+                               walk_forward, evaluate)
+
+
+@pytest.fixture
+def panels():
+    rng = np.random.default_rng(0)
+    n_dates, n_assets = 120, 4
+    returns = rng.normal(0, 0.02, (n_dates, n_assets))
+    returns[rng.random((n_dates, n_assets)) < 0.05] -= 0.12
+    close = 100 * np.exp(np.cumsum(returns, axis=0))
+    iv = np.full((n_dates, n_assets), 0.5)
+    dates = np.datetime64("2018-09-03") + np.arange(n_dates)
+    return Panels(dates, ["SPY", "XLE", "QQQ", "IWM"], close,
+                  np.full(close.shape, 1e6), iv, iv)
+
+
+@pytest.fixture
+def base():
+    return CreditSpreadParameters(minimum_iv_percentile=-1.0, minimum_reward=0.1,
+                                  minimum_ROI=0.1, DTE=5)
+
+
+def test_grid(base):
+    configs = grid(base, profit_factor=[0.3, 0.5], DTE=[5, 10, 15])
+    assert len(configs) == 6
+    assert configs[-1].profit_factor == 0.5 and configs[-1].DTE == 15
+    assert configs[0].minimum_ROI == base.minimum_ROI
+
+
+def test_random_search():
+    configs = random_search(5, seed=1, profit_factor=(0.3, 0.7), DTE=(30, 45), strike_step=[1.0, 2.5])
+    assert configs == random_search(5, seed=1, profit_factor=(0.3, 0.7), DTE=(30, 45),
+                                    strike_step=[1.0, 2.5])
+    assert all(0.3 <= c.profit_factor <= 0.7 and isinstance(c.DTE, int) for c in configs)
+
+
+def test_walk_forward_splits():
+    assert walk_forward_splits(100, 40, 20, start=10) == [Split(10, 50, 70), Split(30, 70, 90)]
+
+
+def test_sweep(panels, base, tmp_path):
+    configs = grid(base, profit_factor=[0.3, 0.7])
+    splits = walk_forward_splits(len(panels.dates), 40, 20, start=10)
+    results_file = tmp_path / "results.csv"
+    results = sweep(panels, configs, splits, workers=2, results_file=results_file)
+    assert len(results) == len(configs) * len(splits)
+    assert not results["stopped"].any()
+    assert len(pd.read_csv(results_file)) == len(results)
+    # Workers see the same panels as a direct evaluation
+    split = splits[0]
+    direct = evaluate(panels, configs[1], split.train_start, split.train_end)
+    row = results[(results.config == 1) & (results.fold == 0)].iloc[0]
+    assert row.train_pnl == pytest.approx(direct["pnl"])
+
+
+def test_sweep_early_stopping(panels, base, tmp_path):
+    splits = walk_forward_splits(len(panels.dates), 40, 20, start=10)
+    results_file = tmp_path / "results.csv"
+    results = sweep(panels, [base], splits, workers=1, stop_below=float("inf"), results_file=results_file)
+    assert len(results) == 1
+    assert results["stopped"].iloc[0]
+    assert tuple(pd.read_csv(results_file).columns) == RESULT_FIELDS == tuple(results.columns)
+
+
+def test_walk_forward():
+    results = pd.DataFrame({"fold": [0, 0, 1, 1], "config": [0, 1, 0, 1],
+                            "train_pnl": [1.0, 2.0, 3.0, 1.0], "test_pnl": [5.0, 6.0, 7.0, 8.0],
+                            "test_trades": [1, 1, 1, 1]})
+    best = walk_forward(results)
+    assert best["config"].tolist() == [1, 0]
+    assert best["test_pnl"].tolist() == [6.0, 7.0]
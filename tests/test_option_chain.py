@@ -0,0 +1,141 @@
+import dataclasses
+import datetime
+import numpy as np
+import pytest
+from optopus.asset import AssetId
+from optopus.common import AssetType, Currency
+from optopus.option import OptionId, Option, RightType
+from optopus.columnar_chain import OptionChain
+from optopus.option_chain import LazyOptionChain, OptionDefinition
+
+
+def make_option(strike, right):
+    id = AssetId("SPY", AssetType.Stock, Currency.USDollar, None)
+    opt_id = OptionId(
+        underlying_id=id,
+        asset_type=AssetType.Option,
+        expiration=datetime.date(2018, 9, 21),
+        strike=strike,
+        right=right,
+        multiplier=100,
+        contract=None,
+    )
+    return Option(id=opt_id, high=None, low=None, close=None, bid=1.0, bid_size=1,
+                  ask=1.2, ask_size=1, last=None, last_size=None, option_price=None,
+                  volume=10, delta=None, gamma=None, theta=None, vega=None, iv=None,
+                  underlying_price=None, underlying_dividends=None, time=None)
+
+
+class Fetcher:
+    def __init__(self):
+        self.requested = []
+
+    def __call__(self, contracts):
+        self.requested.append(contracts)
+        return {f"{strike}{right.value}": make_option(strike, right)
+                for strike, right in contracts}
+
+
+@pytest.fixture
+def fetcher():
+    return Fetcher()
+
+
+@pytest.fixture
+def chain(fetcher):
+    definitions = {}
+    for right in (RightType.Put, RightType.Call):
+        for strike in (95.0, 100.0, 105.0):
+            definitions[f"{strike}{right.value}"] = OptionDefinition(strike, right, (strike, right))
+    return LazyOptionChain(definitions, fetcher)
+
+
+def test_LazyOptionChain_no_quotes_until_accessed(chain, fetcher):
+    assert len(chain) == 6
+    assert "100.0P" in chain
+    assert fetcher.requested == []
+
+
+def test_LazyOptionChain_getitem_fetches_once(chain, fetcher):
+    assert chain["100.0P"].id.strike == 100.0
+    assert chain["100.0P"].id.strike == 100.0
+    assert fetcher.requested == [[(100.0, RightType.Put)]]
+
+
+def test_LazyOptionChain_values_in_one_batch(chain, fetcher):
+    assert len(chain.values()) == 6
+    chain.values()
+    assert len(fetcher.requested) == 1
+
+
+def test_LazyOptionChain_refetch_when_stale(fetcher):
+    definitions = {"100.0P": OptionDefinition(100.0, RightType.Put, (100.0, RightType.Put))}
+    chain = LazyOptionChain(definitions, fetcher, freshness=-1)
+    chain["100.0P"]
+    chain["100.0P"]
+    assert len(fetcher.requested) == 2
+
+
+def test_LazyOptionChain_select(chain, fetcher):
+    puts = chain.select(RightType.Put, max_strike=100.0)
+    assert [o.id.strike for o in puts] == [95.0, 100.0]
+    assert len(fetcher.requested[0]) == 2
+
+
+def test_LazyOptionChain_nearest(chain):
+    calls = chain.nearest(104.0, RightType.Call, 2)
+    assert [o.id.strike for o in calls] == [100.0, 105.0]
+
+
+def test_LazyOptionChain_missing_key(chain):
+    with pytest.raises(KeyError):
+        chain["110.0P"]
+
+
+def test_LazyOptionChain_option_without_ticker():
+    definitions = {"100.0P": OptionDefinition(100.0, RightType.Put, (100.0, RightType.Put))}
+    chain = LazyOptionChain(definitions, lambda contracts: {})
+    assert "100.0P" in chain
+    assert chain["100.0P"] is None and chain.get("100.0P") is None
+    assert chain.values() == []
+
+
+@pytest.fixture
+def columnar():
+    options = [make_option(strike, right) for right in (RightType.Call, RightType.Put)
+               for strike in (105.0, 95.0, 100.0)]
+    options = [dataclasses.replace(o, delta=(0.5 if o.id.right == RightType.Call else -0.5) * 100 / o.id.strike)
+               for o in options]
+    return OptionChain.from_options(options)
+
+
+def test_OptionChain_sorted_columns(columnar):
+    assert columnar.right.tolist() == ["C", "C", "C", "P", "P", "P"]
+    assert columnar.strike.tolist() == [95.0, 100.0, 105.0] * 2
+    assert np.allclose(columnar.midpoint, 1.1)
+
+
+def test_OptionChain_find(columnar):
+    row = columnar.find(datetime.date(2018, 9, 21), 100.0, RightType.Put)
+    assert (row.strike, row.right, row.bid, row.delta) == (100.0, RightType.Put, 1.0, -0.5)
+    assert row.to_option().id == make_option(100.0, RightType.Put).id
+    with pytest.raises(KeyError):
+        columnar.find(datetime.date(2018, 9, 21), 101.0, RightType.Put)
+
+
+def test_OptionChain_queries(columnar):
+    puts = columnar.select(RightType.Put, max_strike=100.0)
+    assert puts.strike.tolist() == [95.0, 100.0]
+    assert columnar.nearest_strike(104.0, RightType.Call, count=2).strike.tolist() == [100.0, 105.0]
+    assert columnar.nearest_delta(-0.45, RightType.Put).strike.tolist() == [105.0]
+
+
+def test_OptionRow_slots(columnar):
+    with pytest.raises(AttributeError):
+        columnar[0].foo = 1
+
+
+def test_LazyOptionChain_chain(chain, fetcher):
+    columns = chain.chain(RightType.Put, max_strike=100.0)
+    assert columns.strike.tolist() == [95.0, 100.0]
+    assert len(fetcher.requested[0]) == 2
@@ -0,0 +1,28 @@
+import pytest
+from optopus.ib_adapter import IBBrokerAdapter
+from optopus.optopus import Optopus
+from optopus.settings import STRATEGY_OPTIONS_CADENCE
+from optopus.simulated_broker import SimulatedIB
+
+
+@pytest.fixture
+def system(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ib = SimulatedIB(loop_iterations=2 * STRATEGY_OPTIONS_CADENCE + 1, seed=1)
+    opt = Optopus(IBBrokerAdapter(ib, "", 0, 0))
+    opt.start()
+    yield ib, opt
+    opt.stop()
+
+
+def test_loop_moves_the_simulated_time(system):
+    ib, opt = system
+    start = ib._now
+    opt.loop()
+    assert (ib._now - start).total_seconds() == 2 * STRATEGY_OPTIONS_CADENCE + 1
+    stats = opt.loop_stats()
+    assert stats["quotes"].runs > 1
+    # The cached quotes don't run the computations again
+    assert stats["compute"].runs < stats["quotes"].runs
+    assert stats["strategy_options"].runs == stats["positions"].runs == 3
+    assert not any(s.errors for s in stats.values())
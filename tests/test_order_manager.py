@@ -0,0 +1,137 @@
+import datetime
+import pytest
+from ib_insync.contract import Option as IBOption
+from optopus.common import AssetDefinition, AssetType, OwnershipType
+from optopus.data_objects import OrderStatus, Trade
+from optopus.ib_adapter import IBBrokerAdapter
+from optopus.order_book import OrderState, STOP_LOSS, TAKE_PROFIT
+from optopus.order_manager import OrderManager, stop_loss_price
+from optopus.risk import RiskEngine
+from optopus.short_put_vertical_spread import ShortPutVerticalSpread
+from optopus.strategy import DefinedStrategy, Strategy
+from optopus.simulated_broker import SimulatedIB
+
+
+class Strategies:
+    def __init__(self):
+        self.added = []
+        self.updated = []
+
+    def add_strategy(self, strategy):
+        self.added.append(strategy)
+
+    def update_strategy(self, strategy):
+        self.updated.append(strategy)
+
+
+@pytest.fixture
+def ib():
+    return SimulatedIB(prices={"SPY": 100.0}, volatility=0.0, seed=1,
+                       start=datetime.datetime(2018, 9, 4, 10))
+
+
+@pytest.fixture
+def broker(ib):
+    return IBBrokerAdapter(ib, "", 0, 0)
+
+
+@pytest.fixture
+def risk():
+    r = RiskEngine()
+    r.update_account("net_liquidation", 100000.0)
+    r.update_account("cash", 100000.0)
+    r.update_account("excess_liquidity", 100000.0)
+    return r
+
+
+@pytest.fixture
+def manager(broker, risk):
+    m = OrderManager(broker, Strategies(), risk)
+    broker.emit_order_status = m.order_status_changed
+    return m
+
+
+@pytest.fixture
+def spread(ib, broker):
+    da = broker._data_adapter
+    assets = da.create_assets((AssetDefinition("SPY", AssetType.ETF),))
+    contracts = ib.qualifyContracts(IBOption("SPY", "20181019", 95, "P", "SMART"),
+                                    IBOption("SPY", "20181019", 100, "P", "SMART"))
+    buy_put, sell_put = [da._create_option(assets["SPY"].id, t) for t in ib.reqTickers(*contracts)]
+    return ShortPutVerticalSpread(buy_put, sell_put, profit_factor=0.4)
+
+
+def test_new_strategy_submits_a_bracket(ib, manager, spread):
+    records = manager.new_strategy(spread)
+    assert [r.state for r in records] == [OrderState.Submitted] * 3
+    trades = ib.trades()
+    assert [t.order.orderType for t in trades] == ["LMT", "LMT", "STP"]
+    parent, take_profit, stop_loss = trades
+    assert parent.contract.secType == "BAG"
+    assert [l.action for l in parent.contract.comboLegs] == ["BUY", "SELL"]
+    assert take_profit.contract is parent.contract
+    assert [t.order.transmit for t in trades] == [False, False, True]
+    assert take_profit.order.parentId == stop_loss.order.parentId == parent.order.orderId
+    assert parent.order.action == "BUY" and take_profit.order.action == "SELL"
+    assert stop_loss.order.auxPrice == pytest.approx(spread.entry_price * 2)
+    assert manager.orders.get(spread.strategy_id + "_TP").role == TAKE_PROFIT
+    assert manager.orders.get(spread.strategy_id + "_SL").role == STOP_LOSS
+
+
+def test_acknowledgements_and_fills_are_tracked(ib, manager, spread):
+    manager.new_strategy(spread)
+    ib.sleep(5)
+    parent, take_profit, _ = manager.orders.strategy_orders(spread.strategy_id)
+    assert parent.state == OrderState.Filled and parent.acknowledged and parent.completed
+    assert take_profit.state == OrderState.Working
+    assert len(manager.orders.open_orders()) == 2
+    assert [t.order.ocaGroup for t in ib.trades()] == ["", spread.strategy_id, spread.strategy_id]
+
+
+def test_late_events_are_ignored(manager, spread):
+    manager.new_strategy(spread)
+    ref = spread.strategy_id
+    assert manager.orders.update(Trade(ref, OrderStatus.Filled, 1, None)).state == OrderState.Working
+    assert manager.orders.update(Trade(ref, OrderStatus.Filled, 0, 1.5)).state == OrderState.Filled
+    assert manager.orders.update(Trade(ref, OrderStatus.Submitted, 0, None)) is None
+    assert manager.orders.get(ref).commission == 1.5
+    assert manager.orders.update(Trade("unknown", OrderStatus.Filled, 0, None)) is None
+
+
+def test_rejected_strategy_is_not_submitted(ib, broker, spread):
+    m = OrderManager(broker, Strategies(), RiskEngine())
+    assert m.new_strategy(spread) == []
+    assert ib.trades() == [] and m.orders.orders() == {}
+
+
+def test_submitted_strategy_counts_in_the_exposure(manager, risk, spread):
+    manager.new_strategy(spread)
+    assert manager._data_manager.added == [spread]
+    assert risk.exposure("SPY") == pytest.approx(spread.maximum_loss)
+
+
+def test_failed_placement_leaves_nothing_behind(monkeypatch, manager, risk, spread):
+    def open_strategy(strategy, bracket):
+        raise ConnectionError("Not connected")
+    monkeypatch.setattr(manager._broker, "open_strategy", open_strategy)
+    with pytest.raises(ConnectionError):
+        manager.new_strategy(spread)
+    assert manager._data_manager.added == [] and risk.exposure("SPY") == 0.0
+    assert manager.orders.orders() == {} and manager.orders.strategy_orders(spread.strategy_id) == []
+
+
+def test_combo_legs_follow_the_legs_ownership(broker, spread):
+    buy, sell = spread.strategy.legs
+    reversed_spread = DefinedStrategy(Strategy((sell, buy), spread.strategy.strategy_type,
+                                               spread.strategy.ownership))
+    legs = broker._combo_contract(reversed_spread).comboLegs
+    assert [(l.conId, l.action) for l in legs] == [(sell.option.id.contract.conId, "SELL"),
+                                                   (buy.option.id.contract.conId, "BUY")]
+
+
+def test_stop_loss_price_is_on_the_losing_side():
+    assert stop_loss_price(-0.4, OwnershipType.Buyer) == -0.8
+    assert stop_loss_price(1.0, OwnershipType.Buyer) == 0.0
+    assert stop_loss_price(1.0, OwnershipType.Seller) == 2.0
+    assert stop_loss_price(-0.4, OwnershipType.Seller) == 0.0
+    assert stop_loss_price(1.0, OwnershipType.Buyer, factor=1.5) == 0.5
@@ -0,0 +1,47 @@
+import time
+import pytest
+from optopus.profiler import LoopProfiler
+
+
+def work():
+    end = time.perf_counter() + 0.02
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    return LoopProfiler(path=tmp_path / "profiles", flag_file=tmp_path / "profile", iterations=2,
+                        sample_interval=0.001)
+
+
+def run_pass(profiler):
+    profiler.start_pass()
+    work()
+    profiler.end_pass()
+
+
+def test_idle_profiler_does_nothing(profiler, tmp_path):
+    run_pass(profiler)
+    assert not profiler.active
+    assert not (tmp_path / "profiles").exists()
+
+
+def test_profiles_requested_passes(profiler, tmp_path):
+    profiler.request()
+    run_pass(profiler)
+    assert profiler.active
+    run_pass(profiler)
+    assert not profiler.active
+    files = sorted(p.suffix for p in (tmp_path / "profiles").iterdir())
+    assert files == [".folded", ".prof", ".txt"]
+    folded = next((tmp_path / "profiles").glob("*.folded")).read_text()
+    assert "test_profiler.py:work" in folded
+    assert "work" in next((tmp_path / "profiles").glob("*.txt")).read_text()
+
+
+def test_flag_file(profiler, tmp_path):
+    (tmp_path / "profile").write_text("3")
+    profiler.check_flag()
+    assert profiler.requested == 3
+    assert not (tmp_path / "profile").exists()
@@ -0,0 +1,68 @@
+import datetime
+import pytest
+from optopus.asset import AssetId, AssetType
+from optopus.common import Currency, OwnershipType
+from optopus.data_objects import PositionData
+from optopus.option import OptionId, Option, RightType
+from optopus.reconciler import PositionReconciler
+from optopus.short_put_vertical_spread import ShortPutVerticalSpread
+
+EXPIRATION = datetime.date(2018, 10, 19)
+
+
+def put(strike):
+    id = AssetId("SPY", AssetType.ETF, Currency.USDollar, None)
+    opt_id = OptionId(id, AssetType.Option, EXPIRATION, strike, RightType.Put, 100, None)
+    return Option(opt_id, *[None] * 18, datetime.datetime.now())
+
+
+def position(strike, quantity, ownership):
+    return PositionData(code="SPY", asset_type=AssetType.Option, expiration=EXPIRATION,
+                        ownership=ownership if quantity else None, quantity=quantity,
+                        strike=strike, right=RightType.Put, average_cost=1.0)
+
+
+@pytest.fixture
+def reconciler():
+    r = PositionReconciler()
+    r.add_strategy("a", ShortPutVerticalSpread(put(95.0), put(100.0)))
+    r.add_strategy("b", ShortPutVerticalSpread(put(90.0), put(100.0)))
+    r.add_strategy("c", ShortPutVerticalSpread(put(80.0), put(85.0)))
+    return r
+
+
+def test_position_event_touches_holders_only(reconciler):
+    assert reconciler.update_position(position(95.0, 1, OwnershipType.Buyer)) == {"a"}
+    assert reconciler.update_position(position(100.0, 1, OwnershipType.Seller)) == {"a"}
+    assert reconciler.allocated("a") == reconciler.required("a") == 2
+    # The shared short put goes to the strategies in order
+    assert reconciler.update_position(position(100.0, 2, OwnershipType.Seller)) == {"b"}
+    assert reconciler.allocated("b") == 1
+
+
+def test_unchanged_position_is_ignored(reconciler):
+    reconciler.update_position(position(95.0, 1, OwnershipType.Buyer))
+    assert reconciler.update_position(position(95.0, 1, OwnershipType.Buyer)) == set()
+
+
+def test_closed_position(reconciler):
+    reconciler.update_position(position(95.0, 1, OwnershipType.Buyer))
+    assert reconciler.update_position(position(95.0, 0, None)) == {"a"}
+    assert reconciler.allocated("a") == 0
+    assert reconciler.positions == {}
+
+
+def test_remove_strategy_frees_positions(reconciler):
+    reconciler.update_position(position(100.0, 1, OwnershipType.Seller))
+    assert reconciler.remove_strategy("a") == {"b"}
+    assert reconciler.allocated("b") == 1
+
+
+def test_load_snapshot(reconciler):
+    reconciler.update_position(position(95.0, 1, OwnershipType.Buyer))
+    p = position(85.0, 1, OwnershipType.Seller)
+    assert reconciler.load({p.position_id: p}) == {"a", "c"}
+    assert reconciler.excess() == {}
+    extra = position(70.0, 3, OwnershipType.Seller)
+    assert reconciler.load({p.position_id: p, extra.position_id: extra}) == set()
+    assert reconciler.excess() == {extra.position_id: 3}
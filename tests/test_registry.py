@@ -0,0 +1,46 @@
+import datetime
+import gc
+import pickle
+from ib_insync.contract import Option as IBOption, Stock as IBStock
+from optopus.asset import AssetId
+from optopus.common import AssetType, Currency
+from optopus.option import OptionId, RightType
+from optopus.registry import IdRegistry
+
+
+def option_id(registry=None, conId=10):
+    underlying = AssetId("SPY", AssetType.ETF, Currency.USDollar, IBStock("SPY", "SMART", "USD", conId=1))
+    contract = IBOption("SPY", "20181019", 95.0, "P", "SMART", conId=conId) if conId else None
+    return OptionId(underlying, AssetType.Option, datetime.date(2018, 10, 19), 95.0, RightType.Put,
+                    100, contract)
+
+
+def test_option_ids_are_interned():
+    registry = IdRegistry()
+    a = registry.option_id(option_id())
+    b = registry.option_id(option_id())
+    assert a is b
+    assert registry.cached_option_id(10) is a
+    # The underlying id and the contracts are canonical too
+    assert a.underlying_id is registry.asset_id(option_id().underlying_id)
+    assert registry.contract(IBOption(conId=10)) is a.contract
+
+
+def test_ids_without_contract_are_interned_by_terms():
+    registry = IdRegistry()
+    assert registry.option_id(option_id(conId=0)) is registry.option_id(option_id(conId=0))
+
+
+def test_unreferenced_ids_are_released():
+    registry = IdRegistry()
+    registry.option_id(option_id())
+    gc.collect()
+    assert registry.stats() == {"contracts": 0, "asset_ids": 0, "option_ids": 0}
+
+
+def test_cached_hash_is_not_pickled():
+    id = option_id()
+    h = hash(id)
+    assert hash(id) == h
+    assert "_hash" not in pickle.loads(pickle.dumps(id)).__dict__
+    assert pickle.loads(pickle.dumps(id)) == id
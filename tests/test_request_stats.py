@@ -0,0 +1,48 @@
+import pytest
+from optopus.request_stats import RequestAccounting
+
+
+@pytest.fixture
+def now():
+    return [600.0]
+
+
+@pytest.fixture
+def requests(now):
+    return RequestAccounting(minutes=2, clock=lambda: now[0])
+
+
+def test_call_is_accounted(requests):
+    assert requests.call("reqTickers", lambda *c: list(c), 1, 2, 3, contracts=3) == [1, 2, 3]
+    requests.call("reqTickers", lambda: [], contracts=2)
+    s = requests.summary()["reqTickers"]
+    assert (s.calls, s.contracts, s.items, s.errors) == (2, 5, 3, 0)
+    assert s.max_latency <= s.latency
+
+
+def test_errors_and_pacing(requests):
+    def fail():
+        raise TimeoutError()
+
+    with pytest.raises(TimeoutError):
+        requests.call("qualifyContracts", fail, contracts=50)
+    waits = []
+    requests.pace("qualifyContracts", waits.append, 1)
+    requests.pacing_violation("qualifyContracts")
+    s = requests.summary()["qualifyContracts"]
+    assert waits == [1]
+    assert (s.calls, s.errors, s.pacing_violations) == (1, 1, 1)
+    assert s.pacing_wait >= 0
+
+
+def test_per_minute_buckets_expire(requests, now):
+    requests.call("positions", lambda: [1])
+    now[0] += 60
+    requests.call("positions", lambda: [1, 2])
+    assert [(r, s.items) for _, r, s in requests.per_minute()] == [("positions", 1), ("positions", 2)]
+    assert requests.summary(minutes=1)["positions"].items == 2
+    now[0] += 60
+    requests.call("positions", lambda: [])
+    assert len(requests.per_minute()) == 2
+    s = requests.summary()["positions"]
+    assert (s.calls, s.items) == (2, 2)
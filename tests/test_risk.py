@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from optopus.common import OwnershipType
+from optopus.data_objects import Account
+from optopus.risk import LIMITS, RiskEngine, candidates, unit_greeks
+
+
+def option(delta=0.0, vega=0.0, strike=100.0):
+    return SimpleNamespace(id=SimpleNamespace(multiplier=100, strike=strike),
+                           delta=delta, gamma=0.0, theta=0.0, vega=vega)
+
+
+def strategy(code="SPY", loss=500.0, delta=0.0, vega=0.0, quantity=1):
+    leg = SimpleNamespace(option=option(delta, vega), ownership=OwnershipType.Buyer, ratio=1, strike=100.0)
+    return SimpleNamespace(code=code, maximum_loss=loss, quantity=quantity, closed=None,
+                           strategy_id=code + " 1", strategy=SimpleNamespace(legs=(leg,)))
+
+
+@pytest.fixture
+def engine():
+    r = RiskEngine(preserved_cash_factor=0.4, maximum_risk_factor=0.05, maximum_underlying_factor=0.2,
+                   greeks_limits={"delta": 500})
+    r.update_account("net_liquidation", 100000.0)
+    r.update_account("cash", 100000.0)
+    r.update_account("excess_liquidity", 3000.0)
+    return r
+
+
+def test_budgets_follow_the_account_events(engine):
+    assert engine.maximum_risk == 5000.0
+    engine.update_account("cash", 42000.0)
+    assert engine.maximum_risk == 2000.0
+    engine.update_account("unknown", 1.0)
+    assert engine.maximum_risk == 2000.0
+
+
+def test_load_account():
+    r = RiskEngine(preserved_cash_factor=0.0, maximum_risk_factor=0.1)
+    account = Account()
+    account.net_liquidation = 10000.0
+    account.cash = 500.0
+    r.load_account(account)
+    assert r.maximum_risk == 500.0
+
+
+def test_batch_check_reports_the_binding_limit(engine):
+    batch = candidates([strategy(loss=500.0), strategy(loss=2000.0), strategy(loss=100.0, delta=0.5)])
+    decision = engine.check(batch)
+    assert decision.max_quantity.tolist() == [6.0, 1.0, 10.0]
+    assert [decision.reason(i) for i in range(3)] == ["margin", "margin", "delta"]
+    assert decision.allowed.all()
+    assert not engine.check(batch, quantity=np.array([7, 1, 10])).allowed[0]
+
+
+def test_underlying_exposure_limit(engine):
+    engine.update_account("excess_liquidity", 100000.0)
+    engine.add_strategy("a", strategy(loss=1000.0, quantity=19))
+    assert engine.exposure("SPY") == 19000.0
+    decision = engine.check_strategies([strategy(loss=1000.0), strategy(code="QQQ", loss=1000.0)])
+    assert decision.max_quantity.tolist() == [1.0, 5.0]
+    assert decision.reason(0) == "underlying_exposure"
+    assert decision.reason(1) == "trade_risk"
+    engine.remove_strategy("a")
+    assert engine.exposure("SPY") == 0.0
+
+
+def test_greeks_limit_allows_hedging(engine):
+    engine.add_strategy("a", strategy(loss=0.0, delta=4.9))
+    assert engine.portfolio_greeks["delta"] == pytest.approx(490.0)
+    decision = engine.check_strategies([strategy(loss=0.0, delta=0.1), strategy(loss=0.0, delta=-0.1)])
+    assert decision.max_quantity[0] == 1.0
+    assert decision.max_quantity[1] == 99.0
+    assert LIMITS[decision.binding[1]] == "delta"
+
+
+def test_size_and_rejection(engine):
+    assert engine.size(strategy(loss=500.0), maximum=2) == 2
+    assert engine.size(strategy(loss=5000.0)) == 0
+    assert engine.size(strategy(loss=0.0)) == 1
+
+
+def test_sync_drops_closed_strategies(engine):
+    s = strategy(delta=0.1)
+    engine.add_strategy("a", s)
+    s.strategy.legs[0].option.delta = 0.2
+    engine.sync({"a": s})
+    assert engine.portfolio_greeks["delta"] == pytest.approx(20.0)
+    engine.sync({})
+    assert engine.portfolio_greeks["delta"] == 0.0
+
+
+def test_unit_greeks_of_a_seller():
+    s = strategy(delta=-0.3)
+    s.strategy.legs[0].ownership = OwnershipType.Seller
+    assert unit_greeks(s)[0] == pytest.approx(30.0)
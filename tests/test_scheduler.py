@@ -0,0 +1,83 @@
+import time
+import pytest
+from optopus.scheduler import LoopScheduler, Stage
+from optopus.tracing import TRACER
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def scheduler(calls):
+    s = LoopScheduler()
+    s.add(Stage("quotes", lambda: calls.append("quotes"), cadence=1))
+    s.add(Stage("positions", lambda: calls.append("positions"), cadence=10))
+    s.add(Stage("compute", lambda: calls.append("compute"), depends=("quotes",)))
+    s.add(Stage("algorithm", lambda: calls.append("algorithm"), depends=("compute", "positions")))
+    return s
+
+
+def test_first_pass_runs_in_dependency_order(scheduler):
+    assert scheduler.run_pending(0) == ["quotes", "positions", "compute", "algorithm"]
+
+
+def test_cadence_and_triggers(scheduler):
+    scheduler.run_pending(0)
+    assert scheduler.run_pending(0.5) == []
+    assert scheduler.run_pending(1) == ["quotes", "compute", "algorithm"]
+    assert scheduler.run_pending(10) == ["quotes", "positions", "compute", "algorithm"]
+    assert scheduler.next_due(10.2) == pytest.approx(0.8)
+
+
+def test_failed_stage_does_not_trigger_dependents(calls):
+    s = LoopScheduler()
+    s.add(Stage("quotes", lambda: 1 / 0, cadence=1))
+    s.add(Stage("compute", lambda: calls.append("compute"), depends=("quotes",)))
+    assert s.run_pending(0) == ["quotes"]
+    assert s.stats()["quotes"].errors == 1
+    assert calls == []
+
+
+def test_overrun(calls):
+    s = LoopScheduler()
+    s.add(Stage("slow", lambda: time.sleep(0.02), cadence=0.01))
+    s.run_pending(0)
+    stats = s.stats()["slow"]
+    assert stats.runs == 1 and stats.overruns == 1
+    assert stats.max_duration >= 0.02
+
+
+def test_concurrent_wave(calls):
+    s = LoopScheduler(workers=2)
+    s.add(Stage("a", lambda: time.sleep(0.05), cadence=1))
+    s.add(Stage("b", lambda: time.sleep(0.05), cadence=1))
+    start = time.perf_counter()
+    s.run_pending(0)
+    assert time.perf_counter() - start < 0.09
+    s.shutdown()
+
+
+def test_unknown_dependency(scheduler):
+    with pytest.raises(ValueError):
+        scheduler.add(Stage("orders", lambda: None, depends=("fills",)))
+
+
+def test_stage_without_new_data_does_not_trigger_dependents(calls):
+    updates = iter([False, False, True])
+    s = LoopScheduler()
+    s.add(Stage("quotes", lambda: next(updates), cadence=1))
+    s.add(Stage("compute", lambda: calls.append("compute"), depends=("quotes",)))
+    # The first run makes the dependents ready anyway
+    assert s.run_pending(0) == ["quotes", "compute"]
+    assert s.run_pending(1) == ["quotes"]
+    assert s.run_pending(2) == ["quotes", "compute"]
+
+
+def test_trace_ends_with_the_pass():
+    s = LoopScheduler()
+    s.add(Stage("quotes", TRACER.start_trace, cadence=1))
+    s.add(Stage("metrics", lambda: None, cadence=1))
+    s.run_pending(0)
+    assert TRACER.active is None
@@ -0,0 +1,110 @@
+import datetime
+import pytest
+from ib_insync.contract import Contract, Option as IBOption, Stock as IBStock
+from ib_insync.objects import ComboLeg
+from ib_insync.order import LimitOrder, StopOrder
+from optopus.simulated_broker import SimulatedIB, NATURAL, black_scholes
+
+
+@pytest.fixture
+def ib():
+    return SimulatedIB(prices={"SPY": 100.0}, volatility=0.0, seed=1,
+                       start=datetime.datetime(2018, 9, 4, 10))
+
+
+@pytest.fixture
+def bag(ib):
+    p95, p100 = ib.qualifyContracts(IBOption("SPY", "20181019", 95, "P", "SMART"),
+                                    IBOption("SPY", "20181019", 100, "P", "SMART"))
+    return Contract(symbol="SPY", secType="BAG", exchange="SMART", currency="USD",
+                    comboLegs=[ComboLeg(conId=p95.conId, ratio=1, action="BUY"),
+                               ComboLeg(conId=p100.conId, ratio=1, action="SELL")])
+
+
+def statuses(ib):
+    events = []
+    ib.orderStatusEvent += lambda t: events.append((t.order.orderRef, t.orderStatus.status))
+    return events
+
+
+def test_SimulatedIB_qualify_contracts(ib):
+    c1, = ib.qualifyContracts(IBStock("SPY", "SMART", "USD"))
+    c2, = ib.qualifyContracts(IBStock("SPY", "SMART", "USD"))
+    assert c1.conId and c1.conId == c2.conId
+
+
+def test_SimulatedIB_option_tickers(ib):
+    put, = ib.qualifyContracts(IBOption("SPY", "20181019", 95, "P", "SMART"))
+    ticker, = ib.reqTickers(put)
+    assert 0 < ticker.bid < ticker.ask
+    assert -1 < ticker.modelGreeks.delta < 0
+    assert ticker.contract.multiplier == "100"
+
+
+def test_SimulatedIB_combo_fill_with_latency(ib, bag):
+    events = statuses(ib)
+    order = LimitOrder("BUY", 2, -1.0, orderRef="s1", orderId=ib.getReqId())
+    ib.placeOrder(bag, order)
+    assert events == []
+    ib.sleep(0.1)
+    assert events == [("s1", "Submitted")]
+    ib.sleep(1)
+    assert events[-1] == ("s1", "Filled")
+    positions = {p.contract.strike: p.position for p in ib.positions()}
+    assert positions == {95: 2, 100: -2}
+
+
+def test_SimulatedIB_limit_not_reached(ib, bag):
+    events = statuses(ib)
+    ib.placeOrder(bag, LimitOrder("BUY", 1, -3.0, orderRef="s1", orderId=ib.getReqId()))
+    ib.sleep(5)
+    assert events == [("s1", "Submitted")]
+    assert ib.positions() == []
+
+
+def test_SimulatedIB_natural_price_and_slippage(bag):
+    ib = SimulatedIB(prices={"SPY": 100.0}, volatility=0.0, match=NATURAL, slippage=0.05)
+    ib.qualifyContracts(*[IBOption("SPY", "20181019", s, "P", "SMART") for s in (95, 100)])
+    mid, buy, sell = ib.combo_price(bag)
+    assert sell < mid < buy
+    ib.placeOrder(bag, LimitOrder("BUY", 1, mid, orderRef="s1", orderId=ib.getReqId()))
+    ib.sleep(1)
+    assert ib.positions() == []
+
+
+def test_SimulatedIB_child_order_waits_for_parent(ib, bag):
+    events = statuses(ib)
+    parent = LimitOrder("BUY", 1, -1.0, orderRef="s1", orderId=ib.getReqId())
+    child = LimitOrder("SELL", 1, -3.0, orderRef="s1_TP", orderId=ib.getReqId(),
+                       parentId=parent.orderId)
+    ib.placeOrder(bag, parent)
+    ib.placeOrder(bag, child)
+    ib.sleep(1)
+    assert ("s1", "Filled") in events
+    assert events[-1] == ("s1_TP", "Filled")
+    assert ib.positions() == []
+
+
+def test_SimulatedIB_stop_order_triggers_and_cancels_its_oca_group(ib, bag):
+    events = statuses(ib)
+    mid = ib.combo_price(bag)[0]
+    parent = LimitOrder("BUY", 1, -1.0, orderRef="s1", orderId=ib.getReqId())
+    take_profit = LimitOrder("SELL", 1, mid + 1.0, orderRef="s1_TP", orderId=ib.getReqId(),
+                             parentId=parent.orderId, ocaGroup="s1", ocaType=1)
+    far_stop = StopOrder("SELL", 1, mid - 1.0, orderRef="s1_FAR", orderId=ib.getReqId(),
+                         parentId=parent.orderId)
+    stop = StopOrder("SELL", 1, mid + 0.5, orderRef="s1_SL", orderId=ib.getReqId(),
+                     parentId=parent.orderId, ocaGroup="s1", ocaType=1)
+    for order in (parent, take_profit, far_stop, stop):
+        ib.placeOrder(bag, order)
+    ib.sleep(2)
+    assert ("s1_SL", "Filled") in events
+    assert ("s1_TP", "Cancelled") in events
+    assert ("s1_TP", "Filled") not in events and ("s1_FAR", "Filled") not in events
+    assert [t.order.orderRef for t in ib.openTrades()] == ["s1_FAR"]
+
+
+def test_black_scholes_put_call_parity():
+    call = black_scholes(100.0, 95.0, 0.5, 0.25, "C")[0]
+    put = black_scholes(100.0, 95.0, 0.5, 0.25, "P")[0]
+    assert call - put == pytest.approx(100.0 - 95.0)
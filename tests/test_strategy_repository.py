@@ -0,0 +1,68 @@
+import datetime
+import pytest
+from ib_insync.contract import Option as IBOption
+from optopus.asset import AssetId, AssetType
+from optopus.common import Currency, OwnershipType
+from optopus.option import OptionId, Option, RightType
+from optopus.short_put_vertical_spread import ShortPutVerticalSpread
+from optopus.strategy_repository import StrategyRepository, OPENED, CREATED
+
+
+def put(code, strike):
+    id = AssetId(code, AssetType.ETF, Currency.USDollar, None)
+    contract = IBOption(code, "20181019", strike, "P", "SMART", conId=int(strike))
+    opt_id = OptionId(id, AssetType.Option, datetime.date(2018, 10, 19), strike, RightType.Put, 100, contract)
+    return Option(opt_id, high=None, low=None, close=None, bid=1.0, bid_size=10, ask=1.2, ask_size=10,
+                  last=None, last_size=None, option_price=1.1, volume=100, delta=-0.3, gamma=None,
+                  theta=None, vega=None, iv=0.25, underlying_price=101.0, underlying_dividends=None,
+                  time=datetime.datetime(2018, 9, 4, 10))
+
+
+def spread(code, created):
+    s = ShortPutVerticalSpread(put(code, 95.0), put(code, 100.0), profit_factor=0.4)
+    s._created = created
+    return s
+
+
+@pytest.fixture
+def repository(tmp_path):
+    return StrategyRepository(tmp_path)
+
+
+def test_round_trip(repository):
+    s = spread("SPY", datetime.datetime(2018, 9, 4, 10))
+    repository.add(s)
+    loaded = repository.all_items()[s.strategy_id]
+    assert isinstance(loaded, ShortPutVerticalSpread)
+    assert loaded.strategy == s.strategy
+    assert loaded.strategy.legs[0].option.id.contract.conId == 95
+    assert loaded.profit_price == s.profit_price
+    assert loaded.created == s.created and loaded.opened is None
+
+
+def test_find_and_update(repository):
+    spy = spread("SPY", datetime.datetime(2018, 9, 4, 10))
+    xle = spread("XLE", datetime.datetime(2018, 9, 5, 10))
+    repository.save([spy, xle])
+    xle.opened = datetime.datetime(2018, 9, 5, 11)
+    repository.update(xle)
+    assert [s.code for s in repository.find(status=OPENED)] == ["XLE"]
+    assert [s.code for s in repository.find(status=CREATED)] == ["SPY"]
+    assert [s.code for s in repository.find(created_from=datetime.datetime(2018, 9, 5))] == ["XLE"]
+    assert [s.code for s in repository.find(code="SPY")] == ["SPY"]
+
+
+def test_delete_keeps_history(repository, tmp_path):
+    s = spread("SPY", datetime.datetime(2018, 9, 4, 10))
+    repository.add(s)
+    repository.delete(s)
+    assert repository.all_items() == {}
+    repository.close()
+    assert [d.strategy_id for d in StrategyRepository(tmp_path).find(deleted=True)] == [s.strategy_id]
+
+
+def test_import_jsonpickle_files(tmp_path):
+    import jsonpickle
+    s = spread("SPY", datetime.datetime(2018, 9, 4, 10))
+    (tmp_path / (s.strategy_id + ".json")).write_text(jsonpickle.encode(s))
+    assert list(StrategyRepository(tmp_path).all_items()) == [s.strategy_id]
@@ -0,0 +1,73 @@
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from optopus.ticker_cache import TickerCache
+
+
+def contract(conId):
+    return SimpleNamespace(conId=conId)
+
+
+class Requester:
+    def __init__(self, delay=0):
+        self.requested = []
+        self._delay = delay
+
+    def __call__(self, contracts):
+        self.requested.append([c.conId for c in contracts])
+        time.sleep(self._delay)
+        return [SimpleNamespace(contract=c) for c in contracts]
+
+
+def test_TickerCache_hit():
+    requester = Requester()
+    cache = TickerCache(requester, max_staleness=60)
+    cache.tickers([contract(1), contract(2)])
+    tickers = cache.tickers([contract(2), contract(3)])
+    assert [t.contract.conId for t in tickers] == [2, 3]
+    assert requester.requested == [[1, 2], [3]]
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 3
+    assert stats['requests'] == 2
+
+
+def test_TickerCache_max_staleness():
+    requester = Requester()
+    cache = TickerCache(requester, max_staleness=60)
+    cache.tickers([contract(1)])
+    cache.tickers([contract(1)], max_staleness=0)
+    assert requester.requested == [[1], [1]]
+
+
+def test_TickerCache_duplicated_contracts():
+    requester = Requester()
+    cache = TickerCache(requester)
+    cache.tickers([contract(1), contract(1)])
+    assert requester.requested == [[1]]
+
+
+def test_TickerCache_invalidate():
+    requester = Requester()
+    cache = TickerCache(requester, max_staleness=60)
+    cache.tickers([contract(1)])
+    cache.invalidate(1)
+    cache.tickers([contract(1)])
+    assert len(requester.requested) == 2
+
+
+def test_TickerCache_coalesce_concurrent_requests():
+    requester = Requester(delay=0.2)
+    cache = TickerCache(requester, max_staleness=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.tickers([contract(1)])))
+               for _ in range(2)]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+    assert requester.requested == [[1]]
+    assert len(results) == 2 and all(len(r) == 1 for r in results)
+    assert cache.stats()['coalesced'] == 1
@@ -0,0 +1,56 @@
+import json
+import pytest
+from optopus.tracing import Tracer
+
+
+@pytest.fixture
+def tracer():
+    return Tracer(capacity=10)
+
+
+def test_spans_belong_to_the_active_trace(tracer):
+    with tracer.span("untraced"):
+        pass
+    assert tracer.spans() == []
+    with tracer.span("update_assets"):
+        trace_id = tracer.start_trace()
+    with tracer.span("compute"):
+        with tracer.span("to_df"):
+            pass
+    spans = tracer.spans(trace_id)
+    assert [(s.name, s.parent) for s in spans] == [("update_assets", None), ("to_df", "compute"),
+                                                   ("compute", None)]
+
+
+def test_ended_trace_takes_no_more_spans(tracer):
+    trace_id = tracer.start_trace()
+    tracer.end_trace()
+    with tracer.span("metrics"):
+        pass
+    tracer.tag("SPY 04-09-2018 10:00:00")
+    assert tracer.active is None and tracer.spans(trace_id) == []
+    assert tracer.tagged("SPY 04-09-2018 10:00:00") is None
+
+
+def test_tagged_order_ack(tracer):
+    trace_id = tracer.start_trace()
+    tracer.tag("SPY 04-09-2018 10:00:00")
+    tracer.start_trace()
+    assert tracer.untag("SPY 04-09-2018 10:00:00") == trace_id
+    tracer.mark("order_ack", trace_id)
+    assert tracer.untag("SPY 04-09-2018 10:00:00") is None
+    ack = tracer.spans(trace_id)[0]
+    assert ack.name == "order_ack" and ack.duration >= 0
+
+
+def test_ring_buffer_and_export(tracer, tmp_path):
+    trace_id = tracer.start_trace()
+    for i in range(15):
+        tracer.record(trace_id, f"s{i}", 0.0, 0.001)
+    assert [s.name for s in tracer.spans()][0] == "s5"
+    file_name = tmp_path / "spans.jsonl"
+    assert tracer.export(file_name) == 10
+    tracer.record(trace_id, "s15", 0.0, 0.001)
+    assert tracer.export(file_name) == 1
+    lines = [json.loads(line) for line in file_name.read_text().splitlines()]
+    assert [l["name"] for l in lines][-2:] == ["s14", "s15"]
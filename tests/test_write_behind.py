@@ -0,0 +1,105 @@
+import datetime
+import time
+import pytest
+from optopus.asset import AssetId, AssetType
+from optopus.common import Currency
+from optopus.option import OptionId, Option, RightType
+from optopus.short_put_vertical_spread import ShortPutVerticalSpread
+from optopus.strategy_repository import StrategyRepository, CREATED, OPENED
+from optopus.write_behind import WriteBehindRepository
+
+
+def put(strike):
+    id = AssetId("SPY", AssetType.ETF, Currency.USDollar, None)
+    opt_id = OptionId(id, AssetType.Option, datetime.date(2018, 10, 19), strike, RightType.Put, 100, None)
+    return Option(opt_id, *[1.0] * 18, datetime.datetime(2018, 9, 4, 10))
+
+
+@pytest.fixture
+def strategy():
+    return ShortPutVerticalSpread(put(95.0), put(100.0))
+
+
+@pytest.fixture
+def repository(tmp_path):
+    return StrategyRepository(tmp_path)
+
+
+def test_updates_are_coalesced(repository, strategy):
+    wb = WriteBehindRepository(repository, window=10)
+    wb.add(strategy)
+    strategy.opened = strategy.created + datetime.timedelta(seconds=1)
+    wb.update(strategy)
+    wb.update(strategy)
+    assert wb.find(status=OPENED)[0].strategy_id == strategy.strategy_id
+    assert wb.stats() == {"pending": 0, "writes": 1, "coalesced": 2, "failures": 0}
+    wb.close()
+
+
+def test_strategy_is_written_as_it_was_queued(repository, strategy):
+    wb = WriteBehindRepository(repository, window=10)
+    wb.update(strategy)
+    strategy.opened = strategy.created + datetime.timedelta(seconds=1)
+    assert wb.find(status=OPENED) == []
+    assert wb.find(status=CREATED)[0].opened is None
+    wb.close()
+
+
+def test_slow_disk_does_not_block(repository, strategy, monkeypatch):
+    write = repository.write_rows
+    monkeypatch.setattr(repository, "write_rows", lambda *args: time.sleep(0.2) or write(*args))
+    wb = WriteBehindRepository(repository, window=0)
+    start = time.perf_counter()
+    wb.update(strategy)
+    wb.update(strategy)
+    assert time.perf_counter() - start < 0.1
+    wb.flush()
+    assert list(wb.all_items()) == [strategy.strategy_id]
+    wb.close()
+
+
+def test_close_drains_queue(tmp_path, repository, strategy):
+    wb = WriteBehindRepository(repository, window=10)
+    wb.update(strategy)
+    wb.delete(strategy)
+    wb.close()
+    assert [s.strategy_id for s in StrategyRepository(tmp_path).find(deleted=True)] == [strategy.strategy_id]
+    with pytest.raises(RuntimeError):
+        wb.update(strategy)
+
+
+def test_failed_write_is_retried(repository, strategy, monkeypatch):
+    write = repository.write_rows
+    calls = []
+    monkeypatch.setattr(repository, "write_rows",
+                        lambda *args: write(*args) if calls.append(1) or len(calls) > 1 else 1 / 0)
+    wb = WriteBehindRepository(repository, window=10)
+    wb.update(strategy)
+    with pytest.raises(RuntimeError):
+        wb.flush()
+    wb.flush()
+    assert wb.stats()["failures"] == 1
+    assert list(wb.all_items()) == [strategy.strategy_id]
+    wb.close()
+
+
+def test_delete_survives_a_failed_write(repository, strategy, monkeypatch):
+    write = repository.write_rows
+    calls = []
+
+    def failing_write(*args):
+        calls.append(1)
+        if len(calls) == 1:
+            # A newer update is queued while the delete is being written
+            wb.update(strategy)
+            raise OSError("disk full")
+        write(*args)
+    monkeypatch.setattr(repository, "write_rows", failing_write)
+    wb = WriteBehindRepository(repository, window=10)
+    wb.delete(strategy)
+    with pytest.raises(RuntimeError):
+        wb.flush()
+    wb.flush()
+    assert wb.find() == []
+    assert [s.strategy_id for s in wb.find(deleted=True)] == [strategy.strategy_id]
+    wb.close()